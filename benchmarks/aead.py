@@ -0,0 +1,44 @@
+"""
+    Measures encryption throughput of small chat messages for every cipher
+    suite, per call and through encrypt_many / decrypt_many.
+
+    Usage: python benchmarks/aead.py [messages]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+from crypto.encryption import SymmetricEncryption, CIPHER_SUITES, message_associated_data
+
+
+def rate(function, count: int) -> float:
+    """Returns processed messages per second."""
+    start = time.perf_counter()
+    function()
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    key = os.urandom(32)
+    texts = [f"message number {i}, see you at {i % 24}:00" for i in range(count)]
+    ads = [message_associated_data(b"\x01" * 32, b"\x02" * 32)] * count
+    print(f"{'suite':<18} {'enc msg/s':>10} {'dec msg/s':>10} {'overhead B':>11}")
+    for suite in CIPHER_SUITES:
+        # New encryptor per message, as the send path and the UI do
+        encrypt = rate(
+            lambda: [SymmetricEncryption.from_suite(key, suite).encrypt(t, a) for t, a in zip(texts, ads)],
+            count,
+        )
+        encryptor = SymmetricEncryption.from_suite(key, suite)
+        ciphertexts = encryptor.encrypt_many(texts, ads)
+        decrypt = rate(lambda: encryptor.decrypt_many(ciphertexts, ads), count)
+        overhead = sum(len(c) - len(t) for c, t in zip(ciphertexts, texts)) / count
+        print(f"{suite:<18} {encrypt:>10.0f} {decrypt:>10.0f} {overhead:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
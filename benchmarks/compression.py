@@ -0,0 +1,86 @@
+"""
+    Measures how much compress-then-encrypt shrinks message transactions
+    on a synthetic but realistic chat corpus.
+
+    Usage: python benchmarks/compression.py
+"""
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+import json5 as json
+from crypto.encryption import SymmetricEncryption, CompressionThreshold
+from blockchain.transaction import Transaction
+
+SHORT = [
+    "hi", "ok", "yes", "no", "lol", "thanks!", "see you", "on my way",
+    "sounds good", "wait a sec", "what time?", "call me later", "good night",
+]
+MEDIUM = [
+    "Hey, are we still meeting at the library at 5pm today?",
+    "I pushed the fix for the login bug, can you review the pull request when you have a moment?",
+    "Don't forget to bring the charger, mine is dead again and I need it for the presentation.",
+    "The meeting was moved to Thursday because half of the team is out sick this week.",
+    "Can you send me the link to the document we were editing yesterday evening?",
+]
+LONG = [
+    "So here is the plan for the weekend: we leave on Friday right after work, "
+    "drive to the lake house, pick up groceries on the way, and on Saturday we go "
+    "hiking if the weather is good. If it rains we stay in, play board games and "
+    "cook dinner together. Sunday morning we clean up and head back before noon so "
+    "that everyone has time to rest before the working week starts again.",
+    "I've been thinking about the architecture discussion we had. I think the "
+    "message queue should be the single source of truth, and every service should "
+    "consume events from it instead of calling each other directly. That way we can "
+    "replay the events when something goes wrong and we don't have to coordinate "
+    "deployments between the services as much as we do now.",
+]
+CODE = [
+    "def handle(request):\n    user = get_user(request)\n    if not user:\n"
+    "        return error(401)\n    return render(user.profile)\n",
+    "SELECT id, name, created_at FROM users WHERE active = 1 ORDER BY created_at DESC LIMIT 50;",
+]
+LINKS = [
+    "https://github.com/tumkas/crypto_messenger_aip/issues/new?labels=bug&template=bug-report---.md",
+    "check this out https://example.com/articles/2024/05/how-to-write-better-commit-messages",
+]
+
+
+def build_corpus(size: int = 5000, seed: int = 1) -> list:
+    """Samples a chat corpus dominated by short messages."""
+    rng = random.Random(seed)
+    categories = [(SHORT, 55), (MEDIUM, 30), (LONG, 7), (CODE, 3), (LINKS, 5)]
+    population = [messages for messages, weight in categories for _ in range(weight)]
+    return [rng.choice(rng.choice(population)) for _ in range(size)]
+
+
+def transaction_size(encryptor: SymmetricEncryption, text: str) -> int:
+    """Returns the serialized size of a message transaction."""
+    content = encryptor.encrypt(text).hex()
+    transaction = Transaction(b"\x00" * 32, b"\x00" * 32, 0, content, timestamp=0)
+    return len(json.dumps(transaction.to_dict(), ensure_ascii=False).encode())
+
+
+def main():
+    key = os.urandom(32)
+    corpus = build_corpus()
+    plain = SymmetricEncryption(key)
+    compressed = SymmetricEncryption(key, compress=True, threshold=CompressionThreshold())
+
+    plain_content = sum(len(plain.encrypt(text).hex()) for text in corpus)
+    compressed_content = sum(len(compressed.encrypt(text).hex()) for text in corpus)
+    plain_chain = sum(transaction_size(plain, text) for text in corpus)
+    compressed_chain = sum(transaction_size(compressed, text) for text in corpus)
+
+    print(f"Messages: {len(corpus)}, plaintext bytes: {sum(len(t.encode()) for t in corpus)}")
+    print(f"Content bytes:     {plain_content} -> {compressed_content} "
+          f"({100 * (1 - compressed_content / plain_content):.1f}% smaller)")
+    print(f"Transaction bytes: {plain_chain} -> {compressed_chain} "
+          f"({100 * (1 - compressed_chain / plain_chain):.1f}% smaller)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+    Micro-benchmark suite of the crypto package: key generation, key exchange
+    with HKDF, symmetric encryption at several payload sizes, signatures and
+    full Transaction sign + verify.
+
+    Results (median ops/sec and latency percentiles in microseconds) are printed as
+    JSON. With --baseline the run is compared against stored results and the
+    script exits with status 1 if any case got slower than the threshold.
+
+    Usage:
+        python benchmarks/crypto_suite.py [--filter NAME] [--output FILE]
+        python benchmarks/crypto_suite.py --baseline benchmarks/crypto_baseline.json
+        python benchmarks/crypto_suite.py --baseline benchmarks/crypto_baseline.json --update-baseline
+"""
+
+import argparse
+import functools
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+from crypto.diffie_hellman import create_key_exchange
+from crypto.encryption import SymmetricEncryption, CIPHER_SUITES, message_associated_data
+from crypto.signatures import DigitalSignature
+from blockchain.transaction import Transaction
+
+PAYLOAD_SIZES = (64, 1024, 16384)
+DEFAULT_THRESHOLD = 0.25
+# RSA key generation time depends on how soon primes are found
+CASE_THRESHOLDS = {"keygen/RSA": 0.75}
+ASSOCIATED_DATA = message_associated_data(b"\x01" * 32, b"\x02" * 32)
+SIGNED_MESSAGE = "x" * 256
+
+
+@functools.lru_cache(maxsize=None)
+def key_exchange_pair(algorithm: str) -> Tuple[object, bytes]:
+    """Returns a key exchange manager and a peer public key, created on first use."""
+    alice, bob = create_key_exchange(algorithm), create_key_exchange(algorithm)
+    return alice, bob.get_public_key()
+
+
+@functools.lru_cache(maxsize=None)
+def encryptor_of(suite: str) -> SymmetricEncryption:
+    """Returns encryptor of a cipher suite, created on first use."""
+    return SymmetricEncryption.from_suite(os.urandom(32), suite)
+
+
+@functools.lru_cache(maxsize=None)
+def signer_of(algorithm: str) -> DigitalSignature:
+    """Returns signer of an algorithm, its key is generated on first use."""
+    return DigitalSignature(algorithm=algorithm)
+
+
+def exchange_case(algorithm: str) -> Callable[[], object]:
+    """Shared key derivation with HKDF."""
+    alice, peer_key = key_exchange_pair(algorithm)
+    return lambda: alice.generate_shared_key(peer_key)
+
+
+def encrypt_case(suite: str, size: int) -> Callable[[], object]:
+    """Encryption of a payload of the given size."""
+    encryptor, plaintext = encryptor_of(suite), "x" * size
+    return lambda: encryptor.encrypt(plaintext, ASSOCIATED_DATA)
+
+
+def decrypt_case(suite: str, size: int) -> Callable[[], object]:
+    """Decryption of a payload of the given size."""
+    encryptor = encryptor_of(suite)
+    ciphertext = encryptor.encrypt("x" * size, ASSOCIATED_DATA)
+    return lambda: encryptor.decrypt(ciphertext, ASSOCIATED_DATA)
+
+
+def sign_case(algorithm: str) -> Callable[[], object]:
+    """Signing of a short message."""
+    signer = signer_of(algorithm)
+    return lambda: signer.sign(SIGNED_MESSAGE.encode())
+
+
+def verify_case(algorithm: str) -> Callable[[], object]:
+    """Verification of a short message signature."""
+    signer = signer_of(algorithm)
+    public_key, signature = signer.get_public_key(), signer.sign(SIGNED_MESSAGE.encode())
+    return lambda: signer.verify(public_key, SIGNED_MESSAGE, signature)
+
+
+def transaction_case(algorithm: str) -> Callable[[], object]:
+    """Full Transaction sign + verify."""
+    signer = signer_of(algorithm)
+    public_key = signer.get_public_key()
+    transaction = Transaction(b"\x01" * 32, b"\x02" * 32, 0, "00" * 64, public_key, timestamp=0)
+
+    def sign_and_verify():
+        transaction.sign_transaction(signer)
+        return transaction.is_valid(public_key, algorithm)
+    return sign_and_verify
+
+
+def build_cases() -> List[Tuple[str, Callable[[], Callable[[], object]]]]:
+    """
+    Returns (name, setup) pairs. Setup returns the timed operation and is
+    called only for cases that are run, so filtered out cases cost nothing.
+    """
+    cases = []
+    for algorithm in ("DH", "X25519"):
+        cases.append((f"keygen/{algorithm}", lambda a=algorithm: lambda: create_key_exchange(a)))
+        cases.append((f"exchange+hkdf/{algorithm}", functools.partial(exchange_case, algorithm)))
+
+    for suite in CIPHER_SUITES:
+        for size in PAYLOAD_SIZES:
+            cases.append((f"encrypt/{suite}/{size}", functools.partial(encrypt_case, suite, size)))
+            cases.append((f"decrypt/{suite}/{size}", functools.partial(decrypt_case, suite, size)))
+
+    for algorithm in ("RSA", "Ed25519"):
+        cases.append((f"keygen/{algorithm}", lambda a=algorithm: lambda: DigitalSignature(algorithm=a)))
+        cases.append((f"sign/{algorithm}", functools.partial(sign_case, algorithm)))
+        cases.append((f"verify/{algorithm}", functools.partial(verify_case, algorithm)))
+        cases.append((f"transaction_sign_verify/{algorithm}", functools.partial(transaction_case, algorithm)))
+    return cases
+
+
+def percentile(samples: List[int], fraction: float) -> float:
+    """Returns percentile of sorted nanosecond samples in microseconds."""
+    index = min(int(len(samples) * fraction), len(samples) - 1)
+    return samples[index] / 1000
+
+
+def measure(operation: Callable[[], object], budget: float, min_iterations: int,
+            max_iterations: int) -> Dict[str, float]:
+    """Times single calls until the time budget or iteration limit is reached."""
+    operation()  # warm up caches and lazy imports
+    samples = []
+    deadline = time.perf_counter() + budget
+    while len(samples) < max_iterations and (
+        len(samples) < min_iterations or time.perf_counter() < deadline
+    ):
+        start = time.perf_counter_ns()
+        operation()
+        samples.append(time.perf_counter_ns() - start)
+    samples.sort()
+    # Throughput is taken from the median, so a few preempted calls do not skew it
+    return {
+        "iterations": len(samples),
+        "ops_per_sec": round(1e9 / samples[len(samples) // 2], 1),
+        "p50_us": round(percentile(samples, 0.50), 1),
+        "p90_us": round(percentile(samples, 0.90), 1),
+        "p99_us": round(percentile(samples, 0.99), 1),
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Returns descriptions of cases whose throughput dropped more than threshold."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        expected = baseline[name]["ops_per_sec"]
+        if result["ops_per_sec"] < expected * (1 - CASE_THRESHOLDS.get(name, threshold)):
+            regressions.append(
+                f"{name}: {result['ops_per_sec']} ops/s, baseline {expected} ops/s "
+                f"({100 * (1 - result['ops_per_sec'] / expected):.0f}% slower)"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--filter", default="", help="run only cases containing this text")
+    parser.add_argument("--budget", type=float, default=0.5, help="seconds per case")
+    parser.add_argument("--min-iterations", type=int, default=5)
+    parser.add_argument("--max-iterations", type=int, default=20000)
+    parser.add_argument("--output", help="write results JSON to this file")
+    parser.add_argument("--baseline", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed ops/sec drop as a fraction (default 0.25)")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store this run as the new baseline")
+    args = parser.parse_args()
+
+    results = {}
+    for name, setup in build_cases():
+        if args.filter in name:
+            results[name] = measure(setup(), args.budget, args.min_iterations, args.max_iterations)
+            print(f"{name:<40} {results[name]['ops_per_sec']:>12} ops/s "
+                  f"p50 {results[name]['p50_us']:>10} us  p99 {results[name]['p99_us']:>10} us",
+                  file=sys.stderr)
+
+    report = json.dumps(results, indent=2, sort_keys=True)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(report + "\n")
+
+    if args.baseline and args.update_baseline:
+        # A filtered run updates only its own cases, the rest of the baseline is kept
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+        baseline.update(results)
+        with open(args.baseline, "w") as baseline_file:
+            baseline_file.write(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        return 0
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+    Compares finite-field DH and X25519 backends: key generation and
+    exchange latency, and key bytes carried by every message transaction.
+
+    Usage: python benchmarks/key_exchange.py [rounds]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+import json5 as json
+from crypto.diffie_hellman import create_key_exchange
+from blockchain.transaction import Transaction
+
+
+def measure(function, rounds: int) -> float:
+    """Returns mean call time in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - start) * 1000 / rounds
+
+
+def transaction_key_bytes(public_key: bytes) -> int:
+    """Returns bytes spent on sender and recipient keys in a serialized transaction."""
+    transaction = Transaction(public_key, public_key, 0, "", timestamp=0)
+    empty = Transaction(b"", b"", 0, "", timestamp=0)
+    return (
+        len(json.dumps(transaction.to_dict()).encode())
+        - len(json.dumps(empty.to_dict()).encode())
+    )
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    print(f"{'backend':<8} {'keygen ms':>10} {'exchange ms':>12} {'key bytes':>10} {'tx key bytes':>13}")
+    for algorithm in ("DH", "X25519"):
+        alice = create_key_exchange(algorithm)
+        peer_key = create_key_exchange(algorithm).get_public_key()
+        keygen = measure(lambda: create_key_exchange(algorithm), rounds)
+        exchange = measure(lambda: alice.generate_shared_key(peer_key), rounds)
+        print(
+            f"{algorithm:<8} {keygen:>10.3f} {exchange:>12.3f} "
+            f"{len(peer_key):>10} {transaction_key_bytes(peer_key):>13}"
+        )
+
+
+if __name__ == "__main__":
+    main()
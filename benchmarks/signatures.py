@@ -0,0 +1,47 @@
+"""
+    Compares RSA-PSS and Ed25519 signature backends: signatures and
+    verifications per second, and bytes each signed transaction carries.
+
+    Usage: python benchmarks/signatures.py [rounds]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "src"))
+
+import json5 as json
+from crypto.signatures import DigitalSignature
+from blockchain.transaction import Transaction
+
+
+def rate(function, rounds: int) -> float:
+    """Returns calls per second."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return rounds / (time.perf_counter() - start)
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"{'backend':<8} {'sign/s':>9} {'verify/s':>9} {'key B':>6} {'sig B':>6} {'tx B':>6}")
+    for algorithm in ("RSA", "Ed25519"):
+        signer = DigitalSignature(algorithm=algorithm)
+        transaction = Transaction(
+            b"\x00" * 32, b"\x00" * 32, 0, "00" * 64, signer.get_public_key(), timestamp=0
+        )
+        transaction.sign_transaction(signer)
+        public_key = signer.get_public_key()
+        signs = rate(lambda: transaction.sign_transaction(signer), rounds)
+        verifies = rate(lambda: transaction.is_valid(public_key), rounds)
+        size = len(json.dumps(transaction.to_dict()).encode())
+        print(
+            f"{algorithm:<8} {signs:>9.0f} {verifies:>9.0f} "
+            f"{len(public_key):>6} {len(transaction.signature):>6} {size:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
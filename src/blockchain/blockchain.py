@@ -7,6 +7,7 @@ import time
 from typing import List, Dict
 from .consensus import ProofOfWork, Validator
 from .transaction import Transaction
+from .index import ConversationIndex
 from cryptography.hazmat.primitives.asymmetric import rsa
 import json5 as json
 from cryptography.hazmat.primitives import serialization
@@ -95,6 +96,22 @@ class Block:
             "nonce": self.nonce,
         }
 
+    @classmethod
+    def from_dict(cls, block_dict: dict) -> "Block":
+        """
+        Restores a block from its dictionary representation.
+
+        :param block_dict: Block data as produced by to_dict.
+        :type block_dict: dict
+        :return: Restored block.
+        :rtype: Block
+        """
+        data = dict(block_dict)
+        data["transactions"] = [
+            Transaction.from_dict(transaction) for transaction in data["transactions"]
+        ]
+        return cls(**data)
+
 
 class Blockchain:
     """
@@ -103,19 +120,25 @@ class Blockchain:
     :ivar int difficulty: The difficulty level for mining new blocks.
     :ivar List[Transaction] pending_transactions: A list of transactions waiting to be included in a block.
     :ivar List[Block] chain: The list of blocks forming the blockchain.
+    :ivar MempoolJournal journal: Write-ahead journal of pending transactions, if any.
+    :ivar ConversationIndex index: Index of messages by conversation.
     """
 
-    def __init__(self, difficulty: int = 4) -> None:
+    def __init__(self, difficulty: int = 4, journal=None) -> None:
         """
         Initializes a new Blockchain instance.
 
         :param difficulty: The difficulty level for mining new blocks. Defaults to 4.
         :type difficulty: int
+        :param journal: Write-ahead journal of pending transactions. Defaults to None.
+        :type journal: MempoolJournal
         """
         self.chain: List[Block] = [self.create_genesis_block()]
         self.difficulty = difficulty
         self.pending_transactions: List[Transaction] = []
         self.validator = Validator()
+        self.journal = journal
+        self.index = ConversationIndex(self)
 
     def __len__(self):
         """
@@ -151,10 +174,85 @@ class Blockchain:
         :type transaction: Transaction
         """
         if self.is_transaction_valid(transaction):
-            self.pending_transactions.append(transaction)
+            self.add_pending_transaction(transaction)
         else:
             print("Transaction is invalid")
 
+    def add_pending_transaction(self, transaction: Transaction) -> None:
+        """
+        Adds an already validated transaction to the pending transactions
+        and records it in the journal.
+
+        :param transaction: The validated transaction.
+        :type transaction: Transaction
+        """
+        self.pending_transactions.append(transaction)
+        if self.journal:
+            self.journal.record_add(transaction)
+
+    def has_pending_transaction(self, transaction: Transaction) -> bool:
+        """
+        Checks if an equal transaction is already pending.
+
+        :param transaction: The transaction to look for.
+        :type transaction: Transaction
+        :return: True if a pending transaction has the same hash.
+        :rtype: bool
+        """
+        transaction_hash = transaction.calculate_hash()
+        return any(
+            pending.calculate_hash() == transaction_hash
+            for pending in self.pending_transactions
+        )
+
+    def remove_pending_transactions(self, transactions: List[Transaction]) -> None:
+        """
+        Removes transactions (e.g. included in a received block) from the pending transactions.
+
+        :param transactions: Transactions to remove.
+        :type transactions: List[Transaction]
+        """
+        hashes = {transaction.calculate_hash() for transaction in transactions}
+        removed = [
+            transaction
+            for transaction in self.pending_transactions
+            if transaction.calculate_hash() in hashes
+        ]
+        if not removed:
+            return
+        self.pending_transactions = [
+            transaction
+            for transaction in self.pending_transactions
+            if transaction.calculate_hash() not in hashes
+        ]
+        if self.journal:
+            self.journal.record_remove(removed)
+
+    def restore_pending_transactions(self) -> int:
+        """
+        Restores pending transactions from the journal after a restart.
+
+        Transactions are re-validated locally, no network round-trips are needed.
+
+        :return: Number of restored transactions.
+        :rtype: int
+        """
+        if not self.journal:
+            return 0
+
+        restored = self.journal.replay()
+        invalid = [
+            transaction
+            for transaction in restored
+            if not self.is_transaction_valid(transaction)
+        ]
+        self.pending_transactions = [
+            transaction for transaction in restored if transaction not in invalid
+        ]
+        if invalid:
+            self.journal.record_remove(invalid)
+        return len(self.pending_transactions)
+
     def is_transaction_valid(self, transaction: Transaction) -> bool:
         """
         Validates the transaction.
@@ -193,8 +291,32 @@ class Blockchain:
                     balance += transaction.amount
         return balance
 
+    def get_conversation(self, my_key: bytes, peer_key: bytes) -> List[Transaction]:
+        """
+        Returns messages exchanged between two parties, including batched ones.
+
+        :param my_key: Local peer key.
+        :type my_key: bytes
+        :param peer_key: Other peer key.
+        :type peer_key: bytes
+        :return: Conversation messages, mined first, then pending.
+        :rtype: List[Transaction]
+        """
+        return self.index.get_messages(my_key, peer_key)
+
+    def get_group_history(self, group_id: bytes) -> List[Transaction]:
+        """
+        Returns messages sent to a group.
+
+        :param group_id: The group id.
+        :type group_id: bytes
+        :return: Group messages, mined first, then pending.
+        :rtype: List[Transaction]
+        """
+        return self.index.get_conversation(group_id)
+
     def mine_pending_transactions(
-        self, miner, miner_address: str
+        self, miner, miner_address: str, reward: bool = True
     ) -> tuple[Block, Transaction] | tuple[None, None]:
         """
         Mines a new block using pending transactions and adds it to the chain.
@@ -203,7 +325,10 @@ class Blockchain:
         :type miner: ProofOfWork
         :param miner_address: The address of the miner receiving rewards.
         :type miner_address: str
-        :return: A tuple containing the mined Block and the reward transaction or tuple of None objects
+        :param reward: Whether to create a reward transaction (shard sub-chains don't). Defaults to True.
+        :type reward: bool
+        :return: A tuple containing the mined Block and the reward transaction (None if reward is False)
+                 or tuple of None objects
         :rtype: tuple[Block, Transaction] | tuple[None, None]
         """
         if not self.pending_transactions:
@@ -217,14 +342,20 @@ class Blockchain:
             transactions=self.pending_transactions,
         )
 
-        reward_transaction = Transaction(None, miner_address, 1, "Mining Reward")
+        reward_transaction = (
+            Transaction(None, miner_address, 1, "Mining Reward") if reward else None
+        )
 
         miner(self.difficulty).mine(new_block)
         miner(self.difficulty).validate(new_block)
 
         if self.validator.validate_block(new_block, self.chain[-1]):
             self.chain.append(new_block)
-            self.pending_transactions = [reward_transaction]
+            self.pending_transactions = [reward_transaction] if reward_transaction else []
+            if self.journal:
+                self.journal.record_remove(new_block.transactions)
+                if reward_transaction:
+                    self.journal.record_add(reward_transaction)
             return new_block, reward_transaction
         else:
             print("Invalid block. Block was not added to the chain")
@@ -239,6 +370,20 @@ class Blockchain:
         """
         return self.validator.validate_blockchain(self)
 
+    def get_block(self, block_hash: str) -> Block | None:
+        """
+        Finds a block of the chain by its hash, recent blocks are checked first.
+
+        :param block_hash: The hash of the block.
+        :type block_hash: str
+        :return: The block or None if the chain does not contain it.
+        :rtype: Block | None
+        """
+        for block in reversed(self.chain):
+            if block.hash == block_hash:
+                return block
+        return None
+
     def contains_block(self, target_block: Block) -> bool:
         """
         Checks if the blockchain already contains the given block.
@@ -10,6 +10,8 @@ from cryptography.hazmat.primitives.serialization import (
     Encoding,
     PublicFormat,
 )
+from crypto.signatures import key_algorithm
+from utils.config import SIGNATURE_ALGORITHM
 
 
 class ProofOfWork:
@@ -74,8 +76,13 @@ class ProofOfWork:
 class Validator:
     """
     Validator class to check the integrity of the blockchain.
+
+    :ivar signature_algorithm: Signature algorithm of the network
+    :type signature_algorithm: str
     """
 
+    signature_algorithm = SIGNATURE_ALGORITHM
+
     def validate_blockchain(self, blockchain) -> bool:
         """
         Checks the integrity of the entire blockchain.
@@ -116,6 +123,12 @@ class Validator:
             print(f"Block {current_block.index} has invalid timestamp")
             return False
 
+        for transaction in current_block.transactions:
+            if transaction.sign_public_key and \
+                    key_algorithm(transaction.sign_public_key) != self.signature_algorithm:
+                print(f"Block {current_block.index} has a transaction signed with another algorithm")
+                return False
+
         return True
 
 
@@ -0,0 +1,128 @@
+"""
+    Index module keeps conversation history lookups off the full chain scan.
+"""
+
+import hashlib
+import threading
+from typing import Dict, List
+from .transaction import Transaction, GROUP_PREFIX
+from utils.logger import Logger
+
+log = Logger("index")
+
+
+def conversation_id(sender: bytes, recipient: bytes) -> bytes:
+    """
+    Returns the id of the conversation a message belongs to.
+
+    Messages addressed to a group belong to the group conversation. For
+    direct messages the id does not depend on the message direction.
+
+    :param sender: Sender key.
+    :type sender: bytes
+    :param recipient: Recipient key or group id.
+    :type recipient: bytes
+    :return: Conversation id.
+    :rtype: bytes
+    """
+    if recipient.startswith(GROUP_PREFIX):
+        return recipient
+    first, second = sorted((sender, recipient))
+    return hashlib.sha256(first + b"|" + second).digest()
+
+
+class ConversationIndex:
+    """
+    Index of chat messages in the chain by conversation.
+
+    Blocks are indexed incrementally on lookup, so the index stays correct
+    whichever code path appended blocks. If the chain was replaced (e.g. merged
+    with a longer one) the index is rebuilt.
+
+    :ivar Blockchain blockchain: Indexed blockchain.
+    :ivar Dict conversations: Messages in the chain by conversation key.
+    :ivar int height: Number of indexed blocks.
+    """
+
+    def __init__(self, blockchain) -> None:
+        """
+        Initializes a new ConversationIndex instance.
+
+        :param blockchain: Indexed blockchain.
+        :type blockchain: Blockchain
+        """
+        self.blockchain = blockchain
+        self.conversations: Dict[bytes, List[Transaction]] = {}
+        self.height = 0
+        self.last_hash = None
+        self.lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """Indexes blocks appended since the last lookup."""
+        chain = self.blockchain.chain
+        if self.height and (
+            len(chain) < self.height or chain[self.height - 1].hash != self.last_hash
+        ):
+            self.conversations = {}
+            self.height = 0
+
+        for block in chain[self.height:]:
+            for transaction in block.transactions:
+                self._add(self.conversations, transaction)
+        self.height = len(chain)
+        self.last_hash = chain[-1].hash if chain else None
+
+    def get_messages(self, my_key: bytes, peer_key: bytes) -> List[Transaction]:
+        """
+        Returns messages between two parties, mined ones first, then pending.
+
+        :param my_key: Local peer key.
+        :type my_key: bytes
+        :param peer_key: Other peer key.
+        :type peer_key: bytes
+        :return: Conversation messages.
+        :rtype: List[Transaction]
+        """
+        return self.get_conversation(conversation_id(my_key, peer_key))
+
+    def get_conversation(self, key: bytes) -> List[Transaction]:
+        """
+        Returns messages of a conversation, mined ones first, then pending.
+
+        :param key: Conversation id (see conversation_id), e.g. a group id.
+        :type key: bytes
+        :return: Conversation messages.
+        :rtype: List[Transaction]
+        """
+        with self.lock:
+            self.refresh()
+            messages = list(self.conversations.get(key, []))
+
+        pending = {}
+        for transaction in list(self.blockchain.pending_transactions):
+            self._add(pending, transaction)
+        return messages + pending.get(key, [])
+
+    @staticmethod
+    def _add(conversations: dict, transaction: Transaction) -> None:
+        """
+        Adds messages of a transaction to an index.
+
+        A malformed transaction is skipped, so it cannot break the index
+        for other conversations.
+
+        :param conversations: Index to update.
+        :type conversations: dict
+        :param transaction: Indexed transaction.
+        :type transaction: Transaction
+        """
+        try:
+            messages = transaction.messages()
+        except (ValueError, TypeError, KeyError) as e:
+            log.warning(f"Skipping malformed transaction in index: {e}")
+            return
+        for message in messages:
+            if not message.sender or not message.recipient:
+                continue
+            key = conversation_id(message.sender, message.recipient)
+            conversations.setdefault(key, []).append(message)
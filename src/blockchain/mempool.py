@@ -0,0 +1,213 @@
+"""
+    Mempool module represents the write-ahead journal of pending transactions,
+    so unmined messages survive node restarts.
+"""
+
+import os
+import threading
+import time
+import json5 as json
+from typing import Dict, Iterable, List
+from .transaction import Transaction
+from utils.logger import Logger
+from utils.config import (
+    MEMPOOL_FSYNC_BATCH,
+    MEMPOOL_FSYNC_INTERVAL,
+    MEMPOOL_COMPACT_THRESHOLD,
+)
+
+log = Logger("mempool")
+
+
+class MempoolJournal:
+    """
+    Append-only journal of mempool changes.
+
+    Every addition and removal of a pending transaction is written as a single
+    line. Lines are flushed to the OS immediately and fsynced in batches, so a
+    crashed process loses nothing and a power loss loses at most one batch.
+    Records left unsynced by an idle period are fsynced by a timer after
+    fsync_interval.
+
+    :ivar str path: Path to the journal file.
+    :ivar int fsync_batch: Number of records written between fsync calls.
+    :ivar float fsync_interval: Maximum time in seconds between fsync calls.
+    :ivar int compact_threshold: Number of records after which the journal is compacted.
+    """
+
+    ADD = "ADD"
+    REMOVE = "REMOVE"
+
+    def __init__(
+        self,
+        path: str,
+        fsync_batch: int = MEMPOOL_FSYNC_BATCH,
+        fsync_interval: float = MEMPOOL_FSYNC_INTERVAL,
+        compact_threshold: int = MEMPOOL_COMPACT_THRESHOLD,
+    ) -> None:
+        """
+        Initializes a new MempoolJournal instance and opens the journal file.
+
+        :param path: Path to the journal file.
+        :type path: str
+        :param fsync_batch: Number of records written between fsync calls.
+        :type fsync_batch: int
+        :param fsync_interval: Maximum time in seconds between fsync calls.
+        :type fsync_interval: float
+        :param compact_threshold: Number of records after which the journal is compacted.
+        :type compact_threshold: int
+        """
+        self.path = path
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+        self.lock = threading.Lock()
+        self.live: Dict[str, Transaction] = {}
+        self.records = 0
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.timer = None
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def replay(self) -> List[Transaction]:
+        """
+        Reads the journal and restores the set of pending transactions.
+
+        A torn last line (the process died mid-write) and malformed records are ignored.
+
+        :return: Pending transactions in the order they were added.
+        :rtype: List[Transaction]
+        """
+        with self.lock:
+            self.live = {}
+            self.records = 0
+            if not os.path.exists(self.path):
+                return []
+
+            with open(self.path, "r", encoding="utf-8") as journal:
+                for line in journal:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                        op = record.get("op")
+                    except (ValueError, AttributeError):
+                        log.warning("Skipping corrupted journal record")
+                        continue
+                    self.records += 1
+                    try:
+                        if op == self.ADD:
+                            transaction = Transaction.from_dict(record["transaction"])
+                            self.live[transaction.calculate_hash()] = transaction
+                        elif op == self.REMOVE:
+                            self.live.pop(record["id"], None)
+                        else:
+                            log.warning("Skipping journal record without operation")
+                    except (KeyError, TypeError, ValueError) as e:
+                        log.warning(f"Skipping malformed journal record: {e}")
+
+            log.info(f"Restored {len(self.live)} pending transactions from journal")
+            return list(self.live.values())
+
+    def record_add(self, transaction: Transaction) -> None:
+        """
+        Records a transaction added to the mempool.
+
+        :param transaction: Added transaction.
+        :type transaction: Transaction
+        """
+        with self.lock:
+            transaction_id = transaction.calculate_hash()
+            self.live[transaction_id] = transaction
+            self._write({"op": self.ADD, "transaction": transaction.to_dict()})
+
+    def record_remove(self, transactions: Iterable[Transaction]) -> None:
+        """
+        Records transactions removed from the mempool (mined or dropped).
+
+        Compacts the journal when it has grown past the threshold.
+
+        :param transactions: Removed transactions.
+        :type transactions: Iterable[Transaction]
+        """
+        with self.lock:
+            for transaction in transactions:
+                transaction_id = transaction.calculate_hash()
+                if self.live.pop(transaction_id, None) is not None:
+                    self._write({"op": self.REMOVE, "id": transaction_id})
+
+            if self.records >= self.compact_threshold and self.records > 2 * len(self.live):
+                self._compact()
+
+    def flush(self) -> None:
+        """Forces all written records to disk."""
+        with self.lock:
+            self._sync()
+
+    def close(self) -> None:
+        """Flushes and closes the journal file."""
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+            self._sync()
+            self.file.close()
+
+    def _write(self, record: dict) -> None:
+        """
+        Appends a record and fsyncs if the batch is full or too old.
+
+        :param record: Journal record.
+        :type record: dict
+        """
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.records += 1
+        self.unsynced += 1
+        if (
+            self.unsynced >= self.fsync_batch
+            or time.monotonic() - self.last_sync >= self.fsync_interval
+        ):
+            self._sync()
+        elif self.timer is None:
+            self.timer = threading.Timer(self.fsync_interval, self._sync_later)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _sync_later(self) -> None:
+        """Fsyncs records that were not followed by enough writes to fill a batch."""
+        with self.lock:
+            self.timer = None
+            self._sync()
+
+    def _sync(self) -> None:
+        """Flushes the file buffers and calls fsync."""
+        if self.file.closed or not self.unsynced:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def _compact(self) -> None:
+        """
+        Rewrites the journal so it only contains the live transactions.
+
+        The new journal is written next to the old one and atomically swapped in.
+        """
+        temp_path = self.path + ".compact"
+        with open(temp_path, "w", encoding="utf-8") as compacted:
+            for transaction in self.live.values():
+                record = {"op": self.ADD, "transaction": transaction.to_dict()}
+                compacted.write(json.dumps(record, ensure_ascii=False) + "\n")
+            compacted.flush()
+            os.fsync(compacted.fileno())
+
+        self.file.close()
+        os.replace(temp_path, self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.records = len(self.live)
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        log.debug(f"Mempool journal compacted to {self.records} records")
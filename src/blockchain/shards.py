@@ -0,0 +1,489 @@
+"""
+    Shards module represents optional conversation sharding: chat messages are
+    routed to per-shard sub-chains, whose heads are anchored into the main chain.
+"""
+
+import hashlib
+import os
+import threading
+import time
+import json5 as json
+from typing import Dict, List, Optional, Set
+from .blockchain import Blockchain, Block
+from .index import conversation_id
+from .mempool import MempoolJournal
+from .transaction import Transaction
+from utils.logger import Logger
+from utils.config import SHARD_COUNT
+
+log = Logger("shards")
+
+SHARD_ANCHOR_RECIPIENT = b"SHARD_ANCHOR"
+JOURNAL_SUFFIX = ".journal"
+
+
+def anchor_commitments(content: str) -> Dict[int, str]:
+    """
+    Parses shard heads committed to by an anchor transaction.
+
+    Anchors are written by any peer, so entries that are not
+    shard id -> [block index, block hash] are skipped.
+
+    :param content: Anchor transaction content.
+    :type content: str
+    :return: Anchored head hash by shard id.
+    :rtype: Dict[int, str]
+    """
+    try:
+        commitments = json.loads(content)
+    except (ValueError, TypeError):
+        return {}
+    if not isinstance(commitments, dict):
+        return {}
+    heads = {}
+    for shard_id, head in commitments.items():
+        if not (isinstance(shard_id, str) and shard_id.isdigit()):
+            continue
+        if not (isinstance(head, list) and len(head) == 2):
+            continue
+        index, head_hash = head
+        if isinstance(index, int) and not isinstance(index, bool) and isinstance(head_hash, str):
+            heads[int(shard_id)] = head_hash
+    return heads
+
+
+def shard_for(conversation: bytes, shard_count: int = SHARD_COUNT) -> int:
+    """
+    Maps a conversation or group id to its shard.
+
+    :param conversation: Conversation id (see conversation_id).
+    :type conversation: bytes
+    :param shard_count: Number of shards in the network.
+    :type shard_count: int
+    :return: Shard id.
+    :rtype: int
+    """
+    digest = hashlib.sha256(conversation).digest()
+    return int.from_bytes(digest[:4], "big") % shard_count
+
+
+class ShardManager:
+    """
+    Keeps sub-chains of the shards the local node participates in.
+
+    Only subscribed shards are stored and validated. The node subscribes to a
+    shard as soon as it sees a message it sends, receives, or that is addressed
+    to one of its groups, so storage grows with the user's own traffic.
+
+    Blocks mined before the subscription are synced from peers. Shard blocks
+    committed to by an anchor in the main chain are final: a competing branch
+    that would drop one of them is rejected.
+
+    :ivar bytes own_key: Local peer DH public key.
+    :ivar Blockchain main_chain: Main chain used for anchors and non-chat transactions.
+    :ivar int shard_count: Number of shards in the network.
+    :ivar str journal_dir: Directory of shard mempool journals, None keeps shard mempools in memory.
+    :ivar Dict[int, Blockchain] shards: Sub-chains of subscribed shards.
+    :ivar Dict[int, str] anchored: Last shard head hashes anchored by this node.
+    :ivar Dict[int, Set[str]] anchored_in_chain: Shard heads anchored in indexed main chain blocks.
+    :ivar int anchor_height: Number of main chain blocks searched for anchors.
+    """
+
+    def __init__(
+        self,
+        own_key: bytes,
+        main_chain: Blockchain,
+        shard_count: int = SHARD_COUNT,
+        group_manager=None,
+        journal_dir: Optional[str] = None,
+    ) -> None:
+        """
+        Initializes a new ShardManager instance.
+
+        :param own_key: Local peer DH public key.
+        :type own_key: bytes
+        :param main_chain: Main chain used for anchors and non-chat transactions.
+        :type main_chain: Blockchain
+        :param shard_count: Number of shards in the network.
+        :type shard_count: int
+        :param group_manager: Manager of groups local peer is a member of.
+        :type group_manager: GroupManager
+        :param journal_dir: Directory of shard mempool journals. Defaults to None.
+        :type journal_dir: str
+        """
+        self.own_key = own_key
+        self.main_chain = main_chain
+        self.shard_count = shard_count
+        self.group_manager = group_manager
+        self.journal_dir = journal_dir
+        self.shards: Dict[int, Blockchain] = {}
+        self.anchored: Dict[int, str] = {}
+        self.anchored_in_chain: Dict[int, Set[str]] = {}
+        self.anchor_height = 0
+        self.anchor_last_hash = None
+        self.lock = threading.Lock()
+
+    def route(self, transaction: Transaction) -> Optional[int]:
+        """
+        Returns the shard a transaction belongs to.
+
+        Coin transfers, anchors and batches spanning several shards stay on
+        the main chain.
+
+        :param transaction: Transaction to route.
+        :type transaction: Transaction
+        :return: Shard id or None for main chain transactions.
+        :rtype: int or None
+        """
+        if not transaction.sender or transaction.amount:
+            return None
+        if transaction.recipient == SHARD_ANCHOR_RECIPIENT:
+            return None
+        shard_ids = {
+            shard_for(conversation_id(message.sender, message.recipient), self.shard_count)
+            for message in transaction.messages()
+        }
+        return shard_ids.pop() if len(shard_ids) == 1 else None
+
+    def participates(self, transaction: Transaction) -> bool:
+        """
+        Checks if local peer is a party of any message in the transaction.
+
+        Only addresses are inspected, no signature is verified.
+
+        :param transaction: Transaction to check.
+        :type transaction: Transaction
+        :return: True if local peer sends or receives any of the messages.
+        :rtype: bool
+        """
+        for message in transaction.messages():
+            if self.own_key in (message.sender, message.recipient):
+                return True
+            if self.group_manager and self.group_manager.get_group(message.recipient):
+                return True
+        return False
+
+    def subscribe(self, shard_id: int) -> Blockchain:
+        """
+        Subscribes to a shard, creating its sub-chain.
+
+        With a journal directory the shard mempool is journaled like the main
+        chain one, and pending transactions of a previous run are restored.
+
+        :param shard_id: Shard id.
+        :type shard_id: int
+        :return: Shard sub-chain.
+        :rtype: Blockchain
+        """
+        with self.lock:
+            if shard_id not in self.shards:
+                journal = None
+                if self.journal_dir:
+                    os.makedirs(self.journal_dir, exist_ok=True)
+                    journal = MempoolJournal(
+                        os.path.join(self.journal_dir, f"{shard_id}{JOURNAL_SUFFIX}")
+                    )
+                shard = Blockchain(self.main_chain.difficulty, journal=journal)
+                shard.restore_pending_transactions()
+                self.shards[shard_id] = shard
+                log.info(f"Subscribed to shard {shard_id}")
+            return self.shards[shard_id]
+
+    def restore(self) -> List[int]:
+        """
+        Subscribes again to shards that have a journal from a previous run.
+
+        Their blocks are then synced from peers like after a new subscription.
+
+        :return: Restored shard ids.
+        :rtype: List[int]
+        """
+        if not self.journal_dir or not os.path.isdir(self.journal_dir):
+            return []
+        restored = []
+        for name in sorted(os.listdir(self.journal_dir)):
+            shard_id = name[:-len(JOURNAL_SUFFIX)]
+            if name.endswith(JOURNAL_SUFFIX) and shard_id.isdigit() \
+                    and int(shard_id) < self.shard_count:
+                self.subscribe(int(shard_id))
+                restored.append(int(shard_id))
+        return restored
+
+    def close(self) -> None:
+        """Flushes and closes the mempool journals of subscribed shards."""
+        for shard in list(self.shards.values()):
+            if shard.journal:
+                shard.journal.close()
+
+    def get_shard(self, shard_id: int) -> Optional[Blockchain]:
+        """
+        Returns the sub-chain of a subscribed shard.
+
+        :param shard_id: Shard id.
+        :type shard_id: int
+        :return: Shard sub-chain or None if not subscribed.
+        :rtype: Blockchain or None
+        """
+        return self.shards.get(shard_id)
+
+    def shard_id_of(self, shard: Blockchain) -> Optional[int]:
+        """
+        Returns the id of a subscribed shard sub-chain.
+
+        :param shard: Shard sub-chain.
+        :type shard: Blockchain
+        :return: Shard id or None if chain is not a shard.
+        :rtype: int or None
+        """
+        for shard_id, chain in list(self.shards.items()):
+            if chain is shard:
+                return shard_id
+        return None
+
+    def accept_transaction(self, transaction: Transaction) -> Optional[Blockchain]:
+        """
+        Returns the sub-chain that should store a transaction.
+
+        Subscribes to the shard if local peer participates in the transaction.
+
+        :param transaction: Routed transaction.
+        :type transaction: Transaction
+        :return: Shard sub-chain or None if the transaction is not stored locally.
+        :rtype: Blockchain or None
+        """
+        shard_id = self.route(transaction)
+        if shard_id is None:
+            return None
+        shard = self.get_shard(shard_id)
+        if shard is None and self.participates(transaction):
+            shard = self.subscribe(shard_id)
+        return shard
+
+    def add_shard_block(self, shard_id: int, block: Block) -> bool:
+        """
+        Validates a block of a subscribed shard and appends it to the sub-chain.
+
+        :param shard_id: Shard id.
+        :type shard_id: int
+        :param block: Received shard block.
+        :type block: Block
+        :return: True if block was appended.
+        :rtype: bool
+        """
+        shard = self.get_shard(shard_id)
+        if shard is None or shard.contains_block(block):
+            return False
+        if not shard.validator.validate_block(block, shard.get_latest_block()):
+            log.warning(f"Invalid block received for shard {shard_id}")
+            return False
+        shard.chain.append(block)
+        shard.remove_pending_transactions(block.transactions)
+        return True
+
+    def blocks_after(self, shard_id: int, block_hash: str, limit: int) -> List[Block]:
+        """
+        Returns blocks of a subscribed shard following the given block.
+
+        If the block is unknown, the requester is on another branch and
+        blocks are returned from the start of the shard.
+
+        :param shard_id: Shard id.
+        :type shard_id: int
+        :param block_hash: Hash of the last block the requester has.
+        :type block_hash: str
+        :param limit: Maximum number of returned blocks.
+        :type limit: int
+        :return: Following blocks, empty if the shard is not subscribed.
+        :rtype: List[Block]
+        """
+        shard = self.get_shard(shard_id)
+        if shard is None:
+            return []
+        chain = list(shard.chain)
+        start = next(
+            (position + 1 for position, block in enumerate(chain) if block.hash == block_hash),
+            1,
+        )
+        return chain[start:start + limit]
+
+    def add_shard_blocks(self, shard_id: int, blocks: List[Block]) -> int:
+        """
+        Validates a run of shard blocks synced from a peer and applies it.
+
+        A run continuing the local head is appended. A run branching off an
+        earlier block replaces local blocks only if the result is longer and
+        no replaced block is anchored in the main chain.
+
+        :param shard_id: Shard id.
+        :type shard_id: int
+        :param blocks: Consecutive shard blocks.
+        :type blocks: List[Block]
+        :return: Number of blocks added to the sub-chain.
+        :rtype: int
+        """
+        shard = self.get_shard(shard_id)
+        if shard is None or not blocks:
+            return 0
+        chain = shard.chain
+        fork = next(
+            (position for position, block in enumerate(chain) if block.hash == blocks[0].previous_hash),
+            None,
+        )
+        if fork is None:
+            log.warning(f"Synced blocks of shard {shard_id} do not connect to local chain")
+            return 0
+        known = next(
+            (
+                offset for offset, block in enumerate(blocks)
+                if fork + 1 + offset >= len(chain) or chain[fork + 1 + offset].hash != block.hash
+            ),
+            None,
+        )
+        if known is None:
+            return 0
+        fork += known
+        new_blocks = blocks[known:]
+
+        previous = chain[fork]
+        for block in new_blocks:
+            if not shard.validator.validate_block(block, previous):
+                log.warning(f"Invalid block synced for shard {shard_id}")
+                return 0
+            previous = block
+
+        replaced = chain[fork + 1:]
+        if replaced:
+            if fork + len(new_blocks) <= len(chain) - 1:
+                return 0
+            # Ancestors of an anchored block are anchored too
+            if self.is_anchored(shard_id, replaced[0].hash):
+                log.warning(f"Synced branch of shard {shard_id} drops anchored blocks")
+                return 0
+            del chain[fork + 1:]
+            log.info(f"Switched shard {shard_id} to a longer branch after block {fork}")
+        chain.extend(new_blocks)
+        for block in new_blocks:
+            shard.remove_pending_transactions(block.transactions)
+        return len(new_blocks)
+
+    def anchor_transaction(self, sender: bytes, sign_public_key: bytes) -> Optional[Transaction]:
+        """
+        Creates an unsigned main chain transaction committing to shard heads
+        changed since the previous anchor.
+
+        :param sender: Local peer DH public key.
+        :type sender: bytes
+        :param sign_public_key: Public key of the signer.
+        :type sign_public_key: bytes
+        :return: Anchor transaction or None if no shard head changed.
+        :rtype: Transaction or None
+        """
+        heads = {}
+        for shard_id, shard in list(self.shards.items()):
+            head = shard.get_latest_block()
+            if head.index and self.anchored.get(shard_id) != head.hash:
+                heads[str(shard_id)] = [head.index, head.hash]
+        if not heads:
+            return None
+        for shard_id, (_, head_hash) in heads.items():
+            self.anchored[int(shard_id)] = head_hash
+        return Transaction(
+            sender,
+            SHARD_ANCHOR_RECIPIENT,
+            0,
+            json.dumps(heads),
+            sign_public_key,
+            timestamp=time.time(),
+        )
+
+    def anchored_heads(self) -> Dict[int, Set[str]]:
+        """
+        Returns shard head hashes anchored in the main chain.
+
+        Only blocks appended since the previous call are searched. If the
+        main chain was replaced, anchors are collected again.
+
+        :return: Anchored block hashes by shard id.
+        :rtype: Dict[int, Set[str]]
+        """
+        with self.lock:
+            chain = self.main_chain.chain
+            if self.anchor_height and (
+                len(chain) < self.anchor_height
+                or chain[self.anchor_height - 1].hash != self.anchor_last_hash
+            ):
+                self.anchored_in_chain = {}
+                self.anchor_height = 0
+
+            for block in chain[self.anchor_height:]:
+                for transaction in block.transactions:
+                    if transaction.recipient != SHARD_ANCHOR_RECIPIENT:
+                        continue
+                    for shard_id, head_hash in anchor_commitments(transaction.content).items():
+                        self.anchored_in_chain.setdefault(shard_id, set()).add(head_hash)
+            self.anchor_height = len(chain)
+            self.anchor_last_hash = chain[-1].hash if chain else None
+            return self.anchored_in_chain
+
+    def is_anchored(self, shard_id: int, block_hash: str) -> bool:
+        """
+        Checks if a shard block is committed to by the main chain,
+        either directly or as an ancestor of an anchored head.
+
+        :param shard_id: Shard id.
+        :type shard_id: int
+        :param block_hash: Shard block hash.
+        :type block_hash: str
+        :return: True if block is anchored.
+        :rtype: bool
+        """
+        shard = self.get_shard(shard_id)
+        anchored = self.anchored_heads().get(shard_id, set())
+        if shard is None or not anchored:
+            return False
+        found = False
+        for block in reversed(shard.chain):
+            found = found or block.hash in anchored
+            if found and block.hash == block_hash:
+                return True
+        return False
+
+    def get_conversation(self, my_key: bytes, peer_key: bytes) -> List[Transaction]:
+        """
+        Returns messages between two parties from main chain and their shard.
+
+        :param my_key: Local peer key.
+        :type my_key: bytes
+        :param peer_key: Other peer key.
+        :type peer_key: bytes
+        :return: Conversation messages.
+        :rtype: List[Transaction]
+        """
+        return self._history(conversation_id(my_key, peer_key))
+
+    def get_group_history(self, group_id: bytes) -> List[Transaction]:
+        """
+        Returns group messages from main chain and the group shard.
+
+        :param group_id: The group id.
+        :type group_id: bytes
+        :return: Group messages.
+        :rtype: List[Transaction]
+        """
+        return self._history(group_id)
+
+    def _history(self, conversation: bytes) -> List[Transaction]:
+        """
+        Merges conversation messages of the main chain and the shard sub-chain.
+
+        :param conversation: Conversation id.
+        :type conversation: bytes
+        :return: Conversation messages.
+        :rtype: List[Transaction]
+        """
+        messages = self.main_chain.index.get_conversation(conversation)
+        shard = self.get_shard(shard_for(conversation, self.shard_count))
+        if shard is not None:
+            messages = messages + shard.index.get_conversation(conversation)
+            messages.sort(key=lambda message: float(message.timestamp))
+        return messages
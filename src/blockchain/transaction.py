@@ -4,12 +4,12 @@
 
 import hashlib
 import json5 as json
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
-from cryptography.hazmat.primitives import hashes
-from typing import Dict, Any
+from cryptography.hazmat.primitives.asymmetric import rsa
+from typing import Dict, Any, List, Tuple
 from utils.logger import Logger
+from crypto.signatures import verify_signature
+from utils.config import SIGNATURE_ALGORITHM
 from cryptography.hazmat.primitives.serialization import (
-    load_pem_public_key,
     Encoding,
     PublicFormat,
 )
@@ -17,6 +17,9 @@ import time
 
 log = Logger("transaction")
 
+BATCH_RECIPIENT = b"BATCH"
+GROUP_PREFIX = b"GROUP:"
+
 
 class Transaction:
     """
@@ -86,6 +89,36 @@ class Transaction:
             "timestamp": str(self.timestamp)
         }
 
+    @classmethod
+    def from_dict(cls, transaction_dict: Dict[str, Any]) -> "Transaction":
+        """
+        Restores a transaction from its dictionary representation.
+
+        Reverses :meth:`to_dict`: hex encoded fields are converted back to bytes.
+
+        :param transaction_dict: Transaction data as produced by to_dict.
+        :type transaction_dict: Dict[str, Any]
+        :return: Restored transaction.
+        :rtype: Transaction
+        """
+        data = dict(transaction_dict)
+        for field in ("sender", "recipient", "signature", "sign_public_key"):
+            data[field] = bytes.fromhex(data[field]) if data.get(field) else None
+        if cls is Transaction and data["recipient"] == BATCH_RECIPIENT:
+            return BatchTransaction(**data)
+        return cls(**data)
+
+    def messages(self) -> List["Transaction"]:
+        """
+        Returns chat messages carried by the transaction.
+
+        A plain transaction carries exactly one message - itself.
+
+        :return: List of messages.
+        :rtype: List[Transaction]
+        """
+        return [self]
+
     def calculate_hash(self) -> str:
         """
         Calculates the SHA-256 hash of the transaction's content.
@@ -118,12 +151,16 @@ class Transaction:
             hash_bytes
         )
 
-    def is_valid(self, public_key: bytes) -> bool:
+    def is_valid(self, public_key: bytes, algorithm: str = SIGNATURE_ALGORITHM) -> bool:
         """
         Checks if the transaction's signature is valid using the sender's public key.
 
+        Signatures of another algorithm than the one of the network are rejected.
+
         :param public_key: The public key to verify the signature.
         :type public_key: bytes
+        :param algorithm: Signature algorithm of the network, "RSA" or "Ed25519".
+        :type algorithm: str
         :return: True if the signature is valid, False otherwise.
         :rtype: bool
         """
@@ -134,23 +171,155 @@ class Transaction:
             log.debug("No public key provided")
             return False
 
-        public_key = load_pem_public_key(public_key)
         try:
-            public_key.verify(
-                self.signature,
-                self.calculate_hash().encode(),
-                padding.PSS(
-                    mgf=padding.MGF1(hashes.SHA256()),
-                    salt_length=padding.PSS.MAX_LENGTH,
-                ),
-                hashes.SHA256(),
-            )
+            verify_signature(public_key, self.calculate_hash().encode(), self.signature, algorithm)
             return True
         except Exception as e:
             log.error(f"Signature verification failed: {e}")
             return False
 
 
+class BatchTransaction(Transaction):
+    """
+    Envelope transaction that carries several encrypted payloads,
+    possibly to different recipients, under a single signature.
+
+    The envelope is addressed to BATCH_RECIPIENT and its content is a JSON list
+    of payloads, so it is serialized, hashed and signed as a plain transaction.
+    """
+
+    def __init__(
+        self,
+        sender: bytes = None,
+        recipient: bytes = BATCH_RECIPIENT,
+        amount: float = 0,
+        content: Any = "[]",
+        sign_public_key: bytes = None,
+        signature: bytes = None,
+        timestamp: float = None
+    ):
+        """
+        Initializes a new BatchTransaction instance.
+
+        :param sender: The initiator of the transaction.
+        :type sender: bytes
+        :param recipient: Envelope recipient, always BATCH_RECIPIENT.
+        :type recipient: bytes
+        :param amount: Must be 0, batches do not transfer coins.
+        :type amount: float
+        :param content: JSON list of payloads.
+        :type content: str
+        :param sign_public_key: The public key of the sender for verification.
+        :type sign_public_key: bytes
+        :param signature: The encrypted signature to secure the transaction.
+        :type signature: bytes
+        :param timestamp: The timestamp of the transaction.
+        :type timestamp: float
+        """
+        super().__init__(
+            sender,
+            recipient,
+            amount,
+            content,
+            sign_public_key,
+            signature,
+            timestamp if timestamp is not None else time.time(),
+        )
+        self._payloads = None
+
+    @classmethod
+    def create(
+        cls,
+        sender: bytes,
+        payloads: List[Tuple[bytes, str]],
+        sign_public_key: bytes,
+    ) -> "BatchTransaction":
+        """
+        Creates an unsigned envelope from encrypted payloads.
+
+        :param sender: The initiator of the transaction.
+        :type sender: bytes
+        :param payloads: Pairs of recipient key and encrypted content.
+        :type payloads: List[Tuple[bytes, str]]
+        :param sign_public_key: The public key of the sender for verification.
+        :type sign_public_key: bytes
+        :return: Batch transaction.
+        :rtype: BatchTransaction
+        """
+        content = json.dumps(
+            [
+                {"recipient": recipient.hex(), "content": payload}
+                for recipient, payload in payloads
+            ],
+            ensure_ascii=False,
+        )
+        return cls(sender, content=content, sign_public_key=sign_public_key)
+
+    @property
+    def payloads(self) -> List[Dict[str, str]]:
+        """
+        Parsed payloads of the envelope.
+
+        :return: List of payload dicts with hex recipient and content.
+        :rtype: List[Dict[str, str]]
+        """
+        if self._payloads is None:
+            self._payloads = json.loads(self.content)
+        return self._payloads
+
+    def messages(self) -> List[Transaction]:
+        """
+        Unpacks payloads into per-recipient messages.
+
+        Messages share the envelope's sender, timestamp and signature,
+        they are views for indexing and are not verifiable on their own.
+
+        :return: List of messages.
+        :rtype: List[Transaction]
+        """
+        return [
+            Transaction(
+                self.sender,
+                bytes.fromhex(payload["recipient"]),
+                0,
+                payload["content"],
+                self.sign_public_key,
+                self.signature,
+                self.timestamp,
+            )
+            for payload in self.payloads
+        ]
+
+    def is_valid(self, public_key: bytes, algorithm: str = SIGNATURE_ALGORITHM) -> bool:
+        """
+        Checks the envelope structure and its signature.
+
+        :param public_key: The public key to verify the signature.
+        :type public_key: bytes
+        :param algorithm: Signature algorithm of the network, "RSA" or "Ed25519".
+        :type algorithm: str
+        :return: True if the envelope is valid, False otherwise.
+        :rtype: bool
+        """
+        if self.amount:
+            log.debug("Batch transaction cannot transfer coins")
+            return False
+        try:
+            payloads = self.payloads
+            if not payloads or not all(
+                payload["recipient"] and payload["content"] for payload in payloads
+            ):
+                log.debug("Batch transaction has no valid payloads")
+                return False
+            for payload in payloads:
+                bytes.fromhex(payload["recipient"])
+                bytes.fromhex(payload["content"])
+        except (ValueError, TypeError, KeyError) as e:
+            log.debug(f"Malformed batch transaction: {e}")
+            return False
+        return super().is_valid(public_key, algorithm)
+
+
 if __name__ == "__main__":
     private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
     public_key = private_key.public_key().public_bytes(
@@ -0,0 +1,289 @@
+"""
+    This module represents file attachments. Files are split into chunks,
+    every chunk is encrypted with a key derived from its own content
+    (convergent encryption) and kept in a content-addressed blob store, so equal
+    chunks are stored and transferred once whatever conversation they belong to.
+    Chunk hashes and keys are listed in an encrypted manifest blob, and only the
+    manifest hash and key travel inside the (encrypted) chat message.
+"""
+
+import hashlib
+import os
+import threading
+import json5 as json
+from typing import BinaryIO, Dict, List, Optional, Union
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from utils.config import ATTACHMENT_CHUNK_SIZE
+
+ATTACHMENT_PREFIX = "ATTACHMENT:"
+# Convergent keys are unique per chunk content, so a fixed nonce is never reused with a key
+CONVERGENT_NONCE = bytes(12)
+
+
+def blob_hash(data: bytes) -> str:
+    """
+    Returns address of a blob in the store
+
+    :param data: blob content
+    :type data: bytes
+    :return: SHA-256 hex digest
+    :rtype: str
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """
+    Local content-addressed store of encrypted blobs
+
+    Blobs are files named by their SHA-256 hash, written atomically, so a
+    partially received attachment keeps every complete chunk across restarts.
+
+    :ivar path: store directory
+    :type path: str
+    """
+
+    def __init__(self, path: str):
+        """
+        Initiates store
+
+        :param path: store directory, created if missing
+        :type path: str
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def blob_path(self, hash_hex: str) -> str:
+        """
+        Returns file path of a blob
+
+        :param hash_hex: blob hash
+        :type hash_hex: str
+        :return: file path
+        :rtype: str
+        :raises ValueError: if hash is malformed
+        """
+        if len(hash_hex) != 64 or any(c not in "0123456789abcdef" for c in hash_hex):
+            raise ValueError(f"Invalid blob hash: {hash_hex!r}")
+        return os.path.join(self.path, hash_hex[:2], hash_hex)
+
+    def has(self, hash_hex: str) -> bool:
+        """
+        Checks if blob is stored
+
+        :param hash_hex: blob hash
+        :type hash_hex: str
+        :return: True if blob is stored
+        :rtype: bool
+        """
+        return os.path.exists(self.blob_path(hash_hex))
+
+    def put(self, data: bytes, expected_hash: Optional[str] = None) -> str:
+        """
+        Stores blob, an already stored blob is not written again
+
+        :param data: blob content
+        :type data: bytes
+        :param expected_hash: hash the blob was requested by
+        :type expected_hash: str or None
+        :return: blob hash
+        :rtype: str
+        :raises ValueError: if blob does not match expected hash
+        """
+        hash_hex = blob_hash(data)
+        if expected_hash is not None and hash_hex != expected_hash:
+            raise ValueError(f"Blob does not match hash {expected_hash}")
+        path = self.blob_path(hash_hex)
+        with self.lock:
+            if os.path.exists(path):
+                return hash_hex
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as blob_file:
+                blob_file.write(data)
+            os.replace(tmp_path, path)
+        return hash_hex
+
+    def get(self, hash_hex: str) -> Optional[bytes]:
+        """
+        Returns stored blob
+
+        :param hash_hex: blob hash
+        :type hash_hex: str
+        :return: blob content or None if not stored
+        :rtype: bytes or None
+        """
+        try:
+            with open(self.blob_path(hash_hex), "rb") as blob_file:
+                return blob_file.read()
+        except FileNotFoundError:
+            return None
+
+
+class AttachmentStore:
+    """
+    Chunks, encrypts and reassembles attachments on top of a blob store
+
+    A reference to an attachment is a dict with "name", "size", "manifest"
+    (manifest blob hash) and "key" (hex manifest key).
+
+    :ivar blobs: blob store
+    :type blobs: BlobStore
+    :ivar chunk_size: plaintext chunk size
+    :type chunk_size: int
+    """
+
+    def __init__(self, blobs: BlobStore, chunk_size: int = ATTACHMENT_CHUNK_SIZE):
+        """
+        Initiates attachment store
+
+        :param blobs: blob store
+        :type blobs: BlobStore
+        :param chunk_size: plaintext chunk size
+        :type chunk_size: int
+        """
+        self.blobs = blobs
+        self.chunk_size = chunk_size
+
+    def add(self, source: Union[bytes, BinaryIO], name: str) -> Dict[str, Union[str, int]]:
+        """
+        Stores an attachment
+
+        :param source: file content or binary file object
+        :type source: bytes or BinaryIO
+        :param name: file name shown to recipients
+        :type name: str
+        :return: attachment reference
+        :rtype: Dict[str, Union[str, int]]
+        """
+        read = source.read if hasattr(source, "read") else _BytesReader(source).read
+        chunks = []
+        size = 0
+        while True:
+            chunk = read(self.chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            key = hashlib.sha256(b"attachment chunk" + chunk).digest()
+            ciphertext = AESGCM(key).encrypt(CONVERGENT_NONCE, chunk, None)
+            chunks.append([self.blobs.put(ciphertext), key.hex()])
+
+        manifest_key = AESGCM.generate_key(bit_length=256)
+        nonce = os.urandom(12)
+        manifest = json.dumps({"name": name, "size": size, "chunks": chunks})
+        manifest_hash = self.blobs.put(
+            nonce + AESGCM(manifest_key).encrypt(nonce, manifest.encode(), None)
+        )
+        return {"name": name, "size": size, "manifest": manifest_hash, "key": manifest_key.hex()}
+
+    def manifest(self, reference: Dict) -> Optional[Dict]:
+        """
+        Decrypts manifest of an attachment
+
+        :param reference: attachment reference
+        :type reference: Dict
+        :return: manifest or None if manifest blob is not stored yet
+        :rtype: Dict or None
+        :raises ValueError: if manifest is not authentic
+        """
+        blob = self.blobs.get(reference["manifest"])
+        if blob is None:
+            return None
+        try:
+            plaintext = AESGCM(bytes.fromhex(reference["key"])).decrypt(blob[:12], blob[12:], None)
+        except InvalidTag:
+            raise ValueError("Attachment manifest failed authentication")
+        return json.loads(plaintext.decode())
+
+    def missing(self, reference: Dict) -> List[str]:
+        """
+        Returns hashes of blobs still needed to read an attachment
+
+        The manifest comes first: chunks are known only after it is stored.
+
+        :param reference: attachment reference
+        :type reference: Dict
+        :return: missing blob hashes
+        :rtype: List[str]
+        """
+        manifest = self.manifest(reference)
+        if manifest is None:
+            return [reference["manifest"]]
+        return [chunk_hash for chunk_hash, _ in manifest["chunks"] if not self.blobs.has(chunk_hash)]
+
+    def read(self, reference: Dict, destination: Optional[BinaryIO] = None) -> Optional[bytes]:
+        """
+        Decrypts and reassembles an attachment
+
+        :param reference: attachment reference
+        :type reference: Dict
+        :param destination: binary file object to write to chunk by chunk
+        :type destination: BinaryIO or None
+        :return: file content, None if written to destination
+        :rtype: bytes or None
+        :raises ValueError: if blobs are missing or not authentic
+        """
+        manifest = self.manifest(reference)
+        if manifest is None:
+            raise ValueError("Attachment manifest is missing")
+        parts = []
+        for chunk_hash, key in manifest["chunks"]:
+            blob = self.blobs.get(chunk_hash)
+            if blob is None:
+                raise ValueError(f"Attachment chunk {chunk_hash} is missing")
+            try:
+                chunk = AESGCM(bytes.fromhex(key)).decrypt(CONVERGENT_NONCE, blob, None)
+            except InvalidTag:
+                raise ValueError(f"Attachment chunk {chunk_hash} failed authentication")
+            if destination is not None:
+                destination.write(chunk)
+            else:
+                parts.append(chunk)
+        return None if destination is not None else b"".join(parts)
+
+    @staticmethod
+    def to_message(reference: Dict) -> str:
+        """
+        Serializes reference as a chat message plaintext
+
+        :param reference: attachment reference
+        :type reference: Dict
+        :return: message plaintext
+        :rtype: str
+        """
+        return ATTACHMENT_PREFIX + json.dumps(reference)
+
+    @staticmethod
+    def from_message(plaintext: Optional[str]) -> Optional[Dict]:
+        """
+        Parses reference from a decrypted chat message
+
+        :param plaintext: decrypted message
+        :type plaintext: str or None
+        :return: attachment reference or None if message is not an attachment
+        :rtype: Dict or None
+        """
+        if not plaintext or not plaintext.startswith(ATTACHMENT_PREFIX):
+            return None
+        try:
+            reference = json.loads(plaintext[len(ATTACHMENT_PREFIX):])
+            if all(field in reference for field in ("name", "size", "manifest", "key")):
+                return reference
+        except ValueError:
+            pass
+        return None
+
+
+class _BytesReader:
+    """read() over a bytes object without copying it into a file"""
+
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def read(self, size: int) -> bytes:
+        chunk = bytes(self.data[self.offset:self.offset + size])
+        self.offset += len(chunk)
+        return chunk
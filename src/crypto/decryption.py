@@ -0,0 +1,111 @@
+"""
+    This module represents batch decryption of conversation history.
+    Messages are decrypted in parallel on a thread pool (cryptography
+    primitives release the GIL) and handed back in their original order.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+from utils.config import DECRYPTION_WORKERS, DECRYPTION_DEADLINE
+from utils.logger import Logger
+
+log = Logger("decryption")
+
+# A job is a decrypt function followed by its arguments,
+# e.g. (encryptor.decrypt, ciphertext, associated_data)
+DecryptionJob = Tuple[Callable[..., Optional[str]], Any]
+
+
+def run_job(job: DecryptionJob) -> Optional[str]:
+    """
+    Runs a decryption job, failures are reported as None
+
+    :param job: decrypt function followed by its arguments
+    :type job: DecryptionJob
+    :return: plaintext or None
+    :rtype: str or None
+    """
+    function, *args = job
+    try:
+        return function(*args)
+    except Exception as e:
+        log.debug(f"Error during decryption: {e}")
+        return None
+
+
+class DecryptionService:
+    """
+    Thread pool decrypting pages of messages
+
+    :ivar deadline: default time limit of one request in seconds
+    :type deadline: float
+    :ivar executor: worker pool
+    :type executor: ThreadPoolExecutor
+    """
+
+    def __init__(self, workers: int = DECRYPTION_WORKERS, deadline: float = DECRYPTION_DEADLINE):
+        """
+        Initiates service
+
+        :param workers: number of worker threads
+        :type workers: int
+        :param deadline: default time limit of one request in seconds
+        :type deadline: float
+        """
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decrypt")
+
+    def decrypt(self, jobs: Iterable[DecryptionJob], deadline: Optional[float] = None) -> Iterator[Optional[str]]:
+        """
+        Decrypts messages in parallel and yields plaintexts in job order
+
+        Iteration stops when the deadline passes; jobs that have not started
+        yet are cancelled, so a huge history cannot hold the caller.
+
+        :param jobs: decryption jobs
+        :type jobs: Iterable[DecryptionJob]
+        :param deadline: time limit in seconds, service default if None
+        :type deadline: float or None
+        :return: plaintexts, None for messages that failed to decrypt
+        :rtype: Iterator[str or None]
+        """
+        expires = time.monotonic() + (self.deadline if deadline is None else deadline)
+        futures = [self.executor.submit(run_job, job) for job in jobs]
+        try:
+            for index, future in enumerate(futures):
+                try:
+                    yield future.result(timeout=max(expires - time.monotonic(), 0))
+                except TimeoutError:
+                    log.warning(f"Decryption deadline exceeded, {len(futures) - index} messages skipped")
+                    return
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def decrypt_page(self, jobs: Sequence[DecryptionJob], count: int,
+                     deadline: Optional[float] = None) -> Tuple[int, List[Optional[str]]]:
+        """
+        Decrypts the newest messages of a history, newest first
+
+        Jobs are in history order, oldest first. Only the last ``count`` jobs
+        are run. When the deadline passes, the oldest messages of the page are
+        left out, so the newest ones are always shown.
+
+        :param jobs: decryption jobs of the whole history, oldest first
+        :type jobs: Sequence[DecryptionJob]
+        :param count: maximum number of newest messages to decrypt
+        :type count: int
+        :param deadline: time limit in seconds, service default if None
+        :type deadline: float or None
+        :return: index of the first decrypted job and plaintexts of jobs from it on
+        :rtype: Tuple[int, List[str or None]]
+        """
+        page = jobs[max(len(jobs) - count, 0):]
+        texts = list(self.decrypt(reversed(page), deadline))
+        texts.reverse()
+        return len(jobs) - len(texts), texts
+
+    def shutdown(self) -> None:
+        """Stops worker threads, pending jobs are cancelled"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
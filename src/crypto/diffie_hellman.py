@@ -3,16 +3,26 @@
     to generate public, pravate and shared keys and to validate them.
 """
 
-from cryptography.hazmat.primitives.asymmetric import dh
+from cryptography.hazmat.primitives.asymmetric import dh, x25519
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.serialization import (
-    load_pem_public_key,
     Encoding,
     PublicFormat,
+    PrivateFormat,
+    NoEncryption,
 )
 from cryptography.exceptions import InvalidKey
+from collections import OrderedDict
 from typing import Optional
+import hashlib
+import threading
+from .key_registry import registry
+from utils.config import (
+    SHARED_KEY_CACHE_SIZE,
+    KEY_EXCHANGE_ALGORITHM,
+    DEFAULT_DH_PARAMETERS,
+)
 
 
 class DiffieHellmanKeyExchange:
@@ -25,22 +35,47 @@ class DiffieHellmanKeyExchange:
     :type private_key: DHPrivateKey
     :ivar public_key: public key associated with private key
     :type public_key: DHPublicKey
+    :ivar shared_keys: LRU cache of derived keys by peer key fingerprint
+    :type shared_keys: OrderedDict
     """
 
-    def __init__(self, parameters: Optional[dh.DHParameters] = None):
+    def __init__(self, parameters: Optional[dh.DHParameters] = None,
+                 cache_size: int = SHARED_KEY_CACHE_SIZE,
+                 private_key: Optional[dh.DHPrivateKey] = None):
         """
             Initiates key exchange class
 
             :param parameters: DH parameter group which will be used to \
             generate keys
             :type parameters: DHParameters or None
+            :param cache_size: maximum number of cached shared keys
+            :type cache_size: int
+            :param private_key: existing private key, e.g. loaded from keystore
+            :type private_key: DHPrivateKey or None
         """
 
-        self.parameters = parameters or dh.generate_parameters(
-            generator=2, key_size=2048
-        )
-        self.private_key = self.parameters.generate_private_key()
+        if private_key is not None:
+            self.parameters = private_key.parameters()
+            self.private_key = private_key
+        else:
+            self.parameters = parameters or dh.generate_parameters(
+                generator=2, key_size=2048
+            )
+            self.private_key = self.parameters.generate_private_key()
         self.public_key = self.private_key.public_key()
+        self.init_cache(cache_size)
+
+    def init_cache(self, cache_size: int) -> None:
+        """
+        Creates empty shared key cache, shared by every key exchange backend
+
+        :param cache_size: maximum number of cached shared keys
+        :type cache_size: int
+        """
+        self.cache_size = cache_size
+        self.shared_keys = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
 
     def get_public_key(self):
         """
@@ -53,6 +88,74 @@ class DiffieHellmanKeyExchange:
             Encoding.PEM, PublicFormat.SubjectPublicKeyInfo
         )
 
+    def get_private_key(self) -> bytes:
+        """
+        Returns private key in PEM format
+
+        :return: private key as PEM
+        :rtype: bytes
+        """
+        return self.private_key.private_bytes(
+            Encoding.PEM, PrivateFormat.PKCS8, NoEncryption()
+        )
+
+    @staticmethod
+    def fingerprint(public_key_bytes: bytes) -> bytes:
+        """
+        Returns fingerprint of serialized public key
+
+        :param public_key_bytes: serialized public key
+        :type public_key_bytes: bytes
+        :return: SHA-256 digest of the key
+        :rtype: bytes
+        """
+        return hashlib.sha256(public_key_bytes).digest()
+
+    def get_shared_key(self, peer_public_key_bytes: bytes) -> Optional[bytes]:
+        """
+        Returns cached shared key or derives it once
+
+        Thread-safe: concurrent callers asking for the same peer wait for a
+        single derivation instead of repeating it.
+
+        :param peer_public_key_bytes: other peer's public key in bytes
+        :type peer_public_key_bytes: bytes
+        :return: derived key
+        :rtype: None or bytes
+        """
+        if not isinstance(peer_public_key_bytes, bytes) or not peer_public_key_bytes:
+            return self.generate_shared_key(peer_public_key_bytes)
+
+        fingerprint = self.fingerprint(peer_public_key_bytes)
+        while True:
+            with self.lock:
+                if fingerprint in self.shared_keys:
+                    self.shared_keys.move_to_end(fingerprint)
+                    return self.shared_keys[fingerprint]
+                event = self.in_flight.get(fingerprint)
+                if event is None:
+                    event = threading.Event()
+                    self.in_flight[fingerprint] = event
+                    break
+            event.wait()
+            with self.lock:
+                if fingerprint not in self.shared_keys:
+                    # Derivation failed for the key, do not retry it in a loop
+                    return None
+
+        shared_key = None
+        try:
+            shared_key = self.generate_shared_key(peer_public_key_bytes)
+        finally:
+            with self.lock:
+                if shared_key:
+                    self.shared_keys[fingerprint] = shared_key
+                    if len(self.shared_keys) > self.cache_size:
+                        self.shared_keys.popitem(last=False)
+                del self.in_flight[fingerprint]
+            event.set()
+        return shared_key
+
     def generate_shared_key(self, peer_public_key_bytes: bytes) -> Optional[bytes]:
         """
         Generates shared key based on other peer's public key
@@ -67,7 +170,7 @@ class DiffieHellmanKeyExchange:
             return None
 
         try:
-            peer_public_key = load_pem_public_key(peer_public_key_bytes)
+            peer_public_key = registry.get(peer_public_key_bytes, "pem")
         except InvalidKey as e:
             print(f"Error: Invalid Public Key Format: {e}")
             return None
@@ -88,6 +191,115 @@ class DiffieHellmanKeyExchange:
             return None
 
 
+class X25519KeyExchange(DiffieHellmanKeyExchange):
+    """
+    Key exchange over Curve25519 with the same interface as
+    DiffieHellmanKeyExchange. Public keys are raw 32 bytes instead of PEM.
+
+    :ivar private_key: X25519 private key
+    :type private_key: X25519PrivateKey
+    :ivar public_key: public key associated with private key
+    :type public_key: X25519PublicKey
+    """
+
+    def __init__(self, parameters=None, cache_size: int = SHARED_KEY_CACHE_SIZE,
+                 private_key: Optional[x25519.X25519PrivateKey] = None):
+        """
+            Initiates key exchange class
+
+            :param parameters: ignored, X25519 has fixed domain parameters
+            :type parameters: None
+            :param cache_size: maximum number of cached shared keys
+            :type cache_size: int
+            :param private_key: existing private key, e.g. loaded from keystore
+            :type private_key: X25519PrivateKey or None
+        """
+        self.parameters = None
+        self.private_key = private_key or x25519.X25519PrivateKey.generate()
+        self.public_key = self.private_key.public_key()
+        self.init_cache(cache_size)
+
+    def get_public_key(self):
+        """
+        Returns public key in raw format
+
+        :return: 32-byte public key
+        :rtype: bytes
+        """
+        return self.public_key.public_bytes(Encoding.Raw, PublicFormat.Raw)
+
+    def get_private_key(self) -> bytes:
+        """
+        Returns private key in raw format
+
+        :return: 32-byte private key
+        :rtype: bytes
+        """
+        return self.private_key.private_bytes(
+            Encoding.Raw, PrivateFormat.Raw, NoEncryption()
+        )
+
+    def generate_shared_key(self, peer_public_key_bytes: bytes) -> Optional[bytes]:
+        """
+        Generates shared key based on other peer's public key
+
+        :param peer_public_key_bytes: other peer's raw public key
+        :type peer_public_key_bytes: bytes
+        :return: derived key
+        :rtype: None or bytes
+        """
+        if peer_public_key_bytes is None:
+            print("Error: Peer public key cannot be None.")
+            return None
+
+        try:
+            peer_public_key = registry.get(peer_public_key_bytes, "x25519")
+        except Exception as e:
+            print(f"Error during key loading: {e}")
+            return None
+
+        try:
+            shared_key = self.private_key.exchange(peer_public_key)
+
+            derived_key = HKDF(
+                algorithm=hashes.SHA256(), length=32, salt=None, info=b"x25519 key exchange"
+            ).derive(shared_key)
+
+            return derived_key
+        except Exception as e:
+            print(f"Error during key exchange: {e}")
+            return None
+
+
+def key_exchange_algorithm(public_key_bytes: bytes) -> str:
+    """
+    Returns key exchange backend of a serialized public key
+
+    :param public_key_bytes: serialized public key
+    :type public_key_bytes: bytes
+    :return: "X25519" for raw 32-byte keys, "DH" otherwise
+    :rtype: str
+    """
+    return "X25519" if len(public_key_bytes) == 32 else "DH"
+
+
+def create_key_exchange(algorithm: str = KEY_EXCHANGE_ALGORITHM):
+    """
+    Creates key exchange backend selected in config
+
+    :param algorithm: "DH" (2048-bit MODP group) or "X25519"
+    :type algorithm: str
+    :return: key exchange manager
+    :rtype: DiffieHellmanKeyExchange
+    :raises ValueError: if algorithm is unknown
+    """
+    if algorithm == "X25519":
+        return X25519KeyExchange()
+    if algorithm == "DH":
+        return DiffieHellmanKeyExchange(DEFAULT_DH_PARAMETERS)
+    raise ValueError(f"Unknown key exchange algorithm: {algorithm}")
+
+
 if __name__ == "__main__":
     shared_parameters = dh.generate_parameters(generator=2, key_size=2048)
 
@@ -7,9 +7,100 @@
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives import padding
 from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.exceptions import InvalidTag
+from functools import lru_cache
 import os
-from typing import Optional
+import zlib
+from typing import List, Optional, Sequence
+
+# Flag bytes prepended to plaintext in compress mode. They are never valid
+# in UTF-8, so plaintexts encrypted without a flag are still recognised.
+FLAG_RAW = 0xC0
+FLAG_ZLIB = 0xC1
+
+MIN_COMPRESSION_THRESHOLD = 64
+MAX_COMPRESSION_THRESHOLD = 4096
+MAX_DECOMPRESSED_SIZE = 1024 * 1024
+
+# Cipher suite names accepted in config and their (algorithm, mode) pairs
+CIPHER_SUITES = {
+    "AES-256-CBC": ("AES", "CBC"),
+    "AES-256-GCM": ("AES", "GCM"),
+    "ChaCha20-Poly1305": ("ChaCha20", "Poly1305"),
+}
+AEAD_MODES = {("AES", "GCM"): AESGCM, ("ChaCha20", "Poly1305"): ChaCha20Poly1305}
+AEAD_NONCE_SIZE = 12
+AEAD_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=AEAD_CACHE_SIZE)
+def get_aead(algorithm: str, mode: str, key: bytes):
+    """
+    Returns reusable AEAD object for a key
+
+    AEAD objects keep no per-message state, so one instance per key is
+    shared by every SymmetricEncryption and thread using that key.
+
+    :param algorithm: cipher algorithm, "AES" or "ChaCha20"
+    :type algorithm: str
+    :param mode: AEAD mode, "GCM" or "Poly1305"
+    :type mode: str
+    :param key: 32-byte key
+    :type key: bytes
+    :return: AEAD cipher
+    :rtype: AESGCM or ChaCha20Poly1305
+    """
+    return AEAD_MODES[(algorithm, mode)](key)
+
+
+def message_associated_data(sender: bytes, recipient: bytes) -> bytes:
+    """
+    Builds associated data binding a ciphertext to its sender and recipient
+
+    :param sender: sender public key
+    :type sender: bytes
+    :param recipient: recipient public key or group id
+    :type recipient: bytes
+    :return: associated data
+    :rtype: bytes
+    """
+    return len(sender).to_bytes(4, "big") + sender + recipient
+
+
+class CompressionThreshold:
+    """
+    Adaptive size threshold below which messages are not compressed
+
+    The threshold grows when compression does not pay off and shrinks back
+    when it does, so tiny or incompressible messages skip zlib.
+
+    :ivar value: current threshold in bytes
+    :type value: int
+    """
+
+    def __init__(self, value: int = MIN_COMPRESSION_THRESHOLD):
+        """
+        Initiates threshold
+
+        :param value: initial threshold in bytes
+        :type value: int
+        """
+        self.value = value
+
+    def record(self, raw_size: int, compressed_size: int) -> None:
+        """
+        Adapts threshold to the result of a compression attempt
+
+        :param raw_size: plaintext size
+        :type raw_size: int
+        :param compressed_size: compressed plaintext size
+        :type compressed_size: int
+        """
+        if compressed_size >= raw_size:
+            self.value = min(self.value * 2, MAX_COMPRESSION_THRESHOLD)
+        else:
+            self.value = max(self.value // 2, MIN_COMPRESSION_THRESHOLD)
 
 
 class SymmetricEncryption:
@@ -18,9 +109,14 @@ class SymmetricEncryption:
 
     :ivar key: key that will be used to encrypt message
     :type key: bytes
+    :ivar compress: whether plaintext is compressed before encryption
+    :type compress: bool
+    :ivar threshold: adaptive compression threshold of this encryptor
+    :type threshold: CompressionThreshold
     """
 
-    def __init__(self, key: bytes, algorithm="AES", mode="CBC"):
+    def __init__(self, key: bytes, algorithm="AES", mode="CBC", compress=False,
+                 threshold: Optional[CompressionThreshold] = None):
         """
         Initiates with the given key
 
@@ -30,17 +126,101 @@ class SymmetricEncryption:
         :type algorithm: str
         :param mode: work mode of encrypt algorithm
         :type mode: str
+        :param compress: compress plaintext with zlib before encryption
+        :type compress: bool
+        :param threshold: adaptive compression threshold, a new one by default
+        :type threshold: CompressionThreshold or None
         """
         self.key = key
         self.algorithm = algorithm
         self.mode = mode
+        self.compress = compress
+        self.threshold = threshold or CompressionThreshold()
+        self.aead = get_aead(algorithm, mode, key) if self.is_aead else None
+
+    @classmethod
+    def from_suite(cls, key: bytes, suite: str, compress=False,
+                   threshold: Optional[CompressionThreshold] = None) -> "SymmetricEncryption":
+        """
+        Creates encryptor by cipher suite name
 
-    def encrypt(self, plaintext: str) -> Optional[bytes]:
+        :param key: key that will be used to encrypt message
+        :type key: bytes
+        :param suite: one of CIPHER_SUITES, e.g. "AES-256-GCM"
+        :type suite: str
+        :param compress: compress plaintext with zlib before encryption
+        :type compress: bool
+        :param threshold: adaptive compression threshold, a new one by default
+        :type threshold: CompressionThreshold or None
+        :return: encryptor
+        :rtype: SymmetricEncryption
+        :raises ValueError: if suite is unknown
+        """
+        if suite not in CIPHER_SUITES:
+            raise ValueError(f"Unknown cipher suite: {suite}")
+        algorithm, mode = CIPHER_SUITES[suite]
+        return cls(key, algorithm=algorithm, mode=mode, compress=compress, threshold=threshold)
+
+    @property
+    def is_aead(self) -> bool:
+        """
+        Whether encryptor uses authenticated encryption
+
+        :return: True for GCM and Poly1305 modes
+        :rtype: bool
+        """
+        return (self.algorithm, self.mode) in AEAD_MODES
+
+    def pack(self, plaintext_bytes: bytes) -> bytes:
+        """
+        Prepends compression flag and compresses plaintext if it pays off
+
+        :param plaintext_bytes: encoded message
+        :type plaintext_bytes: bytes
+        :return: flagged plaintext
+        :rtype: bytes
+        """
+        if len(plaintext_bytes) >= self.threshold.value:
+            compressed = zlib.compress(plaintext_bytes, 9)
+            self.threshold.record(len(plaintext_bytes), len(compressed))
+            if len(compressed) < len(plaintext_bytes):
+                return bytes([FLAG_ZLIB]) + compressed
+        return bytes([FLAG_RAW]) + plaintext_bytes
+
+    @staticmethod
+    def unpack(data: bytes) -> bytes:
+        """
+        Removes compression flag and decompresses plaintext if needed
+
+        Data without a flag byte is returned as is.
+
+        :param data: decrypted plaintext
+        :type data: bytes
+        :return: encoded message
+        :rtype: bytes
+        :raises ValueError: if compressed data is too large, truncated or padded
+        """
+        if data[:1] == bytes([FLAG_RAW]):
+            return data[1:]
+        if data[:1] == bytes([FLAG_ZLIB]):
+            decompressor = zlib.decompressobj()
+            plaintext = decompressor.decompress(data[1:], MAX_DECOMPRESSED_SIZE)
+            if decompressor.unconsumed_tail:
+                raise ValueError("Decompressed message is too large")
+            if not decompressor.eof or decompressor.unused_data:
+                raise ValueError("Compressed message is truncated or padded")
+            return plaintext
+        return data
+
+    def encrypt(self, plaintext: str, associated_data: Optional[bytes] = None) -> Optional[bytes]:
         """
         Encrypts the message
 
         :param plaintext: message to be encrypted
         :type plaintext: str
+        :param associated_data: data authenticated along with the message, \
+        used by AEAD modes only
+        :type associated_data: bytes or None
         :return: encrypted message
         :rtype: bytes
         """
@@ -48,8 +228,13 @@ class SymmetricEncryption:
             return None
 
         plaintext_bytes = plaintext.encode()
+        if self.compress:
+            plaintext_bytes = self.pack(plaintext_bytes)
 
-        if self.algorithm == "AES" and self.mode == "CBC":
+        if self.aead:
+            nonce = os.urandom(AEAD_NONCE_SIZE)
+            return nonce + self.aead.encrypt(nonce, plaintext_bytes, associated_data)
+        elif self.algorithm == "AES" and self.mode == "CBC":
             iv = os.urandom(16)
             cipher = Cipher(
                 algorithms.AES(self.key), modes.CBC(iv), backend=default_backend()
@@ -65,19 +250,37 @@ class SymmetricEncryption:
             print("Unsupported algorithm or mode")
             return None
 
-    def decrypt(self, ciphertext: bytes) -> Optional[str]:
+    def decrypt(self, ciphertext: bytes, associated_data: Optional[bytes] = None) -> Optional[str]:
         """
         Decrypts the message
 
         :param ciphertext: the message to be decrypted
         :type ciphertext: bytes
+        :param associated_data: data authenticated along with the message, \
+        used by AEAD modes only
+        :type associated_data: bytes or None
         :return: the decrypted message
         :rtype: str
         """
         if not ciphertext:
             return None
 
-        if self.algorithm == "AES" and self.mode == "CBC":
+        if self.aead:
+            if len(ciphertext) < AEAD_NONCE_SIZE:
+                print(f"Ciphertext too short for {self.mode} mode")
+                return None
+            try:
+                plaintext = self.aead.decrypt(
+                    ciphertext[:AEAD_NONCE_SIZE], ciphertext[AEAD_NONCE_SIZE:], associated_data
+                )
+                return self.unpack(plaintext).decode()
+            except InvalidTag:
+                print(f"Error during decryption in {self.mode} mode: authentication failed")
+                return None
+            except Exception as e:
+                print(f"Error during decryption in {self.mode} mode: {e}")
+                return None
+        elif self.algorithm == "AES" and self.mode == "CBC":
             if len(ciphertext) < 16:
                 print("Ciphertext too short for CBC mode")
                 return None
@@ -94,7 +297,7 @@ class SymmetricEncryption:
 
                 unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
                 plaintext = unpadder.update(padded_data) + unpadder.finalize()
-                return plaintext.decode()
+                return self.unpack(plaintext).decode()
             except Exception as e:
                 print(f"Error during decryption in CBC mode: {e}")
                 return None
@@ -102,6 +305,42 @@ class SymmetricEncryption:
             print("Unsupported algorithm or mode")
             return None
 
+    def encrypt_many(self, plaintexts: Sequence[str],
+                     associated_data: Optional[Sequence[Optional[bytes]]] = None) -> List[Optional[bytes]]:
+        """
+        Encrypts several messages with the same key
+
+        :param plaintexts: messages to be encrypted
+        :type plaintexts: Sequence[str]
+        :param associated_data: associated data per message
+        :type associated_data: Sequence[bytes] or None
+        :return: encrypted messages in the same order
+        :rtype: List[bytes or None]
+        """
+        associated_data = associated_data or [None] * len(plaintexts)
+        return [
+            self.encrypt(plaintext, data)
+            for plaintext, data in zip(plaintexts, associated_data)
+        ]
+
+    def decrypt_many(self, ciphertexts: Sequence[bytes],
+                     associated_data: Optional[Sequence[Optional[bytes]]] = None) -> List[Optional[str]]:
+        """
+        Decrypts several messages with the same key
+
+        :param ciphertexts: messages to be decrypted
+        :type ciphertexts: Sequence[bytes]
+        :param associated_data: associated data per message
+        :type associated_data: Sequence[bytes] or None
+        :return: decrypted messages in the same order, None for failed ones
+        :rtype: List[str or None]
+        """
+        associated_data = associated_data or [None] * len(ciphertexts)
+        return [
+            self.decrypt(ciphertext, data)
+            for ciphertext, data in zip(ciphertexts, associated_data)
+        ]
+
 
 if __name__ == "__main__":
 
@@ -0,0 +1,299 @@
+"""
+    This module represents group chats. Every group has its own symmetric
+    key, which is distributed once to members over their pairwise DH channels,
+    so each group message is encrypted and signed only once.
+"""
+
+import os
+import threading
+import json5 as json
+from typing import Dict, List, Optional, Set, Tuple
+from .encryption import SymmetricEncryption, message_associated_data
+from blockchain.transaction import GROUP_PREFIX
+from utils.config import COMPRESS_MESSAGES, ENCRYPTION_ALGORITHM
+
+GROUP_INVITE_PREFIX = "GROUP_INVITE:"
+
+
+class Group:
+    """
+    Group chat description
+
+    :ivar group_id: group address used as transaction recipient
+    :type group_id: bytes
+    :ivar name: group display name
+    :type name: str
+    :ivar key: group symmetric key
+    :type key: bytes
+    :ivar members: DH public keys of group members
+    :type members: List[bytes]
+    """
+
+    def __init__(self, group_id: bytes, name: str, key: bytes, members: List[bytes]):
+        """
+        Initiates group
+
+        :param group_id: group address used as transaction recipient
+        :type group_id: bytes
+        :param name: group display name
+        :type name: str
+        :param key: group symmetric key
+        :type key: bytes
+        :param members: DH public keys of group members
+        :type members: List[bytes]
+        """
+        self.group_id = group_id
+        self.name = name
+        self.key = key
+        self.members = members
+        self.encryptor = SymmetricEncryption.from_suite(
+            key, ENCRYPTION_ALGORITHM, compress=COMPRESS_MESSAGES
+        )
+
+
+class GroupManager:
+    """
+    Class manages groups local peer is a member of
+
+    Groups are not stored locally, they are rebuilt from invitations in the
+    chain, which only the local DH key can decrypt.
+
+    :ivar dh_key_manager: local DH key manager used for pairwise channels
+    :type dh_key_manager: DiffieHellmanKeyExchange
+    :ivar groups: known groups by group id
+    :type groups: Dict[bytes, Group]
+    :ivar replayed: hashes of blocks and pending transactions already searched for invitations
+    :type replayed: Set[str]
+    """
+
+    def __init__(self, dh_key_manager):
+        """
+        Initiates group manager
+
+        :param dh_key_manager: local DH key manager used for pairwise channels
+        :type dh_key_manager: DiffieHellmanKeyExchange
+        """
+        self.dh_key_manager = dh_key_manager
+        self.groups: Dict[bytes, Group] = {}
+        self.replayed: Set[str] = set()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def is_group_id(address: Optional[bytes]) -> bool:
+        """
+        Checks if address belongs to a group
+
+        :param address: transaction recipient
+        :type address: bytes or None
+        :return: if address is a group id
+        :rtype: bool
+        """
+        return bool(address) and address.startswith(GROUP_PREFIX)
+
+    def create_group(self, name: str, members: List[bytes]) -> Group:
+        """
+        Creates new group with a fresh symmetric key
+
+        :param name: group display name
+        :type name: str
+        :param members: DH public keys of members, including local peer
+        :type members: List[bytes]
+        :return: created group
+        :rtype: Group
+        """
+        group = Group(GROUP_PREFIX + os.urandom(16), name, os.urandom(32), members)
+        with self.lock:
+            self.groups[group.group_id] = group
+        return group
+
+    def get_group(self, group_id: bytes) -> Optional[Group]:
+        """
+        Returns group by its id
+
+        :param group_id: group id
+        :type group_id: bytes
+        :return: group or None
+        :rtype: Group or None
+        """
+        return self.groups.get(group_id)
+
+    def find_group(self, name: str) -> Optional[Group]:
+        """
+        Returns group by its display name
+
+        :param name: group display name
+        :type name: str
+        :return: group or None
+        :rtype: Group or None
+        """
+        for group in list(self.groups.values()):
+            if group.name == name:
+                return group
+        return None
+
+    def invitation_payloads(self, group: Group) -> List[Tuple[bytes, str]]:
+        """
+        Encrypts group key for every other member with pairwise shared keys
+
+        :param group: group to distribute
+        :type group: Group
+        :return: pairs of member key and encrypted invitation (hex)
+        :rtype: List[Tuple[bytes, str]]
+        """
+        invitation = GROUP_INVITE_PREFIX + json.dumps(
+            {
+                "group_id": group.group_id.hex(),
+                "name": group.name,
+                "key": group.key.hex(),
+                "members": [member.hex() for member in group.members],
+            }
+        )
+        own_key = self.dh_key_manager.get_public_key()
+        payloads = []
+        for member in group.members:
+            if member == own_key:
+                continue
+            shared_key = self.dh_key_manager.get_shared_key(member)
+            if not shared_key:
+                print("Error: Could not derive shared key for group member.")
+                continue
+            encryptor = SymmetricEncryption.from_suite(shared_key, ENCRYPTION_ALGORITHM)
+            encrypted = encryptor.encrypt(invitation, message_associated_data(own_key, member))
+            payloads.append((member, encrypted.hex()))
+        return payloads
+
+    def accept_invitation(self, plaintext: str) -> Optional[Group]:
+        """
+        Registers group from decrypted invitation
+
+        :param plaintext: decrypted pairwise message
+        :type plaintext: str
+        :return: joined group or None if message is not an invitation
+        :rtype: Group or None
+        """
+        if not plaintext or not plaintext.startswith(GROUP_INVITE_PREFIX):
+            return None
+        try:
+            data = json.loads(plaintext[len(GROUP_INVITE_PREFIX):])
+            group = Group(
+                bytes.fromhex(data["group_id"]),
+                data["name"],
+                bytes.fromhex(data["key"]),
+                [bytes.fromhex(member) for member in data["members"]],
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Error: Malformed group invitation: {e}")
+            return None
+        with self.lock:
+            self.groups.setdefault(group.group_id, group)
+        return self.groups[group.group_id]
+
+    def process_transaction(self, transaction) -> List[Group]:
+        """
+        Joins groups from invitations addressed to local peer
+        or sent by it, the latter restore groups it created
+
+        :param transaction: received transaction
+        :type transaction: Transaction
+        :return: joined groups
+        :rtype: List[Group]
+        """
+        own_key = self.dh_key_manager.get_public_key()
+        joined = []
+        for message in transaction.messages():
+            if not message.sender or not message.recipient:
+                continue
+            if message.recipient == own_key:
+                peer_key = message.sender
+            elif message.sender == own_key:
+                peer_key = message.recipient
+            else:
+                continue
+            shared_key = self.dh_key_manager.get_shared_key(peer_key)
+            if not shared_key:
+                continue
+            encryptor = SymmetricEncryption.from_suite(shared_key, ENCRYPTION_ALGORITHM)
+            try:
+                plaintext = encryptor.decrypt(
+                    bytes.fromhex(message.content),
+                    message_associated_data(message.sender, message.recipient),
+                )
+            except ValueError:
+                continue
+            group = self.accept_invitation(plaintext)
+            if group and group not in joined:
+                joined.append(group)
+        return joined
+
+    def replay(self, blockchain) -> List[Group]:
+        """
+        Rebuilds groups from invitations in a chain and its pending transactions
+
+        Blocks and transactions searched by an earlier call are skipped, so it
+        can be called again whenever the chain grows
+
+        :param blockchain: main chain or shard sub-chain
+        :type blockchain: Blockchain
+        :return: groups that were not known before
+        :rtype: List[Group]
+        """
+        known = set(self.groups)
+        joined = []
+        transactions = []
+        for block in list(blockchain.chain):
+            if block.hash not in self.replayed:
+                self.replayed.add(block.hash)
+                transactions.extend(block.transactions)
+        for transaction in list(blockchain.pending_transactions):
+            transaction_hash = transaction.calculate_hash()
+            if transaction_hash not in self.replayed:
+                self.replayed.add(transaction_hash)
+                transactions.append(transaction)
+        for transaction in transactions:
+            try:
+                groups = self.process_transaction(transaction)
+            except (ValueError, TypeError, KeyError):
+                continue  # Malformed transaction cannot carry an invitation
+            joined.extend(
+                group for group in groups if group.group_id not in known and group not in joined
+            )
+        return joined
+
+    def encrypt(self, group_id: bytes, plaintext: str,
+                associated_data: Optional[bytes] = None) -> Optional[bytes]:
+        """
+        Encrypts message with group key
+
+        :param group_id: group id
+        :type group_id: bytes
+        :param plaintext: message to be encrypted
+        :type plaintext: str
+        :param associated_data: data authenticated along with the message
+        :type associated_data: bytes or None
+        :return: encrypted message or None for unknown group
+        :rtype: bytes or None
+        """
+        group = self.get_group(group_id)
+        if not group:
+            print("Error: Unknown group.")
+            return None
+        return group.encryptor.encrypt(plaintext, associated_data)
+
+    def decrypt(self, group_id: bytes, ciphertext: bytes,
+                associated_data: Optional[bytes] = None) -> Optional[str]:
+        """
+        Decrypts message with group key
+
+        :param group_id: group id
+        :type group_id: bytes
+        :param ciphertext: the message to be decrypted
+        :type ciphertext: bytes
+        :param associated_data: data authenticated along with the message
+        :type associated_data: bytes or None
+        :return: decrypted message or None for unknown group
+        :rtype: str or None
+        """
+        group = self.get_group(group_id)
+        if not group:
+            return None
+        return group.encryptor.decrypt(ciphertext, associated_data)
@@ -0,0 +1,101 @@
+"""
+    This module represents the process-wide registry of parsed public keys.
+    Peers reuse the same few keys for every transaction and exchange, so keys
+    are parsed once and looked up by fingerprint afterwards.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict
+from cryptography.hazmat.primitives.asymmetric import ed25519, x25519
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
+from utils.config import KEY_REGISTRY_SIZE
+
+LOADERS = {
+    "pem": load_pem_public_key,
+    "ed25519": ed25519.Ed25519PublicKey.from_public_bytes,
+    "x25519": x25519.X25519PublicKey.from_public_bytes,
+}
+
+
+class PublicKeyRegistry:
+    """
+    LRU cache of parsed public keys by format and fingerprint
+
+    Keys that fail to parse are not cached, the loader error is raised.
+
+    :ivar capacity: maximum number of cached keys
+    :type capacity: int
+    :ivar hits: number of lookups served from cache
+    :type hits: int
+    :ivar misses: number of lookups that parsed the key
+    :type misses: int
+    """
+
+    def __init__(self, capacity: int = KEY_REGISTRY_SIZE):
+        """
+        Initiates registry
+
+        :param capacity: maximum number of cached keys
+        :type capacity: int
+        """
+        self.capacity = capacity
+        self.keys = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key_bytes: bytes, kind: str = "pem") -> Any:
+        """
+        Returns parsed public key, parsing it on first use
+
+        :param key_bytes: serialized public key
+        :type key_bytes: bytes
+        :param kind: key format, one of LOADERS
+        :type kind: str
+        :return: public key object
+        :rtype: Any
+        :raises ValueError: if key cannot be parsed
+        """
+        fingerprint = (kind, hashlib.sha256(key_bytes).digest())
+        with self.lock:
+            key = self.keys.get(fingerprint)
+            if key is not None:
+                self.keys.move_to_end(fingerprint)
+                self.hits += 1
+                return key
+            self.misses += 1
+
+        key = LOADERS[kind](key_bytes)
+        with self.lock:
+            self.keys[fingerprint] = key
+            if len(self.keys) > self.capacity:
+                self.keys.popitem(last=False)
+        return key
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns cache statistics
+
+        :return: hits, misses, size and hit rate
+        :rtype: Dict[str, float]
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.keys),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        """Drops cached keys and resets statistics"""
+        with self.lock:
+            self.keys.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+registry = PublicKeyRegistry()
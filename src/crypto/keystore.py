@@ -0,0 +1,205 @@
+"""
+    This module represents the on-disk identity keystore. DH and signing
+    private keys are kept encrypted with a key derived from a passphrase
+    (scrypt + AES-GCM), so the identity survives restarts and loads without
+    generating new keys.
+"""
+
+import json
+import os
+import threading
+from typing import Optional, Tuple
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.asymmetric import x25519
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+from .diffie_hellman import DiffieHellmanKeyExchange, X25519KeyExchange, create_key_exchange
+from .signatures import DigitalSignature
+from utils.config import (
+    KEYSTORE_SCRYPT_N,
+    KEY_EXCHANGE_ALGORITHM,
+    SIGNATURE_ALGORITHM,
+)
+from utils.logger import Logger
+
+log = Logger("keystore")
+
+KEYSTORE_VERSION = 1
+
+
+class Keystore:
+    """
+    Passphrase-protected storage of the local identity
+
+    The file is JSON with scrypt parameters, salt, nonce and the AES-GCM
+    encrypted key material. The parameters are authenticated as associated
+    data, so they cannot be weakened without the passphrase.
+
+    :ivar path: keystore file path
+    :type path: str
+    :ivar scrypt_n: scrypt cost parameter for new keystores
+    :type scrypt_n: int
+    """
+
+    def __init__(self, path: str, scrypt_n: int = KEYSTORE_SCRYPT_N):
+        """
+        Initiates keystore
+
+        :param path: keystore file path
+        :type path: str
+        :param scrypt_n: scrypt cost parameter for new keystores
+        :type scrypt_n: int
+        """
+        self.path = path
+        self.scrypt_n = scrypt_n
+        self.spare = None
+        self.spare_thread = None
+
+    def exists(self) -> bool:
+        """
+        Checks if identity was saved
+
+        :return: True if keystore file exists
+        :rtype: bool
+        """
+        return os.path.exists(self.path)
+
+    @staticmethod
+    def derive_key(passphrase: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+        """
+        Derives keystore encryption key from passphrase
+
+        :param passphrase: user passphrase
+        :type passphrase: str
+        :param salt: random salt
+        :type salt: bytes
+        :param n: scrypt cost parameter
+        :type n: int
+        :param r: scrypt block size
+        :type r: int
+        :param p: scrypt parallelization
+        :type p: int
+        :return: 32-byte key
+        :rtype: bytes
+        """
+        return Scrypt(salt=salt, length=32, n=n, r=r, p=p).derive(passphrase.encode())
+
+    def save(self, passphrase: str, key_exchange: DiffieHellmanKeyExchange,
+             signer: DigitalSignature) -> None:
+        """
+        Encrypts and writes identity keys
+
+        :param passphrase: user passphrase
+        :type passphrase: str
+        :param key_exchange: DH key manager
+        :type key_exchange: DiffieHellmanKeyExchange
+        :param signer: signature manager
+        :type signer: DigitalSignature
+        """
+        header = {
+            "version": KEYSTORE_VERSION,
+            "kdf": "scrypt",
+            "salt": os.urandom(16).hex(),
+            "n": self.scrypt_n,
+            "r": 8,
+            "p": 1,
+        }
+        identity = json.dumps({
+            "key_exchange": "X25519" if isinstance(key_exchange, X25519KeyExchange) else "DH",
+            "key_exchange_private_key": key_exchange.get_private_key().hex(),
+            "signature_algorithm": signer.algorithm,
+            "signature_private_key": signer.get_private_key().hex(),
+        })
+        key = self.derive_key(passphrase, bytes.fromhex(header["salt"]), header["n"], header["r"], header["p"])
+        nonce = os.urandom(12)
+        associated_data = json.dumps(header, sort_keys=True).encode()
+        data = dict(header)
+        data["nonce"] = nonce.hex()
+        data["ciphertext"] = AESGCM(key).encrypt(nonce, identity.encode(), associated_data).hex()
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as keystore_file:
+            keystore_file.write(json.dumps(data))
+            keystore_file.flush()
+            os.fsync(keystore_file.fileno())
+        os.replace(tmp_path, self.path)
+        log.info(f"Identity saved to {self.path}")
+
+    def load(self, passphrase: str) -> Tuple[DiffieHellmanKeyExchange, DigitalSignature]:
+        """
+        Reads and decrypts identity keys
+
+        :param passphrase: user passphrase
+        :type passphrase: str
+        :return: DH key manager and signature manager
+        :rtype: Tuple[DiffieHellmanKeyExchange, DigitalSignature]
+        :raises ValueError: if passphrase is wrong or keystore is corrupted
+        """
+        with open(self.path, "r") as keystore_file:
+            data = json.loads(keystore_file.read())
+        if data.get("version") != KEYSTORE_VERSION or data.get("kdf") != "scrypt":
+            raise ValueError("Unsupported keystore format")
+
+        header = {field: data[field] for field in ("version", "kdf", "salt", "n", "r", "p")}
+        key = self.derive_key(passphrase, bytes.fromhex(header["salt"]), header["n"], header["r"], header["p"])
+        try:
+            identity = json.loads(AESGCM(key).decrypt(
+                bytes.fromhex(data["nonce"]),
+                bytes.fromhex(data["ciphertext"]),
+                json.dumps(header, sort_keys=True).encode(),
+            ).decode())
+        except InvalidTag:
+            raise ValueError("Wrong passphrase or corrupted keystore")
+
+        exchange_key = bytes.fromhex(identity["key_exchange_private_key"])
+        if identity["key_exchange"] == "X25519":
+            key_exchange = X25519KeyExchange(
+                private_key=x25519.X25519PrivateKey.from_private_bytes(exchange_key)
+            )
+        else:
+            key_exchange = DiffieHellmanKeyExchange(
+                private_key=load_pem_private_key(exchange_key, password=None)
+            )
+        # Key material is authenticated by AES-GCM, the slow RSA consistency check is redundant
+        signer = DigitalSignature(private_key=load_pem_private_key(
+            bytes.fromhex(identity["signature_private_key"]),
+            password=None,
+            unsafe_skip_rsa_key_validation=True,
+        ))
+        return key_exchange, signer
+
+    def pregenerate(self, key_exchange_algorithm: str = KEY_EXCHANGE_ALGORITHM,
+                    signature_algorithm: str = SIGNATURE_ALGORITHM) -> None:
+        """
+        Starts generating a key pair for a new profile in background
+
+        :param key_exchange_algorithm: key exchange backend
+        :type key_exchange_algorithm: str
+        :param signature_algorithm: signature algorithm
+        :type signature_algorithm: str
+        """
+        def generate():
+            self.spare = (
+                create_key_exchange(key_exchange_algorithm),
+                DigitalSignature(algorithm=signature_algorithm),
+            )
+
+        if self.spare_thread is None:
+            self.spare_thread = threading.Thread(target=generate, daemon=True)
+            self.spare_thread.start()
+
+    def take_spare(self) -> Optional[Tuple[DiffieHellmanKeyExchange, DigitalSignature]]:
+        """
+        Returns pre-generated key pair, waiting for generation to finish
+
+        :return: DH key manager and signature manager, None if pre-generation was not started
+        :rtype: Tuple[DiffieHellmanKeyExchange, DigitalSignature] or None
+        """
+        if self.spare_thread is None:
+            return None
+        self.spare_thread.join()
+        spare, self.spare, self.spare_thread = self.spare, None, None
+        return spare
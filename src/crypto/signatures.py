@@ -2,16 +2,16 @@
     This module represents digital signatures and handles message signing.
 """
 
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric import rsa, padding, ed25519
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.serialization import (
-    load_pem_public_key,
     Encoding,
     PrivateFormat,
     NoEncryption,
     PublicFormat,
 )
 from cryptography import exceptions
+from .key_registry import registry
 from typing import Optional
 import os
 
@@ -24,31 +24,109 @@ else:
     from utils.logger import Logger
     log = Logger("signatures")
 
+SIGNATURE_ALGORITHMS = ("RSA", "Ed25519")
+RSA_PADDING = padding.PSS(
+    mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH
+)
+
+
+def load_public_key(public_key_bytes: bytes):
+    """
+    Loads signer's public key, detecting its type by format
+
+    Ed25519 keys are raw 32 bytes, RSA keys are PEM. Parsed keys are
+    cached in the process-wide key registry.
+
+    :param public_key_bytes: serialized public key
+    :type public_key_bytes: bytes
+    :return: public key
+    :rtype: Ed25519PublicKey or RSAPublicKey
+    """
+    if len(public_key_bytes) == 32:
+        return registry.get(public_key_bytes, "ed25519")
+    return registry.get(public_key_bytes, "pem")
+
+
+def key_algorithm(public_key_bytes: bytes) -> str:
+    """
+    Returns signature algorithm of a serialized public key
+
+    :param public_key_bytes: serialized public key
+    :type public_key_bytes: bytes
+    :return: "Ed25519" for raw 32-byte keys, "RSA" otherwise
+    :rtype: str
+    """
+    return "Ed25519" if len(public_key_bytes) == 32 else "RSA"
+
+
+def verify_signature(public_key_bytes: bytes, data: bytes, signature: bytes,
+                     algorithm: Optional[str] = None) -> None:
+    """
+    Verifies signature of data
+
+    :param public_key_bytes: serialized signer's public key
+    :type public_key_bytes: bytes
+    :param data: signed data
+    :type data: bytes
+    :param signature: signature of data
+    :type signature: bytes
+    :param algorithm: required signature algorithm, keys of any supported algorithm if None
+    :type algorithm: str or None
+    :raises InvalidSignature: if signature is not valid or key uses another algorithm
+    """
+    if algorithm is not None and key_algorithm(public_key_bytes) != algorithm:
+        raise exceptions.InvalidSignature(
+            f"{key_algorithm(public_key_bytes)} key, {algorithm} signature is required"
+        )
+    public_key = load_public_key(public_key_bytes)
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        public_key.verify(signature, data)
+    else:
+        public_key.verify(signature, data, RSA_PADDING, hashes.SHA256())
+
 
 class DigitalSignature:
     """
     Class that handles all signature methods
 
+    :ivar algorithm: signature algorithm, "RSA" or "Ed25519"
+    :type algorithm: str
     :ivar private_key: private key of the signature
-    :type private_key: RSAPrivateKey
+    :type private_key: RSAPrivateKey or Ed25519PrivateKey
     :ivar public_key: public key of the signature based on its private key
-    :type public_key: RSAPublicKey
+    :type public_key: RSAPublicKey or Ed25519PublicKey
     """
 
-    def __init__(self, key_size: int = 2048):
-        """Generating RSA key pair
+    def __init__(self, key_size: int = 2048, algorithm: str = "RSA", private_key=None):
+        """Generating key pair
 
-        :param key_size: size of a key
+        :param key_size: size of a key, used by RSA only
         :type key_size: int
+        :param algorithm: signature algorithm, "RSA" or "Ed25519"
+        :type algorithm: str
+        :param private_key: existing private key, e.g. loaded from keystore, \
+        algorithm is taken from its type
+        :type private_key: RSAPrivateKey or Ed25519PrivateKey or None
+        :raises ValueError: if algorithm is unknown
         """
+        if private_key is not None:
+            algorithm = "Ed25519" if isinstance(private_key, ed25519.Ed25519PrivateKey) else "RSA"
+        if algorithm not in SIGNATURE_ALGORITHMS:
+            raise ValueError(f"Unknown signature algorithm: {algorithm}")
+        self.algorithm = algorithm
         self.key_size = key_size
-        self.private_key = rsa.generate_private_key(
-            public_exponent=65537, key_size=self.key_size
-        )
+        if private_key is not None:
+            self.private_key = private_key
+            if algorithm == "RSA":
+                self.key_size = private_key.key_size
+        elif algorithm == "Ed25519":
+            self.private_key = ed25519.Ed25519PrivateKey.generate()
+        else:
+            self.private_key = rsa.generate_private_key(
+                public_exponent=65537, key_size=self.key_size
+            )
         self.public_key = self.private_key.public_key()
-        self.padding = padding.PSS(
-            mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH
-        )
+        self.padding = RSA_PADDING
 
     def get_private_key(self) -> bytes:
         """
@@ -65,11 +143,13 @@ class DigitalSignature:
 
     def get_public_key(self) -> bytes:
         """
-        Returns public key in PEM format
+        Returns public key in PEM format, raw 32 bytes for Ed25519
 
-        :return: public key as PEM
+        :return: public key
         :rtype: bytes
         """
+        if self.algorithm == "Ed25519":
+            return self.public_key.public_bytes(Encoding.Raw, PublicFormat.Raw)
         return self.public_key.public_bytes(
             encoding=Encoding.PEM, format=PublicFormat.SubjectPublicKeyInfo
         )
@@ -87,9 +167,12 @@ class DigitalSignature:
             log.error("Cannot sign empty message")
             return None
         try:
-            signature = self.private_key.sign(
-                message, self.padding, hashes.SHA256()
-            )
+            if self.algorithm == "Ed25519":
+                signature = self.private_key.sign(message)
+            else:
+                signature = self.private_key.sign(
+                    message, self.padding, hashes.SHA256()
+                )
             log.debug(f"Signed message: {message}")
             return signature
         except Exception as e:
@@ -98,7 +181,7 @@ class DigitalSignature:
 
     def verify(self, public_key_pem: bytes, message: str, signature: bytes) -> bool:
         """
-        Verifys digital signature
+        Verifys digital signature made with the algorithm of this signer
 
         :param public_key_pem: signer's public key
         :type public_key_pem: bytes
@@ -120,15 +203,13 @@ class DigitalSignature:
             return False
         try:
             log.debug(f"Loading public key")
-            public_key = load_pem_public_key(public_key_pem)
+            load_public_key(public_key_pem)
         except Exception as e:
             log.error(f"Error loading public key during verification: {e}")
             return False
         try:
             log.debug(f"Verifying signature for message {message}")
-            public_key.verify(
-                signature, message.encode(), self.padding, hashes.SHA256()
-            )
+            verify_signature(public_key_pem, message.encode(), signature, self.algorithm)
             log.debug("Signature is valid")
             return True
         except exceptions.InvalidSignature as e:
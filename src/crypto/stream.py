@@ -0,0 +1,276 @@
+"""
+    This module represents streaming encryption of large payloads.
+    Data is processed in fixed-size chunks, each one authenticated on its own,
+    so payloads of any size are encrypted and decrypted in constant memory
+    and any chunk range can be decrypted without reading the rest.
+"""
+
+import os
+import struct
+from typing import BinaryIO, Iterable, Iterator, Optional, Union
+from cryptography.exceptions import InvalidTag
+from .encryption import AEAD_MODES, get_aead
+
+MAGIC = b"CMS1"
+DEFAULT_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+NONCE_PREFIX_SIZE = 8
+TAG_SIZE = 16
+
+# magic, nonce prefix, chunk size
+HEADER_FORMAT = f">4s{NONCE_PREFIX_SIZE}sI"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+Source = Union[BinaryIO, Iterable[bytes]]
+
+
+def read_chunks(source: Source, chunk_size: int) -> Iterator[bytes]:
+    """
+    Splits a file-like object or an iterable of bytes into chunks
+
+    Every chunk but the last one is exactly chunk_size bytes long.
+
+    :param source: file-like object with read() or iterable of bytes
+    :type source: BinaryIO or Iterable[bytes]
+    :param chunk_size: chunk size in bytes
+    :type chunk_size: int
+    :return: chunks
+    :rtype: Iterator[bytes]
+    """
+    if hasattr(source, "read"):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            while len(chunk) < chunk_size:
+                more = source.read(chunk_size - len(chunk))
+                if not more:
+                    break
+                chunk += more
+            yield chunk
+        return
+
+    buffer = bytearray()
+    for data in source:
+        buffer += data
+        while len(buffer) >= chunk_size:
+            yield bytes(buffer[:chunk_size])
+            del buffer[:chunk_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def with_last_flag(chunks: Iterable[bytes]) -> Iterator[tuple]:
+    """
+    Marks the last chunk of a stream by reading one chunk ahead
+
+    An empty stream yields a single empty last chunk.
+
+    :param chunks: chunks
+    :type chunks: Iterable[bytes]
+    :return: pairs of chunk and whether it is the last one
+    :rtype: Iterator[tuple]
+    """
+    previous = None
+    for chunk in chunks:
+        if previous is not None:
+            yield previous, False
+        previous = chunk
+    yield (previous if previous is not None else b""), True
+
+
+class StreamEncryption:
+    """
+    Chunked authenticated encryption
+
+    Stream layout is a header (magic, nonce prefix, chunk size) followed by
+    encrypted chunks of chunk_size + TAG_SIZE bytes, the last one may be
+    shorter. The nonce of a chunk is the nonce prefix followed by the chunk
+    counter. The header, the counter and a last-chunk flag are authenticated
+    as associated data, so chunks cannot be reordered, dropped or appended.
+
+    :ivar key: key that will be used to encrypt data
+    :type key: bytes
+    :ivar chunk_size: plaintext chunk size for new streams
+    :type chunk_size: int
+    """
+
+    def __init__(self, key: bytes, algorithm="AES", mode="GCM",
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        Initiates with the given key
+
+        :param key: key that will be used to encrypt data
+        :type key: bytes
+        :param algorithm: cipher algorithm, "AES" or "ChaCha20"
+        :type algorithm: str
+        :param mode: AEAD mode, "GCM" or "Poly1305"
+        :type mode: str
+        :param chunk_size: plaintext chunk size for new streams
+        :type chunk_size: int
+        :raises ValueError: if mode is not AEAD or chunk size is invalid
+        """
+        if (algorithm, mode) not in AEAD_MODES:
+            raise ValueError(f"Streaming requires an AEAD mode, got {algorithm}-{mode}")
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError(f"Invalid chunk size: {chunk_size}")
+        self.key = key
+        self.chunk_size = chunk_size
+        self.aead = get_aead(algorithm, mode, key)
+
+    @staticmethod
+    def parse_header(header: bytes) -> tuple:
+        """
+        Parses stream header
+
+        :param header: first HEADER_SIZE bytes of the stream
+        :type header: bytes
+        :return: nonce prefix and chunk size
+        :rtype: tuple
+        :raises ValueError: if header is malformed
+        """
+        if len(header) != HEADER_SIZE:
+            raise ValueError("Stream is too short")
+        magic, nonce_prefix, chunk_size = struct.unpack(HEADER_FORMAT, header)
+        if magic != MAGIC or not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError("Invalid stream header")
+        return nonce_prefix, chunk_size
+
+    def encrypt_chunk(self, header: bytes, counter: int, chunk: bytes, last: bool) -> bytes:
+        """
+        Encrypts one chunk of a stream
+
+        :param header: stream header
+        :type header: bytes
+        :param counter: chunk number
+        :type counter: int
+        :param chunk: plaintext chunk
+        :type chunk: bytes
+        :param last: whether chunk is the last one
+        :type last: bool
+        :return: encrypted chunk with tag
+        :rtype: bytes
+        """
+        nonce, associated_data = self._chunk_nonce(header, counter, last)
+        return self.aead.encrypt(nonce, chunk, associated_data)
+
+    def decrypt_chunk(self, header: bytes, counter: int, chunk: bytes, last: bool) -> bytes:
+        """
+        Decrypts one chunk of a stream
+
+        :param header: stream header
+        :type header: bytes
+        :param counter: chunk number
+        :type counter: int
+        :param chunk: encrypted chunk with tag
+        :type chunk: bytes
+        :param last: whether chunk is the last one
+        :type last: bool
+        :return: plaintext chunk
+        :rtype: bytes
+        :raises ValueError: if chunk is not authentic
+        """
+        nonce, associated_data = self._chunk_nonce(header, counter, last)
+        try:
+            return self.aead.decrypt(nonce, chunk, associated_data)
+        except InvalidTag:
+            raise ValueError(f"Chunk {counter} failed authentication")
+
+    def encrypt_stream(self, source: Source) -> Iterator[bytes]:
+        """
+        Encrypts a stream chunk by chunk
+
+        :param source: file-like object with read() or iterable of bytes
+        :type source: BinaryIO or Iterable[bytes]
+        :return: header followed by encrypted chunks
+        :rtype: Iterator[bytes]
+        """
+        header = struct.pack(HEADER_FORMAT, MAGIC, os.urandom(NONCE_PREFIX_SIZE), self.chunk_size)
+        yield header
+        chunks = with_last_flag(read_chunks(source, self.chunk_size))
+        for counter, (chunk, last) in enumerate(chunks):
+            yield self.encrypt_chunk(header, counter, chunk, last)
+
+    def decrypt_stream(self, source: Source) -> Iterator[bytes]:
+        """
+        Decrypts a stream chunk by chunk
+
+        :param source: file-like object with read() or iterable of bytes
+        :type source: BinaryIO or Iterable[bytes]
+        :return: plaintext chunks
+        :rtype: Iterator[bytes]
+        :raises ValueError: if stream is malformed, truncated or tampered with
+        """
+        if not hasattr(source, "read"):
+            source = _IterableReader(source)
+        header = source.read(HEADER_SIZE)
+        _, chunk_size = self.parse_header(header)
+        chunks = with_last_flag(read_chunks(source, chunk_size + TAG_SIZE))
+        for counter, (chunk, last) in enumerate(chunks):
+            yield self.decrypt_chunk(header, counter, chunk, last)
+
+    def decrypt_range(self, source: BinaryIO, first: int, count: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Decrypts a range of chunks of a seekable stream
+
+        :param source: seekable file-like object
+        :type source: BinaryIO
+        :param first: number of the first chunk
+        :type first: int
+        :param count: number of chunks, all remaining by default
+        :type count: int or None
+        :return: plaintext chunks
+        :rtype: Iterator[bytes]
+        :raises ValueError: if stream is malformed or chunks are not authentic
+        """
+        source.seek(0)
+        header = source.read(HEADER_SIZE)
+        _, chunk_size = self.parse_header(header)
+        stored = chunk_size + TAG_SIZE
+        size = source.seek(0, os.SEEK_END) - HEADER_SIZE
+        total = max((size + stored - 1) // stored, 1)
+        last_index = total - 1
+        end = total if count is None else min(first + count, total)
+        if first < 0 or first > last_index:
+            raise ValueError(f"Chunk {first} is out of range")
+
+        source.seek(HEADER_SIZE + first * stored)
+        for counter in range(first, end):
+            chunk = source.read(stored)
+            yield self.decrypt_chunk(header, counter, chunk, counter == last_index)
+
+    @staticmethod
+    def _chunk_nonce(header: bytes, counter: int, last: bool) -> tuple:
+        """
+        Derives nonce and associated data of a chunk
+
+        :param header: stream header
+        :type header: bytes
+        :param counter: chunk number
+        :type counter: int
+        :param last: whether chunk is the last one
+        :type last: bool
+        :return: nonce and associated data
+        :rtype: tuple
+        """
+        counter_bytes = counter.to_bytes(4, "big")
+        nonce_prefix = header[len(MAGIC):len(MAGIC) + NONCE_PREFIX_SIZE]
+        return nonce_prefix + counter_bytes, header + counter_bytes + bytes([last])
+
+
+class _IterableReader:
+    """File-like read() over an iterable of bytes"""
+
+    def __init__(self, iterable: Iterable[bytes]):
+        self.iterator = iter(iterable)
+        self.buffer = bytearray()
+
+    def read(self, size: int) -> bytes:
+        while len(self.buffer) < size:
+            data = next(self.iterator, None)
+            if data is None:
+                break
+            self.buffer += data
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
@@ -1,5 +1,7 @@
 # main.py
+import os
 import sys
+import getpass
 import socket
 import time
 
@@ -7,27 +9,57 @@ from network.p2p import P2PNetwork
 from blockchain.blockchain import Blockchain
 from blockchain.consensus import ProofOfWork
 from network.sockets import P2PSocket
-from blockchain.transaction import Transaction
-from crypto.diffie_hellman import DiffieHellmanKeyExchange
+from network.async_sockets import AsyncP2PSocket
+from blockchain.transaction import Transaction, BatchTransaction
+from crypto.diffie_hellman import create_key_exchange
 from crypto.signatures import DigitalSignature
-from crypto.encryption import SymmetricEncryption
-from ui.messenger_window import MessengerApp
+from crypto.encryption import CompressionThreshold, SymmetricEncryption, message_associated_data
+from crypto.groups import GroupManager
+from crypto.attachments import AttachmentStore, BlobStore
+from crypto.keystore import Keystore
+from crypto.key_registry import registry
 from utils.logger import Logger
-from utils.config import DEFAULT_DH_PARAMETERS, DEFAULT_PORT, BROADCAST_PORT
+from utils.config import (
+    DEFAULT_PORT,
+    BROADCAST_PORT,
+    MEMPOOL_JOURNAL_PATH,
+    MESSAGE_BATCH_WINDOW,
+    MESSAGE_BATCH_SIZE,
+    SHARDING_ENABLED,
+    SHARD_JOURNAL_DIR,
+    COMPRESS_MESSAGES,
+    SIGNATURE_ALGORITHM,
+    ENCRYPTION_ALGORITHM,
+    ATTACHMENT_DIR,
+    KEYSTORE_PATH,
+    NETWORK_ENGINE,
+    HEADLESS,
+)
+from blockchain.mempool import MempoolJournal
+from blockchain.shards import ShardManager
 from network.sync import SyncManager
-from PyQt5.QtWidgets import QApplication, QListWidgetItem
+from network.attachments import AttachmentFetcher
 import threading
 
+try:
+    from PyQt5.QtCore import QTimer
+    from PyQt5.QtWidgets import QApplication, QListWidgetItem
+    from ui.messenger_window import MessengerApp
+except ImportError:  # Headless nodes may run without PyQt5
+    if not HEADLESS:
+        raise
+    QApplication = QListWidgetItem = QTimer = MessengerApp = None
+
 
 log = Logger("main")
 
 
 def generate_keys():
     """Generates keys for both DH and signature."""
-    dh_key_exchange = DiffieHellmanKeyExchange(DEFAULT_DH_PARAMETERS)
+    dh_key_exchange = create_key_exchange()
     dh_public_key = dh_key_exchange.get_public_key()
 
-    signer = DigitalSignature()
+    signer = DigitalSignature(algorithm=SIGNATURE_ALGORITHM)
     private_key_pem = signer.get_private_key()
     public_key_pem = signer.get_public_key()
     public_key = signer.public_key
@@ -48,17 +80,15 @@ def get_ip():
     return IP
 
 
-def main():
-    def get_shared_key(peer_public_key):
-        """Retrieves existing shared key or generates new one."""
-        if peer_public_key in shared_keys:
-            return shared_keys[peer_public_key]
-        else:
-            shared_key = dh_key_manager.generate_shared_key(peer_public_key)
-            if shared_key:
-                shared_keys[peer_public_key] = shared_key
-                return shared_key
+def replay_groups(group_manager, blockchain, shard_manager=None):
+    """Rebuilds groups from invitations in the main chain and subscribed shards."""
+    chains = [blockchain] + (list(shard_manager.shards.values()) if shard_manager else [])
+    for chain in chains:
+        for group in group_manager.replay(chain):
+            log.info(f"Restored group {group.name}")
+
 
+def main():
     def connect_by_username(username):
         peer = ()
         if len(p2p_network.peers):
@@ -76,14 +106,21 @@ def main():
             log.error("Couldnt find user")
             return False
 
-    def mine_new_block():
-        new_block, reward_transaction = blockchain.mine_pending_transactions(ProofOfWork, dh_public_key)
-        if new_block is None or reward_transaction is None:
-            return
-        p2p_network.sync_manager.broadcast_block(new_block, None)
-        p2p_network.broadcast_transaction(reward_transaction, None)
+    def mine_new_block(chain=None):
+        p2p_network.sync_manager.mine_pending(chain)
 
     def send_message(username, content, app: QApplication):
+        group = group_manager.find_group(username)
+        if group:
+            encrypted_content = group_manager.encrypt(
+                group.group_id, content, message_associated_data(dh_public_key, group.group_id)
+            )
+            if encrypted_content:
+                queue_message(group.group_id, encrypted_content.hex(), app)
+            else:
+                log.error("Message was not encrypted")
+            return
+
         recipient = None
         for peer in p2p_network.peers:
             if peer[2] == username:
@@ -92,31 +129,120 @@ def main():
         if recipient is None:
             print(f"User {username} not found")
 
-        shared_key = get_shared_key(recipient[3])
+        shared_key = dh_key_manager.get_shared_key(recipient[3])
         if shared_key:
-            encryptor = SymmetricEncryption(shared_key, algorithm="AES", mode="CBC")
-            encrypted_content = encryptor.encrypt(content)
+            encryptor = SymmetricEncryption.from_suite(
+                shared_key, ENCRYPTION_ALGORITHM, compress=COMPRESS_MESSAGES,
+                threshold=compression_threshold,
+            )
+            encrypted_content = encryptor.encrypt(
+                content, message_associated_data(dh_public_key, recipient[3])
+            )
             if encrypted_content:
-                log.debug("Creating signed encrypted transaction")
-                transaction = Transaction(
-                    dh_public_key,
-                    recipient[3],
-                    0,
-                    encrypted_content.hex(),
-                    signature_manager.get_public_key(),
-                )
-                transaction.sign_transaction(signature_manager)
-                blockchain.add_transaction(transaction)
-                p2p_network.broadcast_transaction(transaction, None)
-                app.handle_messages(dh_public_key, recipient[3])
-
-                if len(blockchain.pending_transactions) >= 3:
-                    threading.Thread(target=mine_new_block, daemon=True).start()
+                queue_message(recipient[3], encrypted_content.hex(), app)
             else:
                 log.error("Message was not encrypted")
         else:
             log.warning("No shared key")
 
+    def send_attachment(username, path, app: QApplication):
+        """Stores file as encrypted chunks and sends its manifest reference as a message."""
+        try:
+            with open(path, "rb") as file:
+                reference = attachment_store.add(file, os.path.basename(path))
+        except OSError as e:
+            log.error(f"Could not read attachment: {e}")
+            return
+        log.info(f"Sending {reference['name']} ({reference['size']} bytes) to {username}")
+        send_message(username, AttachmentStore.to_message(reference), app)
+
+    def queue_message(recipient_key, encrypted_content, app: QApplication):
+        """Queues encrypted message so a burst is signed as one batch.
+
+        A message to an idle outbox is sent right away and opens the batch
+        window; messages arriving within the window go out together when it
+        closes. The window is a QTimer, so the flush runs on the GUI thread.
+        """
+        with outbox_lock:
+            outbox.append((recipient_key, encrypted_content, app))
+            idle = len(outbox) == 1 and not outbox_window
+            full = len(outbox) >= MESSAGE_BATCH_SIZE
+            if idle:
+                outbox_window.append(True)
+                QTimer.singleShot(int(MESSAGE_BATCH_WINDOW * 1000), close_outbox_window)
+        if idle or full:
+            flush_outbox()
+
+    def close_outbox_window():
+        """Sends messages queued during the batch window."""
+        with outbox_lock:
+            outbox_window.clear()
+        flush_outbox()
+
+    def flush_outbox():
+        """Signs queued messages as one transaction, batching bursts under a single signature."""
+        with outbox_lock:
+            queued = list(outbox)
+            outbox.clear()
+        if not queued:
+            return
+
+        if len(queued) == 1:
+            recipient_key, encrypted_content, _ = queued[0]
+            log.debug("Creating signed encrypted transaction")
+            transaction = Transaction(
+                dh_public_key,
+                recipient_key,
+                0,
+                encrypted_content,
+                signature_manager.get_public_key(),
+                timestamp=time.time(),
+            )
+        else:
+            log.debug(f"Creating signed batch of {len(queued)} encrypted messages")
+            transaction = BatchTransaction.create(
+                dh_public_key,
+                [(recipient_key, encrypted_content) for recipient_key, encrypted_content, _ in queued],
+                signature_manager.get_public_key(),
+            )
+        transaction.sign_transaction(signature_manager)
+        chain = blockchain
+        if shard_manager:
+            chain = shard_manager.accept_transaction(transaction) or blockchain
+        chain.add_transaction(transaction)
+        p2p_network.broadcast_transaction(transaction, None)
+        for recipient_key, app in {(key, app) for key, _, app in queued}:
+            if group_manager.is_group_id(recipient_key):
+                app.handle_group_messages(recipient_key)
+            else:
+                app.handle_messages(dh_public_key, recipient_key)
+
+        if len(chain.pending_transactions) >= 3:
+            threading.Thread(target=mine_new_block, args=(chain,), daemon=True).start()
+
+    def create_group(name, usernames):
+        """Creates group and distributes its key to members in one signed batch."""
+        members = [dh_public_key] + [
+            peer[3] for peer in p2p_network.peers if peer[2] in usernames
+        ]
+        if len(members) < 2:
+            log.warning("Group needs at least one known member")
+            return False
+        group = group_manager.create_group(name, members)
+        payloads = group_manager.invitation_payloads(group)
+        if not payloads:
+            log.error("Group key was not distributed")
+            return False
+
+        transaction = BatchTransaction.create(
+            dh_public_key, payloads, signature_manager.get_public_key()
+        )
+        transaction.sign_transaction(signature_manager)
+        blockchain.add_transaction(transaction)
+        p2p_network.broadcast_transaction(transaction, None)
+        log.info(f"Created group {name} with {len(members)} members")
+        return True
+
     def remove_connection(username):
         peer = None
         for p in p2p_network.peers:
@@ -131,6 +257,22 @@ def main():
         conn.close()
 
 
+    def choose_passphrase():
+        """Asks for a new keystore passphrase twice, empty passphrases are rejected."""
+        while True:
+            passphrase = getpass.getpass("Choose keystore passphrase: ")
+            if not passphrase:
+                print("Passphrase cannot be empty")
+            elif getpass.getpass("Repeat keystore passphrase: ") != passphrase:
+                print("Passphrases do not match")
+            else:
+                return passphrase
+
+    keystore = Keystore(KEYSTORE_PATH)
+    if not keystore.exists():
+        # Generate keys of the new profile while the user answers the prompts
+        keystore.pregenerate()
+
     username = input("Enter your username (default=guest): ") or "guest"
     host = input(f"Enter your host (default={get_ip()}): ") or get_ip()
     try:
@@ -143,16 +285,46 @@ def main():
     max_connections = 5
     broadcast_interval = 2
 
-    print("Generating keys...")
-    dh_key_manager = DiffieHellmanKeyExchange(DEFAULT_DH_PARAMETERS)
-    signature_manager = DigitalSignature()
+    if keystore.exists():
+        for _ in range(3):
+            try:
+                dh_key_manager, signature_manager = keystore.load(
+                    getpass.getpass("Enter keystore passphrase: ")
+                )
+                break
+            except ValueError as e:
+                print(f"Could not unlock keystore: {e}")
+        else:
+            sys.exit(1)
+        if signature_manager.algorithm != SIGNATURE_ALGORITHM:
+            # Peers of this network would ignore the node, it cannot run with this identity
+            print(
+                f"Keystore identity uses {signature_manager.algorithm} signatures, "
+                f"this network uses {SIGNATURE_ALGORITHM}."
+            )
+            answer = input("Generate a new identity? The old keystore is kept as a backup [y/N]: ")
+            if answer.strip().lower() != "y":
+                log.error(f"Keystore identity uses {signature_manager.algorithm} signatures")
+                sys.exit(1)
+            keystore.pregenerate()
+            print("Generating keys...")
+            dh_key_manager, signature_manager = keystore.take_spare()
+            os.replace(KEYSTORE_PATH, KEYSTORE_PATH + ".old")
+            keystore.save(choose_passphrase(), dh_key_manager, signature_manager)
+    else:
+        print("Generating keys...")
+        dh_key_manager, signature_manager = keystore.take_spare()
+        keystore.save(choose_passphrase(), dh_key_manager, signature_manager)
     dh_public_key = dh_key_manager.get_public_key()
 
-    blockchain = Blockchain()
+    blockchain = Blockchain(journal=MempoolJournal(MEMPOOL_JOURNAL_PATH))
+    restored = blockchain.restore_pending_transactions()
+    if restored:
+        log.info(f"Restored {restored} pending messages from journal")
     p2p_network = P2PNetwork(
         host,
         port,
-        P2PSocket,
+        AsyncP2PSocket if NETWORK_ENGINE == "asyncio" else P2PSocket,
         SyncManager,
         blockchain,
         broadcast_port,
@@ -163,12 +335,44 @@ def main():
         broadcast_interval,
         max_connections,
     )
+    group_manager = GroupManager(dh_key_manager)
+    p2p_network.group_manager = group_manager
+    shard_manager = None
+    if SHARDING_ENABLED:
+        shard_manager = ShardManager(
+            dh_public_key, blockchain, group_manager=group_manager, journal_dir=SHARD_JOURNAL_DIR
+        )
+        shard_manager.restore()
+        p2p_network.shard_manager = shard_manager
+    replay_groups(group_manager, blockchain, shard_manager)
+    attachment_store = AttachmentStore(BlobStore(ATTACHMENT_DIR))
+    p2p_network.attachment_store = attachment_store
+    p2p_network.attachment_fetcher = AttachmentFetcher(p2p_network, attachment_store)
     p2p_network.start()
     # p2p_network.sync_with_peers()
     p2p_network.discover_peers()
 
     log.info(f"Your public key: {dh_public_key}")
-    shared_keys = {}
+    outbox = []
+    outbox_window = []  # Holds a flag while the batch window is open
+    compression_threshold = CompressionThreshold()  # Adapts to direct messages of this user
+    outbox_lock = threading.Lock()
+
+    if HEADLESS:
+        log.info("Running headless node, press Ctrl+C to stop")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        if isinstance(p2p_network.node, AsyncP2PSocket):
+            p2p_network.node.stop()
+        blockchain.journal.close()
+        if shard_manager:
+            shard_manager.close()
+        log.info(f"Public key registry: {registry.stats()}")
+        log.info(f"Gossip duplicates: {p2p_network.node.seen.stats()}")
+        log.info(f"Inventory: {p2p_network.node.inventory.stats()}")
+        return
 
     app = QApplication(sys.argv)
 
@@ -183,7 +387,10 @@ def main():
         remove_connection,
         p2p_network,
         dh_key_manager=dh_key_manager,
-        blockchain=blockchain
+        blockchain=shard_manager or blockchain,
+        group_manager=group_manager,
+        cgrp=create_group,
+        sattach=send_attachment,
     )
     p2p_network.ui_app = window
     window.show()
@@ -193,8 +400,18 @@ def main():
         for peer in p2p_network.peers:
             item = QListWidgetItem(peer[2])
             window.chatList.addItem(item)
+        # Blocks with invitations of earlier runs arrive with chain sync
+        replay_groups(group_manager, blockchain, shard_manager)
+        for group in list(group_manager.groups.values()):
+            window.chatList.addItem(QListWidgetItem(group.name))
 
         time.sleep(3)
+    blockchain.journal.close()
+    if shard_manager:
+        shard_manager.close()
+    log.info(f"Public key registry: {registry.stats()}")
+    log.info(f"Gossip duplicates: {p2p_network.node.seen.stats()}")
+    log.info(f"Inventory: {p2p_network.node.inventory.stats()}")
     sys.exit(app.exec_())
 
 
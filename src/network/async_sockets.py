@@ -0,0 +1,344 @@
+'''
+This module contains the asyncio node engine.
+
+All connections are served by one event loop thread: accepting, reading
+frames and writing. Handlers validate blocks, mine and decrypt, so they
+run on a small thread pool instead of blocking the loop.
+'''
+
+import asyncio
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from utils import logger
+from utils.config import NETWORK_WORKERS, CONNECT_TIMEOUT
+from .framing import MessageType, read_frame_async
+from .outbound import OutboundQueue, Priority
+from .sockets import P2PSocket
+
+log = logger.Logger("async_sockets")
+
+
+class Connection:
+    '''
+    Peer connection served by the event loop
+
+    :ivar node: Node the connection belongs to
+    :type node: AsyncP2PSocket
+    :ivar reader: Incoming stream
+    :type reader: asyncio.StreamReader
+    :ivar writer: Outgoing stream
+    :type writer: asyncio.StreamWriter
+    :ivar queue: Frames waiting to be written
+    :type queue: OutboundQueue
+    :ivar ready: Set when frames were queued or connection was closed
+    :type ready: asyncio.Event
+    '''
+
+    def __init__(self, node, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        '''
+        Connection initialization
+
+        :param node: Node the connection belongs to
+        :type node: AsyncP2PSocket
+        :param reader: Incoming stream
+        :type reader: asyncio.StreamReader
+        :param writer: Outgoing stream
+        :type writer: asyncio.StreamWriter
+        '''
+        self.node = node
+        self.reader = reader
+        self.writer = writer
+        self.queue = OutboundQueue()
+        self.ready = asyncio.Event()
+
+    def close(self) -> None:
+        '''Closes connection, safe to call from any thread'''
+        self.queue.close()
+        self.node.call_soon(self.ready.set)
+        self.node.call_soon(self.writer.close)
+
+
+class AsyncP2PSocket(P2PSocket):
+    '''
+    Node server running every connection on a single asyncio event loop
+
+    It keeps the surface of P2PSocket, so P2PNetwork and SyncManager use
+    either engine the same way. Connections are Connection objects instead
+    of sockets.
+
+    :ivar loop: Event loop serving connections
+    :type loop: asyncio.AbstractEventLoop
+    :ivar executor: Thread pool running message handlers
+    :type executor: ThreadPoolExecutor
+    '''
+    def __init__(self, host: str, port: int, blockchain, sync_manager,
+                 signature_manager, max_connections: int = 5, workers: int = NETWORK_WORKERS):
+        '''
+        AsyncP2PSocket initialization.
+
+        :param host: Local peer host
+        :type host: str
+        :param port: Local peer port
+        :type port: int
+        :param blockchain: Local peer's blockchain
+        :type blockchain: Blockchain
+        :param sync_manager: Syncronization manager instance that handles every blockchain action
+        :type sync_manager: SyncManager
+        :param signature_manager: Signature manager that handles every action with signing messages and transactions
+        :type signature_manager: DigitalSignature
+        :param max_connections: Maximum connections peer allows to connect
+        :type max_connections: int
+        :param workers: Number of handler threads
+        :type workers: int
+        '''
+        super().__init__(host, port, blockchain, sync_manager, signature_manager, max_connections)
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = None
+        self.loop_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="node")
+        self.server = None
+
+    def run(self, coroutine) -> Future:
+        '''
+        Schedules coroutine on the event loop, starting the loop thread on first use
+
+        :param coroutine: Coroutine to run
+        :type coroutine: Coroutine
+        :return: Future of the coroutine result
+        :rtype: Future
+        '''
+        with self.loop_lock:
+            if self.loop_thread is None:
+                self.loop_thread = threading.Thread(
+                    target=self.loop.run_forever, name="node-loop", daemon=True
+                )
+                self.loop_thread.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def call_soon(self, callback, *args) -> None:
+        '''
+        Runs callback on the event loop thread
+
+        :param callback: Function to call
+        :type callback: Callable
+        '''
+        if self.loop_thread is threading.current_thread():
+            callback(*args)
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def start_server(self):
+        '''Starting server to accept connections, returns when the node is stopped'''
+        try:
+            self.run(self.serve()).result()
+        except CancelledError:
+            log.debug("Server stopped")
+        except Exception as e:
+            log.error(f"Could not start server: {e}")
+
+    async def serve(self):
+        '''Accepts connections until the node is stopped'''
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(self.max_connections)
+        self.server = await asyncio.start_server(self.accept, sock=self.socket)
+        log.debug(f"Server started at {self.host}:{self.port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        '''
+        Accepted connection handler.
+
+        :param reader: Incoming stream
+        :type reader: asyncio.StreamReader
+        :param writer: Outgoing stream
+        :type writer: asyncio.StreamWriter
+        '''
+        addr = writer.get_extra_info("peername")
+        if len(self.connections) >= self.max_connections:
+            log.warning(f"Maximum connections reached. Connection from {addr} rejected")
+            writer.close()
+            return
+        self.add_connection(Connection(self, reader, writer), addr)
+        log.info(f"Connection established with {addr}")
+
+    async def handle_client(self, conn: Connection, addr):
+        '''
+        Client handler, frames of one connection are handled in order.
+
+        :param conn: Connection that needs to be handled
+        :type conn: Connection
+        :param addr: Connection's address that needs to be handled
+        :type addr: Tuple(str, int)
+        '''
+        try:
+            while True:
+                try:
+                    frame = await read_frame_async(conn.reader)
+                except ValueError as e:
+                    log.warning(f"Malformed frame from {addr}: {e}")
+                    break # Stream position is lost, connection has to be dropped
+                if frame is None:
+                    break # Connection closed
+                message_type, data = frame
+
+                log.debug(f"Received {message_type.name} from {addr}: {data[:100].decode(errors='replace')}")
+
+                if message_type == MessageType.MESSAGE:
+                    self.handle_message(message_type, data, conn, addr)  # Relay only queues writes
+                else:
+                    await self.loop.run_in_executor(
+                        self.executor, self.handle_message, message_type, data, conn, addr
+                    )
+        except OSError as e:
+            log.error(f"Error receiving data from {addr}: {e}")
+        finally:
+            if (conn, addr) in self.connections:
+                self.connections.remove((conn, addr))
+            log.info(f"Connection closed with {addr}")
+            conn.close()
+
+    def handle_message(self, message_type: MessageType, data: bytes, conn: Connection, addr):
+        '''
+        Runs message handler on a worker thread, errors do not close the connection.
+
+        :param message_type: Received frame type
+        :type message_type: MessageType
+        :param data: Frame payload
+        :type data: bytes
+        :param conn: Sender connection
+        :type conn: Connection
+        :param addr: Sender address
+        :type addr: Tuple(str, int)
+        '''
+        try:
+            self.dispatch(message_type, data, conn, addr)
+        except Exception as e:
+            log.error(f"Error handling {message_type.name} from {addr}: {e}")
+
+    def add_connection(self, conn: Connection, addr):
+        '''
+        Registers connection and starts its reader and writer tasks, runs on the event loop.
+
+        :param conn: New connection
+        :type conn: Connection
+        :param addr: Connection's address
+        :type addr: Tuple(str, int)
+        '''
+        self.connections.append((conn, addr))
+        self.loop.create_task(self.write_loop(conn, addr))
+        self.loop.create_task(self.handle_client(conn, addr))
+
+    async def write_loop(self, conn: Connection, addr):
+        '''
+        Writer of one connection, waits for the peer to accept data before writing more.
+
+        :param conn: Connection to write to
+        :type conn: Connection
+        :param addr: Connection's address
+        :type addr: Tuple(str, int)
+        '''
+        try:
+            while not conn.queue.closed:
+                await conn.ready.wait()
+                conn.ready.clear()
+                frame = conn.queue.pop()
+                while frame is not None:
+                    conn.writer.write(frame)
+                    await conn.writer.drain()
+                    frame = conn.queue.pop()
+        except OSError as e:
+            if not conn.queue.closed:
+                log.error(f"Error sending to {addr}: {e}")
+            conn.close()
+
+    def enqueue(self, conn: Connection, frame: bytes, priority: Priority):
+        """
+        Queues frame for connection's writer, peers that fall behind are disconnected.
+
+        :param conn: Receiver connection
+        :type conn: Connection
+        :param frame: Encoded frame
+        :type frame: bytes
+        :param priority: Send priority
+        :type priority: Priority
+        """
+        if conn.queue.put(frame, priority):
+            self.call_soon(conn.ready.set)
+        elif not conn.queue.closed:
+            log.warning(f"Outbound queue overflow ({conn.queue.size} bytes), disconnecting slow peer")
+            self.disconnect(conn)
+
+    def outbound_queue(self, conn: Connection):
+        """
+        Returns outbound queue of a connection.
+
+        :param conn: Receiver connection
+        :type conn: Connection
+        :return: Queue
+        :rtype: OutboundQueue
+        """
+        return conn.queue
+
+    def disconnect(self, conn: Connection):
+        """
+        Drops connection, its reader task then removes it from connections.
+
+        :param conn: Connection to drop
+        :type conn: Connection
+        """
+        conn.close()
+
+    def connect_to_peer(self, peer_host: str, peer_port: int):
+        '''
+        Connecting to another peer, must not be called from the event loop thread
+
+        :param peer_host: Another peer's host
+        :type peer_host: str
+        :param peer_port: Another peer's port
+        :type peer_port: int
+        :return: Another peer's connection or None
+        :rtype: Connection or None
+        '''
+        try:
+            return self.run(self.open_connection(peer_host, peer_port)).result(CONNECT_TIMEOUT)
+        except Exception as e:
+            log.error(f"Error connecting to peer {peer_host}:{peer_port}: {e}")
+            return None
+
+    async def open_connection(self, peer_host: str, peer_port: int):
+        '''
+        Opens outbound connection and starts its read loop
+
+        :param peer_host: Another peer's host
+        :type peer_host: str
+        :param peer_port: Another peer's port
+        :type peer_port: int
+        :return: Another peer's connection or None
+        :rtype: Connection or None
+        '''
+        reader, writer = await asyncio.open_connection(peer_host, peer_port)
+        if len(self.connections) >= self.max_connections:
+            log.warning(
+                f"Maximum connections reached. Connection to {peer_host}:{peer_port} rejected"
+            )
+            writer.close()
+            return None
+        conn = Connection(self, reader, writer)
+        self.add_connection(conn, (peer_host, peer_port))
+        log.info(f"Connected to peer {peer_host}:{peer_port}")
+        return conn
+
+    def stop(self):
+        '''Closes all connections and stops the event loop'''
+        async def shutdown():
+            if self.server:
+                self.server.close()
+            for conn, _ in list(self.connections):
+                conn.close()
+
+        if self.loop_thread is not None:
+            self.run(shutdown()).result(CONNECT_TIMEOUT)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join(CONNECT_TIMEOUT)
+        self.executor.shutdown(wait=False, cancel_futures=True)
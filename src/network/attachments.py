@@ -0,0 +1,207 @@
+'''This module fetches attachment blobs from peers on demand'''
+
+import os
+import threading
+import time
+import json5 as json
+from typing import Dict, List, Optional
+from utils.logger import Logger
+from utils.config import (
+    ATTACHMENT_FETCH_WINDOW,
+    ATTACHMENT_RETRY_INTERVAL,
+    ATTACHMENT_FETCH_TIMEOUT,
+    DOWNLOAD_DIR,
+)
+
+log = Logger("attachments")
+
+
+class AttachmentFetcher:
+    '''
+    Downloads missing blobs of attachments with GET_CHUNK requests
+
+    Received blobs go straight to the blob store, so an interrupted download
+    resumes from the chunks already stored.
+
+    :ivar p2p_network: Peer's P2P network
+    :type p2p_network: P2PNetwork
+    :ivar attachments: Local attachment store
+    :type attachments: AttachmentStore
+    :ivar window: Maximum number of blobs requested at once
+    :type window: int
+    :ivar retry_interval: Seconds before an unanswered request is repeated
+    :type retry_interval: float
+    '''
+
+    def __init__(self, p2p_network, attachments, window: int = ATTACHMENT_FETCH_WINDOW,
+                 retry_interval: float = ATTACHMENT_RETRY_INTERVAL):
+        '''
+        Fetcher initialization
+
+        :param p2p_network: Peer's P2P network
+        :type p2p_network: P2PNetwork
+        :param attachments: Local attachment store
+        :type attachments: AttachmentStore
+        :param window: Maximum number of blobs requested at once
+        :type window: int
+        :param retry_interval: Seconds before an unanswered request is repeated
+        :type retry_interval: float
+        '''
+        self.p2p_network = p2p_network
+        self.attachments = attachments
+        self.window = window
+        self.retry_interval = retry_interval
+        self.requested: Dict[str, float] = {}
+        self.downloads = set()
+        self.saved: Dict[str, str] = {}  # manifest hash -> saved file path
+        self.condition = threading.Condition()
+
+    def is_wanted(self, hash_hex: str) -> bool:
+        '''
+        Checks if a blob was requested, unsolicited blobs are dropped
+
+        :param hash_hex: Blob hash
+        :type hash_hex: str
+        :return: True if blob was requested
+        :rtype: bool
+        '''
+        with self.condition:
+            return hash_hex in self.requested
+
+    def chunk_received(self, hash_hex: str) -> None:
+        '''
+        Wakes up downloads waiting for a blob
+
+        :param hash_hex: Stored blob hash
+        :type hash_hex: str
+        '''
+        with self.condition:
+            self.requested.pop(hash_hex, None)
+            self.condition.notify_all()
+
+    def request(self, hashes: List[str]) -> None:
+        '''
+        Asks connected peers for blobs
+
+        :param hashes: Blob hashes
+        :type hashes: List[str]
+        '''
+        log.debug(f"Requesting {len(hashes)} attachment chunks")
+        self.p2p_network.broadcast_message(b"GET_CHUNK" + json.dumps(hashes).encode(), None)
+
+    def wait(self, reference: Dict, timeout: float = ATTACHMENT_FETCH_TIMEOUT) -> bool:
+        '''
+        Downloads missing blobs of an attachment into the blob store
+
+        :param reference: Attachment reference
+        :type reference: Dict
+        :param timeout: Seconds to wait for the whole attachment
+        :type timeout: float
+        :return: False if download timed out
+        :rtype: bool
+        '''
+        deadline = time.monotonic() + timeout
+        while True:
+            missing = self.attachments.missing(reference)
+            if not missing:
+                return True
+            now = time.monotonic()
+            if now >= deadline:
+                log.warning(f"Download of {reference['name']} timed out, {len(missing)} chunks missing")
+                return False
+
+            with self.condition:
+                in_flight = [h for h in missing if now - self.requested.get(h, -self.retry_interval) < self.retry_interval]
+                to_request = [h for h in missing if h not in in_flight][:max(self.window - len(in_flight), 0)]
+                for hash_hex in to_request:
+                    self.requested[hash_hex] = now
+            if to_request:
+                self.request(to_request)
+                continue
+
+            with self.condition:
+                self.condition.wait(min(self.retry_interval, max(deadline - now, 0)))
+
+    def fetch(self, reference: Dict, timeout: float = ATTACHMENT_FETCH_TIMEOUT) -> Optional[bytes]:
+        '''
+        Downloads missing blobs of an attachment and returns its content
+
+        :param reference: Attachment reference
+        :type reference: Dict
+        :param timeout: Seconds to wait for the whole attachment
+        :type timeout: float
+        :return: File content or None if download timed out
+        :rtype: bytes or None
+        '''
+        if not self.wait(reference, timeout):
+            return None
+        return self.attachments.read(reference)
+
+    def download(self, reference: Dict, directory: str = DOWNLOAD_DIR) -> Optional[threading.Thread]:
+        '''
+        Downloads an attachment in background and saves it to a directory
+
+        Repeated calls for an attachment being downloaded or already saved are
+        ignored. A different file with the same name is saved under a new name.
+
+        :param reference: Attachment reference
+        :type reference: Dict
+        :param directory: Directory to save the file to
+        :type directory: str
+        :return: Thread saving the file, None if the call was ignored
+        :rtype: threading.Thread or None
+        '''
+        manifest = reference["manifest"]
+        with self.condition:
+            saved = self.saved.get(manifest)
+            if manifest in self.downloads or (saved and os.path.exists(saved)):
+                return None
+            self.downloads.add(manifest)
+
+        def run():
+            try:
+                if self.wait(reference):
+                    path = self.save(reference, directory)
+                    with self.condition:
+                        self.saved[manifest] = path
+                    log.info(f"Saved attachment to {path}")
+            except Exception as e:
+                log.error(f"Error downloading attachment: {e}")
+            finally:
+                with self.condition:
+                    self.downloads.discard(manifest)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def save(self, reference: Dict, directory: str) -> str:
+        '''
+        Writes a downloaded attachment chunk by chunk to a file that does not exist yet
+
+        :param reference: Attachment reference
+        :type reference: Dict
+        :param directory: Directory to save the file to
+        :type directory: str
+        :return: Path of the saved file
+        :rtype: str
+        :raises ValueError: if blobs are missing or not authentic
+        '''
+        os.makedirs(directory, exist_ok=True)
+        name = os.path.basename(reference["name"]) or reference["manifest"]
+        base, extension = os.path.splitext(name)
+        number = 0
+        while True:
+            path = os.path.join(directory, f"{base} ({number}){extension}" if number else name)
+            try:
+                file = open(path, "xb")
+                break
+            except FileExistsError:
+                number += 1
+        try:
+            with file:
+                self.attachments.read(reference, file)
+        except Exception:
+            os.remove(path)
+            raise
+        return path
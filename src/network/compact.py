@@ -0,0 +1,228 @@
+'''
+This module contains compact block relay.
+
+A compact block carries the block header and a short id of every
+transaction instead of the transactions themselves. Peers already hold
+most of them in their pending transactions, so the receiver rebuilds the
+block from its mempool and requests only the missing transactions.
+'''
+
+import hashlib
+import json5 as json
+from typing import Dict, Iterable, List, Optional, Tuple
+from blockchain.blockchain import Block
+from blockchain.transaction import Transaction
+
+SHORT_ID_SIZE = 6  # Bytes of a transaction short id
+MAX_PARTIAL_BLOCKS = 16  # Blocks waiting for missing transactions
+HEADER_FIELDS = ("index", "previous_hash", "hash", "timestamp", "nonce")
+
+
+def short_id(salt: bytes, transaction: Transaction) -> bytes:
+    '''
+    Returns short id of a transaction
+
+    Ids are salted with the block hash, so a collision found for one
+    block does not affect other blocks.
+
+    :param salt: Block hash
+    :type salt: bytes
+    :param transaction: Transaction
+    :type transaction: Transaction
+    :return: Short id
+    :rtype: bytes
+    '''
+    return hashlib.sha256(salt + bytes.fromhex(transaction.calculate_hash())).digest()[:SHORT_ID_SIZE]
+
+
+def encode_compact_block(block: Block) -> bytes:
+    '''
+    Builds compact block message payload
+
+    :param block: Mined block
+    :type block: Block
+    :return: Header and short ids of the block transactions
+    :rtype: bytes
+    '''
+    salt = bytes.fromhex(block.hash)
+    ids = b"".join(short_id(salt, transaction) for transaction in block.transactions)
+    header = {field: getattr(block, field) for field in HEADER_FIELDS}
+    return json.dumps({"header": header, "ids": ids.hex()}, ensure_ascii=False).encode()
+
+
+def encode_transactions_request(block_hash: str, indexes: List[int]) -> bytes:
+    '''
+    Builds GET_BLOCK_TXN payload
+
+    :param block_hash: Hash of the block being rebuilt
+    :type block_hash: str
+    :param indexes: Positions of missing transactions in the block
+    :type indexes: List[int]
+    :return: Payload
+    :rtype: bytes
+    '''
+    return json.dumps({"hash": block_hash, "indexes": indexes}).encode()
+
+
+def encode_transactions(block_hash: str, transactions: List[Transaction]) -> bytes:
+    '''
+    Builds BLOCK_TXN payload
+
+    :param block_hash: Hash of the requested block
+    :type block_hash: str
+    :param transactions: Requested transactions in requested order
+    :type transactions: List[Transaction]
+    :return: Payload
+    :rtype: bytes
+    '''
+    return json.dumps(
+        {"hash": block_hash, "transactions": [transaction.to_dict() for transaction in transactions]},
+        ensure_ascii=False,
+    ).encode()
+
+
+def decode_transactions(data: bytes) -> Tuple[str, List[Transaction]]:
+    '''
+    Restores BLOCK_TXN payload
+
+    :param data: Payload
+    :type data: bytes
+    :return: Block hash and transactions
+    :rtype: Tuple[str, List[Transaction]]
+    '''
+    message = json.loads(data.decode())
+    return message["hash"], [Transaction.from_dict(transaction) for transaction in message["transactions"]]
+
+
+class PartialBlock:
+    '''
+    Block being rebuilt from a compact block
+
+    :ivar header: Block fields except transactions
+    :type header: dict
+    :ivar ids: Short ids of the block transactions
+    :type ids: List[bytes]
+    :ivar transactions: Known transactions, None for missing ones
+    :type transactions: List[Transaction or None]
+    :ivar collided: True after transactions taken from mempool did not match the block hash
+    :type collided: bool
+    '''
+
+    def __init__(self, header: dict, ids: List[bytes]):
+        '''
+        Partial block initialization
+
+        :param header: Block fields except transactions
+        :type header: dict
+        :param ids: Short ids of the block transactions
+        :type ids: List[bytes]
+        '''
+        self.header = header
+        self.ids = ids
+        self.transactions: List[Optional[Transaction]] = [None] * len(ids)
+        self.collided = False
+
+    @classmethod
+    def decode(cls, data: bytes) -> "PartialBlock":
+        '''
+        Restores partial block from compact block payload
+
+        :param data: Compact block payload
+        :type data: bytes
+        :return: Partial block without transactions
+        :rtype: PartialBlock
+        :raises ValueError: if payload is malformed
+        '''
+        message = json.loads(data.decode())
+        header = {field: message["header"][field] for field in HEADER_FIELDS}
+        ids = bytes.fromhex(message["ids"])
+        if len(ids) % SHORT_ID_SIZE:
+            raise ValueError(f"Short ids of {len(ids)} bytes are not a list of ids")
+        return cls(header, [ids[i:i + SHORT_ID_SIZE] for i in range(0, len(ids), SHORT_ID_SIZE)])
+
+    @property
+    def hash(self) -> str:
+        '''
+        Hash of the block
+
+        :return: Block hash
+        :rtype: str
+        '''
+        return self.header["hash"]
+
+    @property
+    def salt(self) -> bytes:
+        '''
+        Salt of the short ids
+
+        :return: Block hash bytes
+        :rtype: bytes
+        '''
+        return bytes.fromhex(self.hash)
+
+    def fill_from_mempool(self, pending: Iterable[Transaction]) -> int:
+        '''
+        Takes block transactions from pending transactions
+
+        Short ids shared by several pending transactions are left missing.
+
+        :param pending: Pending transactions
+        :type pending: Iterable[Transaction]
+        :return: Number of found transactions
+        :rtype: int
+        '''
+        salt = self.salt
+        known: Dict[bytes, Optional[Transaction]] = {}
+        for transaction in pending:
+            key = short_id(salt, transaction)
+            known[key] = None if key in known else transaction
+        found = 0
+        for position, key in enumerate(self.ids):
+            transaction = known.get(key)
+            if transaction is not None and self.transactions[position] is None:
+                self.transactions[position] = transaction
+                found += 1
+        return found
+
+    def missing(self) -> List[int]:
+        '''
+        Returns positions of missing transactions
+
+        :return: Positions in the block
+        :rtype: List[int]
+        '''
+        return [position for position, transaction in enumerate(self.transactions) if transaction is None]
+
+    def fill(self, indexes: List[int], transactions: List[Transaction]) -> None:
+        '''
+        Puts received transactions into their positions
+
+        :param indexes: Requested positions
+        :type indexes: List[int]
+        :param transactions: Received transactions in requested order
+        :type transactions: List[Transaction]
+        :raises ValueError: if a transaction does not match the short id of its position
+        '''
+        if len(indexes) != len(transactions):
+            raise ValueError(f"Expected {len(indexes)} transactions, received {len(transactions)}")
+        salt = self.salt
+        for position, transaction in zip(indexes, transactions):
+            if short_id(salt, transaction) != self.ids[position]:
+                raise ValueError(f"Transaction does not match short id at position {position}")
+            self.transactions[position] = transaction
+
+    def reset(self) -> None:
+        '''Forgets all found transactions, used after a short id collision'''
+        self.transactions = [None] * len(self.ids)
+        self.collided = True
+
+    def to_block(self) -> Optional[Block]:
+        '''
+        Builds the block once all transactions are known
+
+        :return: Block or None if the rebuilt block does not match the header hash
+        :rtype: Block or None
+        '''
+        block = Block(transactions=list(self.transactions), **self.header)
+        return block if block.calculate_hash() == block.hash else None
+
@@ -19,6 +19,8 @@ def discover_peers(
     username: str,
     public_key: str,
     broadcast_interval: int = 1,
+    signature_algorithm: str = "RSA",
+    key_exchange_algorithm: str = "DH",
 ) -> Set[Tuple[str, int]]:
     """
     New peers discovery in network through UDP broadcasting messages
@@ -35,6 +37,12 @@ def discover_peers(
     :type public_key: str
     :param broadcast_interval: Broadcasting messages interval
     :type broadcast_interval: int
+    :param signature_algorithm: Signature algorithm of the network, peers \
+    using another one are ignored
+    :type signature_algorithm: str
+    :param key_exchange_algorithm: Key exchange backend of the local peer, peers \
+    using another one cannot derive shared keys with it and are ignored
+    :type key_exchange_algorithm: str
     :return: Discovered peers
     :rtype: set
     """
@@ -61,6 +69,14 @@ def discover_peers(
                     data, addr = udp_socket.recvfrom(4096)
                     peer_info = json.loads(zlib.decompress(data).decode())
 
+                    if peer_info.get("signature_algorithm", "RSA") != signature_algorithm:
+                        log.debug(f"Ignoring peer with another signature algorithm: {addr}")
+                        continue
+
+                    if peer_info.get("key_exchange_algorithm", "DH") != key_exchange_algorithm:
+                        log.debug(f"Ignoring peer with another key exchange algorithm: {addr}")
+                        continue
+
                     peer_port = peer_info["port"]
                     try:
                         peer_port = int(peer_port)
@@ -89,7 +105,9 @@ def discover_peers(
             udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
 
             message = {"host": local_host, "port": local_port,
-                       "public_key": public_key, "username": username}
+                       "public_key": public_key, "username": username,
+                       "signature_algorithm": signature_algorithm,
+                       "key_exchange_algorithm": key_exchange_algorithm}
             broadcast_address = ("<broadcast>", broadcast_port)
 
             # Compressing message so it is 100% delievered
@@ -0,0 +1,266 @@
+'''
+This module contains parallel download of block bodies.
+
+Headers tell which blocks are missing. Their bodies are requested in
+batches from every peer that has them, with a bounded number of
+requests in flight per peer and a window of blocks ahead of the last
+applied one. Batches of slow or disconnected peers go to other peers,
+and blocks are validated strictly in chain order.
+'''
+
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+from utils.config import BLOCK_DOWNLOAD_WINDOW, BLOCK_REQUESTS_PER_PEER, BLOCK_REQUEST_TIMEOUT
+from utils.logger import Logger
+from blockchain.blockchain import Block
+from .headers import MAX_BLOCKS_PER_REQUEST, BranchDownload
+
+log = Logger("download")
+
+MAX_STALLS = 2  # Timeouts in a row after which a peer is no longer asked
+
+
+class BlockDownloader:
+    '''
+    Downloads blocks of one branch from several peers at once
+
+    :ivar sync_manager: Syncronization manager that validates and applies blocks
+    :type sync_manager: SyncManager
+    :ivar batch_size: Blocks in one GET_BLOCKS request
+    :type batch_size: int
+    :ivar window: Maximum number of blocks requested ahead of the last applied one
+    :type window: int
+    :ivar requests_per_peer: Maximum number of requests in flight per peer
+    :type requests_per_peer: int
+    :ivar timeout: Seconds to wait for requested blocks before asking another peer
+    :type timeout: float
+    :ivar clock: Monotonic time source for request deadlines
+    :type clock: Callable[[], float]
+    :ivar download: Branch being downloaded, None when idle
+    :type download: BranchDownload or None
+    :ivar peers: Peers taking part with the position of the last block they have
+    :type peers: Dict[socket.connection, int]
+    '''
+
+    def __init__(self, sync_manager, batch_size: int = MAX_BLOCKS_PER_REQUEST,
+                 window: int = BLOCK_DOWNLOAD_WINDOW, requests_per_peer: int = BLOCK_REQUESTS_PER_PEER,
+                 timeout: float = BLOCK_REQUEST_TIMEOUT, clock: Callable[[], float] = time.monotonic):
+        '''
+        Downloader initialization
+
+        :param sync_manager: Syncronization manager that validates and applies blocks
+        :type sync_manager: SyncManager
+        :param batch_size: Blocks in one GET_BLOCKS request
+        :type batch_size: int
+        :param window: Maximum number of blocks requested ahead of the last applied one
+        :type window: int
+        :param requests_per_peer: Maximum number of requests in flight per peer
+        :type requests_per_peer: int
+        :param timeout: Seconds to wait for requested blocks before asking another peer
+        :type timeout: float
+        :param clock: Monotonic time source for request deadlines
+        :type clock: Callable[[], float]
+        '''
+        self.sync_manager = sync_manager
+        self.batch_size = batch_size
+        self.window = window
+        self.requests_per_peer = requests_per_peer
+        self.timeout = timeout
+        self.clock = clock
+        self.download: Optional[BranchDownload] = None
+        self.peers: Dict = {}
+        self.assigned: Dict[str, Tuple[object, float]] = {}  # block hash -> (peer, deadline)
+        self.stalls = Counter()
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def start(self, fork: Block, headers: List[dict], replace: bool, conn) -> bool:
+        '''
+        Starts download of a branch announced by a peer
+
+        :param fork: Last common block the branch continues
+        :type fork: Block
+        :param headers: Validated headers of the missing blocks
+        :type headers: List[dict]
+        :param replace: True if the branch replaces local blocks after the fork
+        :type replace: bool
+        :param conn: Announcing peer
+        :type conn: socket.connection
+        :return: False if another download is in progress
+        :rtype: bool
+        '''
+        with self.lock:
+            if self.download is not None:
+                return False
+            self.download = BranchDownload(fork, headers, replace)
+            self.peers = {conn: len(headers) - 1}
+            self.assigned.clear()
+            self.stalls.clear()
+            requests = self.schedule(self.clock())
+            if self.timer is None:
+                self.timer = threading.Thread(target=self.run, name="block-download", daemon=True)
+                self.timer.start()
+        log.info(f"Downloading {len(headers)} blocks after block {fork.index}")
+        self.send(requests)
+        return True
+
+    def add_peer(self, conn, headers: List[dict]) -> bool:
+        '''
+        Lets a peer serve the current download if it announced blocks of the branch
+
+        :param conn: Announcing peer
+        :type conn: socket.connection
+        :param headers: Headers the peer announced
+        :type headers: List[dict]
+        :return: True if the peer takes part in the download
+        :rtype: bool
+        '''
+        announced = {header["hash"] for header in headers}
+        with self.lock:
+            if self.download is None:
+                return False
+            branch = self.download.headers
+            height = next(
+                (position for position in range(len(branch) - 1, -1, -1) if branch[position]["hash"] in announced),
+                None,
+            )
+            if height is None:
+                return False
+            self.peers[conn] = max(height, self.peers.get(conn, -1))
+            requests = self.schedule(self.clock())
+        self.send(requests)
+        return True
+
+    def received(self, blocks: List[Block], conn) -> bool:
+        '''
+        Applies downloaded blocks that continue the chain and requests more
+
+        :param blocks: Received blocks
+        :type blocks: List[Block]
+        :param conn: Sender connection
+        :type conn: socket.connection
+        :return: True if the download was completed
+        :rtype: bool
+        '''
+        with self.lock:
+            download = self.download
+            if download is None:
+                return False
+            for block in blocks:
+                if download.add(block):
+                    self.assigned.pop(block.hash, None)
+            if blocks:
+                self.stalls[conn] = 0
+            try:
+                if self.sync_manager.apply_download(download):
+                    self.reset()
+                    return True
+            except ValueError as e:
+                log.warning(f"{e}, download aborted")
+                self.reset()
+                return False
+            requests = self.schedule(self.clock())
+        self.send(requests)
+        return False
+
+    def check(self) -> None:
+        '''Takes requests back from slow and disconnected peers and hands them out again'''
+        now = self.clock()
+        with self.lock:
+            if self.download is None:
+                return
+            alive = {conn for conn, _ in list(self.sync_manager.p2p_network.node.connections)}
+            for conn in [conn for conn in self.peers if conn not in alive]:
+                log.info("Peer disconnected, its blocks are requested from other peers")
+                del self.peers[conn]
+
+            late = set()
+            for block_hash, (conn, deadline) in list(self.assigned.items()):
+                if conn not in self.peers or deadline <= now:
+                    del self.assigned[block_hash]
+                    if conn in self.peers:
+                        late.add(conn)
+            for conn in late:
+                self.stalls[conn] += 1
+            fastest = min(self.stalls[conn] for conn in self.peers) if self.peers else 0
+            for conn in late:
+                if self.stalls[conn] >= MAX_STALLS and self.stalls[conn] > fastest:
+                    log.info("Peer is too slow, its blocks are requested from other peers")
+                    del self.peers[conn]
+
+            if not self.peers:
+                log.warning("No peers left to download blocks from")
+                self.reset()
+                return
+            requests = self.schedule(now)
+        self.send(requests)
+
+    def schedule(self, now: float) -> List[Tuple[object, List[str]]]:
+        '''
+        Hands out missing blocks inside the window to peers with free request slots,
+        peers with fewer timeouts are served first. Must be called with the lock held.
+
+        :param now: Current monotonic time
+        :type now: float
+        :return: Peers and block hashes to request from them
+        :rtype: List[Tuple[socket.connection, List[str]]]
+        '''
+        download = self.download
+        limit = min(len(download.headers), download.applied + self.window)
+        free = [
+            (position, header["hash"]) for position, header in enumerate(download.headers[download.applied:limit],
+                                                                         download.applied)
+            if header["hash"] not in download.received and header["hash"] not in self.assigned
+        ]
+        load = Counter(conn for conn, _ in self.assigned.values())
+        peers = sorted(self.peers, key=lambda conn: self.stalls[conn])
+        requests = []
+        progress = True
+        while free and progress:
+            progress = False
+            for conn in peers:
+                room = min(self.batch_size, self.requests_per_peer * self.batch_size - load[conn])
+                if room <= 0:
+                    continue
+                batch = [block_hash for position, block_hash in free if position <= self.peers[conn]][:room]
+                if not batch:
+                    continue
+                taken = set(batch)
+                free = [item for item in free if item[1] not in taken]
+                load[conn] += len(batch)
+                for block_hash in batch:
+                    self.assigned[block_hash] = (conn, now + self.timeout)
+                requests.append((conn, batch))
+                progress = True
+        return requests
+
+    def send(self, requests: List[Tuple[object, List[str]]]) -> None:
+        '''
+        Sends block requests
+
+        :param requests: Peers and block hashes to request from them
+        :type requests: List[Tuple[socket.connection, List[str]]]
+        '''
+        for conn, hashes in requests:
+            self.sync_manager.request_blocks(hashes, conn)
+
+    def reset(self) -> None:
+        '''Forgets the download, must be called with the lock held'''
+        self.download = None
+        self.peers = {}
+        self.assigned.clear()
+
+    def run(self) -> None:
+        '''Checks request deadlines while a download is in progress'''
+        while True:
+            time.sleep(min(1.0, self.timeout / 2))
+            with self.lock:
+                if self.download is None:
+                    self.timer = None
+                    return
+            try:
+                self.check()
+            except Exception as e:
+                log.error(f"Error during block download check: {e}")
@@ -0,0 +1,281 @@
+'''
+This module contains the wire format of peer connections.
+
+Every message is sent as a frame: a 6-byte header (message type, flags,
+payload length) followed by the payload, so the receiver knows exactly
+where one message ends and the next begins.
+'''
+
+import asyncio
+import struct
+import zlib
+from enum import IntEnum
+from typing import Optional, Tuple
+from utils.config import MAX_FRAME_SIZE, FRAME_COMPRESSION_THRESHOLD
+from utils.logger import Logger
+
+log = Logger("framing")
+
+HEADER = struct.Struct(">BBI")  # type, flags, payload length
+FLAG_COMPRESSED = 0x01
+READ_BUFFER_SIZE = 64 * 1024  # Initial size of the per-connection buffer
+MAX_KEPT_BUFFER_SIZE = 1024 * 1024  # Larger frames get a one-off buffer
+
+
+class MessageType(IntEnum):
+    '''Frame types, each maps to the prefix of the message it carries'''
+    MESSAGE = 0  # Simple message relayed to other peers
+    NEW_BLOCK = 1
+    REQUEST_CHAIN = 2
+    BLOCKCHAIN = 3
+    NEW_SHARD_BLOCK = 4
+    NEW_TRANSACTION = 5
+    GET_CHUNK = 6
+    CHUNK = 7
+    NEW_MESSAGE = 8
+    INV = 9  # Ids of gossip messages the sender has
+    GETDATA = 10  # Ids of announced messages the sender wants
+    COMPACT_BLOCK = 11  # Block header with short transaction ids
+    GET_BLOCK_TXN = 12  # Positions of transactions missing from a compact block
+    BLOCK_TXN = 13  # Transactions requested with GET_BLOCK_TXN
+    GET_HEADERS = 14  # Block locator of the sender
+    HEADERS = 15  # Headers after the last common block
+    GET_BLOCKS = 16  # Hashes of wanted blocks
+    BLOCKS = 17  # Blocks requested with GET_BLOCKS
+    CHAIN_BLOCK = 18  # One block of a streamed chain
+    CHAIN_END = 19  # End of a streamed chain
+    GET_SHARD_BLOCKS = 20  # Shard id and hash of the last block the sender has
+    SHARD_BLOCKS = 21  # Shard blocks requested with GET_SHARD_BLOCKS
+
+    @property
+    def prefix(self) -> bytes:
+        '''
+        Message prefix used by the handlers
+
+        :return: Prefix bytes, empty for simple messages
+        :rtype: bytes
+        '''
+        return b"" if self is MessageType.MESSAGE else self.name.encode()
+
+
+# Longest prefixes first, so CHUNK does not shadow GET_CHUNK
+PREFIXES = sorted(
+    ((message_type.prefix, message_type) for message_type in MessageType if message_type.prefix),
+    key=lambda item: len(item[0]),
+    reverse=True,
+)
+
+
+def split_message(message: bytes) -> Tuple[MessageType, bytes]:
+    '''
+    Splits a prefixed message into frame type and payload
+
+    :param message: Message starting with one of the known prefixes
+    :type message: bytes
+    :return: Message type and payload
+    :rtype: Tuple[MessageType, bytes]
+    '''
+    for prefix, message_type in PREFIXES:
+        if message.startswith(prefix):
+            return message_type, message[len(prefix):]
+    return MessageType.MESSAGE, message
+
+
+def encode_frame(message_type: MessageType, payload: bytes,
+                 compression_threshold: int = FRAME_COMPRESSION_THRESHOLD) -> bytes:
+    '''
+    Builds a frame, payloads above the threshold are compressed
+
+    :param message_type: Frame type
+    :type message_type: MessageType
+    :param payload: Frame payload
+    :type payload: bytes
+    :param compression_threshold: Minimal payload size to compress
+    :type compression_threshold: int
+    :return: Header followed by payload
+    :rtype: bytes
+    :raises ValueError: if payload exceeds MAX_FRAME_SIZE
+    '''
+    flags = 0
+    if len(payload) >= compression_threshold:
+        compressed = zlib.compress(payload)
+        if len(compressed) < len(payload):
+            payload, flags = compressed, FLAG_COMPRESSED
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {len(payload)} bytes exceeds {MAX_FRAME_SIZE} bytes")
+    return HEADER.pack(message_type, flags, len(payload)) + payload
+
+
+def encode_message(message: bytes) -> bytes:
+    '''
+    Builds a frame from a prefixed message
+
+    :param message: Message starting with one of the known prefixes
+    :type message: bytes
+    :return: Frame bytes
+    :rtype: bytes
+    '''
+    return encode_frame(*split_message(message))
+
+
+class Payload(bytes):
+    '''
+    Received frame payload that remembers how it came over the wire,
+    so it can be relayed without compressing it again
+
+    :ivar message_type: Frame type
+    :type message_type: MessageType
+    :ivar flags: Frame flags
+    :type flags: int
+    :ivar wire: Payload as received if it was compressed
+    :type wire: bytes or None
+    '''
+
+    def __new__(cls, data, message_type: MessageType, flags: int = 0, wire: Optional[bytes] = None):
+        payload = super().__new__(cls, data)
+        payload.message_type = message_type
+        payload.flags = flags
+        payload.wire = wire
+        return payload
+
+    def frame(self) -> bytes:
+        '''
+        Returns the frame the payload was received in
+
+        :return: Frame bytes
+        :rtype: bytes
+        '''
+        body = self if self.wire is None else self.wire
+        return HEADER.pack(self.message_type, self.flags, len(body)) + body
+
+
+class FrameReader:
+    '''
+    Reads frames from a connection into a reusable buffer
+
+    :ivar conn: Connection to read from
+    :type conn: socket.connection
+    :ivar max_size: Maximum accepted payload size
+    :type max_size: int
+    '''
+
+    def __init__(self, conn, max_size: int = MAX_FRAME_SIZE):
+        '''
+        Frame reader initialization
+
+        :param conn: Connection to read from
+        :type conn: socket.connection
+        :param max_size: Maximum accepted payload size
+        :type max_size: int
+        '''
+        self.conn = conn
+        self.max_size = max_size
+        self.header = bytearray(HEADER.size)
+        self.buffer = bytearray(READ_BUFFER_SIZE)
+
+    def read_exactly(self, view: memoryview) -> bool:
+        '''
+        Fills the whole view with data from the connection
+
+        :param view: Destination
+        :type view: memoryview
+        :return: False if connection was closed before the view was filled
+        :rtype: bool
+        '''
+        received = 0
+        while received < len(view):
+            count = self.conn.recv_into(view[received:])
+            if not count:
+                return False
+            received += count
+        return True
+
+    def read_frame(self) -> Optional[Tuple[MessageType, bytes]]:
+        '''
+        Reads the next frame, frames of unknown types are skipped
+
+        :return: Message type and decompressed payload, None if connection was closed
+        :rtype: Tuple[MessageType, bytes] or None
+        :raises ValueError: if frame is larger than allowed or cannot be decompressed
+        '''
+        while True:
+            if not self.read_exactly(memoryview(self.header)):
+                return None
+            message_type, flags, length = HEADER.unpack(self.header)
+            if length > self.max_size:
+                raise ValueError(f"Frame of {length} bytes exceeds {self.max_size} bytes")
+
+            if length > len(self.buffer):
+                buffer = bytearray(length)
+                if length <= MAX_KEPT_BUFFER_SIZE:
+                    self.buffer = buffer
+            else:
+                buffer = self.buffer
+            view = memoryview(buffer)[:length]
+            if not self.read_exactly(view):
+                return None
+
+            if message_type not in MessageType._value2member_map_:
+                log.debug(f"Skipping frame of unknown type {message_type}")
+                continue
+            message_type = MessageType(message_type)
+            return message_type, decode_payload(message_type, flags, view, self.max_size)
+
+
+def decode_payload(message_type: MessageType, flags: int, payload,
+                   max_size: int = MAX_FRAME_SIZE) -> Payload:
+    '''
+    Decompresses frame payload if the compressed flag is set
+
+    :param message_type: Frame type
+    :type message_type: MessageType
+    :param flags: Frame flags
+    :type flags: int
+    :param payload: Received payload
+    :type payload: bytes or memoryview
+    :param max_size: Maximum decompressed size
+    :type max_size: int
+    :return: Payload
+    :rtype: Payload
+    :raises ValueError: if payload cannot be decompressed, is incomplete or is too large
+    '''
+    if not flags & FLAG_COMPRESSED:
+        return Payload(payload, message_type)
+    decompressor = zlib.decompressobj()
+    try:
+        data = decompressor.decompress(payload, max_size)
+    except zlib.error as e:
+        raise ValueError(f"Corrupted frame: {e}")
+    if decompressor.unconsumed_tail:
+        raise ValueError(f"Decompressed frame exceeds {max_size} bytes")
+    if not decompressor.eof or decompressor.unused_data:
+        raise ValueError("Compressed frame is truncated or padded")
+    return Payload(data, message_type, flags, bytes(payload))
+
+
+async def read_frame_async(reader: asyncio.StreamReader,
+                           max_size: int = MAX_FRAME_SIZE) -> Optional[Tuple[MessageType, bytes]]:
+    '''
+    Reads the next frame from an asyncio stream, frames of unknown types are skipped
+
+    :param reader: Stream to read from
+    :type reader: asyncio.StreamReader
+    :param max_size: Maximum accepted payload size
+    :type max_size: int
+    :return: Message type and decompressed payload, None if connection was closed
+    :rtype: Tuple[MessageType, bytes] or None
+    :raises ValueError: if frame is larger than allowed or cannot be decompressed
+    '''
+    while True:
+        try:
+            message_type, flags, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+            if length > max_size:
+                raise ValueError(f"Frame of {length} bytes exceeds {max_size} bytes")
+            payload = await reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            return None
+        if message_type not in MessageType._value2member_map_:
+            log.debug(f"Skipping frame of unknown type {message_type}")
+            continue
+        message_type = MessageType(message_type)
+        return message_type, decode_payload(message_type, flags, payload, max_size)
@@ -0,0 +1,198 @@
+'''
+This module contains headers-first chain synchronization.
+
+A node sends a block locator, a sparse list of its block hashes from the
+tip back to genesis. The peer finds the last common block, answers with
+the headers after it, and the node fetches only the block bodies it does
+not have, so sync traffic depends on the gap, not on the chain length.
+'''
+
+import json5 as json
+from typing import Dict, Iterator, List, Optional
+from blockchain.blockchain import Block
+from .compact import HEADER_FIELDS
+
+MAX_HEADERS = 2000  # Maximum number of headers in one HEADERS message
+MAX_BLOCKS_PER_REQUEST = 16  # Maximum number of block bodies in one GET_BLOCKS message
+LOCATOR_DENSE = 10  # Most recent blocks that are listed one by one
+
+
+def block_locator(chain: List[Block]) -> List[str]:
+    '''
+    Builds block locator of a chain
+
+    The last LOCATOR_DENSE hashes are listed one by one, then the step
+    doubles, genesis is always the last entry.
+
+    :param chain: Local chain
+    :type chain: List[Block]
+    :return: Block hashes from the tip back to genesis
+    :rtype: List[str]
+    '''
+    locator = []
+    index, step = len(chain) - 1, 1
+    while index > 0:
+        locator.append(chain[index].hash)
+        if len(locator) >= LOCATOR_DENSE:
+            step *= 2
+        index -= step
+    locator.append(chain[0].hash)
+    return locator
+
+
+def find_fork(chain: List[Block], locator: List[str]) -> Optional[int]:
+    '''
+    Finds the most recent block of the chain listed in a locator
+
+    :param chain: Local chain
+    :type chain: List[Block]
+    :param locator: Block locator of the peer
+    :type locator: List[str]
+    :return: Index of the last common block or None if chains share nothing
+    :rtype: int or None
+    '''
+    known = set(locator)
+    for index in range(len(chain) - 1, -1, -1):
+        if chain[index].hash in known:
+            return index
+    return None
+
+
+def header_of(block: Block) -> dict:
+    '''
+    Returns block header, the block without its transactions
+
+    :param block: Block
+    :type block: Block
+    :return: Header fields
+    :rtype: dict
+    '''
+    return {field: getattr(block, field) for field in HEADER_FIELDS}
+
+
+def encode_headers(blocks: List[Block]) -> bytes:
+    '''
+    Builds HEADERS payload
+
+    :param blocks: Blocks to describe
+    :type blocks: List[Block]
+    :return: Payload
+    :rtype: bytes
+    '''
+    return json.dumps([header_of(block) for block in blocks]).encode()
+
+
+def decode_headers(data: bytes) -> List[dict]:
+    '''
+    Restores HEADERS payload
+
+    :param data: Payload
+    :type data: bytes
+    :return: Headers
+    :rtype: List[dict]
+    :raises ValueError: if payload is malformed or has too many headers
+    '''
+    headers = [{field: header[field] for field in HEADER_FIELDS} for header in json.loads(data.decode())]
+    if len(headers) > MAX_HEADERS:
+        raise ValueError(f"Received {len(headers)} headers, at most {MAX_HEADERS} are allowed")
+    return headers
+
+
+def validate_headers(headers: List[dict], previous: Block) -> bool:
+    '''
+    Checks that headers form a chain continuing the previous block
+
+    :param headers: Headers in chain order
+    :type headers: List[dict]
+    :param previous: Block the first header refers to
+    :type previous: Block
+    :return: True if every header links to the one before
+    :rtype: bool
+    '''
+    index, previous_hash, timestamp = previous.index, previous.hash, previous.timestamp
+    for header in headers:
+        if (header["index"] != index + 1 or header["previous_hash"] != previous_hash
+                or header["timestamp"] <= timestamp):
+            return False
+        index, previous_hash, timestamp = header["index"], header["hash"], header["timestamp"]
+    return True
+
+
+class BranchDownload:
+    '''
+    Block bodies being downloaded for announced headers
+
+    Bodies may arrive in any order, they are handed out for validation in
+    chain order.
+
+    :ivar fork: Last common block the branch continues
+    :type fork: Block
+    :ivar headers: Headers of the branch
+    :type headers: List[dict]
+    :ivar received: Downloaded blocks not validated yet, by hash
+    :type received: Dict[str, Block]
+    :ivar applied: Number of headers whose blocks were validated
+    :type applied: int
+    :ivar branch: Validated blocks kept until the whole branch is valid,
+                  None if blocks continue the local tip and are applied at once
+    :type branch: List[Block] or None
+    '''
+
+    def __init__(self, fork: Block, headers: List[dict], replace: bool = False):
+        '''
+        Download initialization
+
+        :param fork: Last common block the branch continues
+        :type fork: Block
+        :param headers: Validated headers of the branch
+        :type headers: List[dict]
+        :param replace: True if the branch replaces local blocks after the fork
+        :type replace: bool
+        '''
+        self.fork = fork
+        self.headers = headers
+        self.branch: Optional[List[Block]] = [] if replace else None
+        self.positions = {header["hash"]: position for position, header in enumerate(headers)}
+        self.received: Dict[str, Block] = {}
+        self.applied = 0
+
+    def add(self, block: Block) -> bool:
+        '''
+        Stores downloaded block if it belongs to the branch
+
+        :param block: Downloaded block
+        :type block: Block
+        :return: False if the block was not requested
+        :rtype: bool
+        '''
+        position = self.positions.get(block.hash)
+        if position is None or position < self.applied:
+            return False
+        if header_of(block) != self.headers[position]:
+            return False
+        self.received[block.hash] = block
+        return True
+
+    def ready(self) -> Iterator[Block]:
+        '''
+        Hands out downloaded blocks in chain order until one is missing
+
+        :return: Blocks following the last validated one
+        :rtype: Iterator[Block]
+        '''
+        while self.applied < len(self.headers):
+            block = self.received.pop(self.headers[self.applied]["hash"], None)
+            if block is None:
+                return
+            self.applied += 1
+            yield block
+
+    @property
+    def done(self) -> bool:
+        '''
+        True once all blocks were handed out
+
+        :return: Download state
+        :rtype: bool
+        '''
+        return self.applied == len(self.headers)
@@ -0,0 +1,251 @@
+'''
+This module contains inventory-based gossip.
+
+Instead of pushing every transaction and block to every neighbour, a
+node announces message ids (INV) and neighbours request only the
+messages they are missing (GETDATA). Announcements for one peer are
+collected for a short interval and sent as one small frame.
+'''
+
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+from utils.config import INV_INTERVAL, GETDATA_TIMEOUT, INVENTORY_TTL, INVENTORY_CAPACITY
+from utils.logger import Logger
+from .framing import MessageType, encode_frame
+from .outbound import Priority, priority_of
+
+log = Logger("inventory")
+
+ID_SIZE = 32  # Message ids are sha256 digests
+MAX_INV_IDS = 1000  # Maximum number of ids in one INV or GETDATA frame
+
+# Messages announced with INV instead of being pushed
+INVENTORY_TYPES = frozenset({
+    MessageType.NEW_BLOCK,
+    MessageType.NEW_SHARD_BLOCK,
+    MessageType.NEW_TRANSACTION,
+})
+
+
+def split_ids(data: bytes) -> List[bytes]:
+    '''
+    Splits INV or GETDATA payload into message ids
+
+    :param data: Concatenated ids
+    :type data: bytes
+    :return: Message ids
+    :rtype: List[bytes]
+    :raises ValueError: if payload length is not a multiple of ID_SIZE
+    '''
+    if len(data) % ID_SIZE:
+        raise ValueError(f"Inventory payload of {len(data)} bytes is not a list of ids")
+    return [data[i:i + ID_SIZE] for i in range(0, min(len(data), MAX_INV_IDS * ID_SIZE), ID_SIZE)]
+
+
+class Inventory:
+    '''
+    Announces local gossip messages and fetches announced ones
+
+    :ivar node: Node server the inventory belongs to
+    :type node: P2PSocket
+    :ivar interval: Seconds announcements are collected before sending
+    :type interval: float
+    :ivar request_timeout: Seconds to wait for requested message before asking another peer
+    :type request_timeout: float
+    :ivar announced: Number of ids announced to peers
+    :type announced: int
+    :ivar requested: Number of ids requested from peers
+    :type requested: int
+    '''
+
+    def __init__(self, node, interval: float = INV_INTERVAL, request_timeout: float = GETDATA_TIMEOUT,
+                 ttl: float = INVENTORY_TTL, capacity: int = INVENTORY_CAPACITY):
+        '''
+        Inventory initialization
+
+        :param node: Node server the inventory belongs to
+        :type node: P2PSocket
+        :param interval: Seconds announcements are collected before sending
+        :type interval: float
+        :param request_timeout: Seconds to wait for requested message before asking another peer
+        :type request_timeout: float
+        :param ttl: Seconds announced messages are kept for GETDATA
+        :type ttl: float
+        :param capacity: Maximum number of kept messages
+        :type capacity: int
+        '''
+        self.node = node
+        self.interval = interval
+        self.request_timeout = request_timeout
+        self.ttl = ttl
+        self.capacity = capacity
+        self.items = OrderedDict()  # id -> (expiry time, message type, frame)
+        self.pending = defaultdict(list)  # connection -> ids to announce
+        self.in_flight: Dict[bytes, Tuple[float, set]] = {}  # id -> (deadline, asked peers)
+        self.announced = 0
+        self.requested = 0
+        self.lock = threading.Lock()
+        self.flusher = None
+
+    def add(self, key: bytes, message_type: MessageType, frame: bytes, conns: List) -> None:
+        '''
+        Stores message and schedules its announcement
+
+        :param key: Message id
+        :type key: bytes
+        :param message_type: Message type
+        :type message_type: MessageType
+        :param frame: Encoded message frame
+        :type frame: bytes
+        :param conns: Connections to announce the message to
+        :type conns: List
+        '''
+        now = time.monotonic()
+        with self.lock:
+            while self.items and (
+                next(iter(self.items.values()))[0] <= now or len(self.items) >= self.capacity
+            ):
+                self.items.popitem(last=False)
+            self.items[key] = (now + self.ttl, message_type, frame)
+            self.in_flight.pop(key, None)
+            for conn in conns:
+                self.pending[conn].append(key)
+        self.start()
+
+    def start(self) -> None:
+        '''Starts the flush thread on first use'''
+        with self.lock:
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self.run, name="inventory", daemon=True)
+                self.flusher.start()
+
+    def get(self, key: bytes) -> Optional[Tuple[MessageType, bytes]]:
+        '''
+        Returns stored message
+
+        :param key: Message id
+        :type key: bytes
+        :return: Message type and frame or None if message is unknown or expired
+        :rtype: Tuple[MessageType, bytes] or None
+        '''
+        with self.lock:
+            item = self.items.get(key)
+            if item is None or item[0] <= time.monotonic():
+                return None
+            return item[1], item[2]
+
+    def run(self) -> None:
+        '''Sends collected announcements and repeats stalled requests every interval'''
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+                self.retry_requests()
+            except Exception as e:
+                log.error(f"Error during inventory flush: {e}")
+
+    def flush(self) -> None:
+        '''Sends one INV frame with collected ids to every peer'''
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(list)
+        for conn, keys in pending.items():
+            for start in range(0, len(keys), MAX_INV_IDS):
+                batch = keys[start:start + MAX_INV_IDS]
+                self.announced += len(batch)
+                self.node.enqueue(conn, encode_frame(MessageType.INV, b"".join(batch)), Priority.HIGH)
+
+    def request(self, conn, keys: List[bytes]) -> None:
+        '''
+        Sends GETDATA for messages to a peer
+
+        :param conn: Peer connection
+        :type conn: socket.connection
+        :param keys: Message ids
+        :type keys: List[bytes]
+        '''
+        self.requested += len(keys)
+        self.node.enqueue(conn, encode_frame(MessageType.GETDATA, b"".join(keys)), Priority.HIGH)
+
+    def retry_requests(self) -> None:
+        '''Asks another announcing peer for messages that were not delivered in time'''
+        now = time.monotonic()
+        retries = defaultdict(list)
+        with self.lock:
+            for key, (deadline, asked) in list(self.in_flight.items()):
+                if deadline > now:
+                    continue
+                candidates = self.node.seen.holders(key) - asked
+                if not candidates:
+                    del self.in_flight[key]
+                    continue
+                conn = next(iter(candidates))
+                asked.add(conn)
+                self.in_flight[key] = (now + self.request_timeout, asked)
+                retries[conn].append(key)
+        for conn, keys in retries.items():
+            self.request(conn, keys)
+
+    def handle_inv(self, data: bytes, conn) -> None:
+        '''
+        Requests announced messages the node does not have yet
+
+        :param data: Concatenated message ids
+        :type data: bytes
+        :param conn: Announcing connection
+        :type conn: socket.connection
+        '''
+        now = time.monotonic()
+        wanted = []
+        for key in split_ids(data):
+            if not self.node.seen.announce(key, conn):
+                continue  # Already received
+            with self.lock:
+                if key in self.in_flight:
+                    continue  # Requested from another peer
+                self.in_flight[key] = (now + self.request_timeout, {conn})
+            wanted.append(key)
+        if wanted:
+            self.request(conn, wanted)
+            self.start()  # Stalled requests are retried by the flush thread
+
+    def handle_getdata(self, data: bytes, conn) -> None:
+        '''
+        Sends requested messages back to the requester
+
+        :param data: Concatenated message ids
+        :type data: bytes
+        :param conn: Requesting connection
+        :type conn: socket.connection
+        '''
+        for key in split_ids(data):
+            item = self.get(key)
+            if item is not None:
+                message_type, frame = item
+                self.node.enqueue(conn, frame, priority_of(message_type))
+
+    def received(self, key: bytes) -> None:
+        '''
+        Marks requested message as delivered
+
+        :param key: Message id
+        :type key: bytes
+        '''
+        with self.lock:
+            self.in_flight.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        '''
+        Returns inventory statistics
+
+        :return: Number of stored messages, announced and requested ids
+        :rtype: Dict[str, int]
+        '''
+        with self.lock:
+            return {
+                "stored": len(self.items),
+                "announced": self.announced,
+                "requested": self.requested,
+                "in_flight": len(self.in_flight),
+            }
@@ -0,0 +1,162 @@
+'''
+This module contains per-connection outbound queues.
+
+Frames wait in a bounded priority queue until the connection's writer
+sends them, so a slow peer delays only itself. A peer whose queue grows
+past the high-water mark is disconnected.
+'''
+
+import heapq
+import itertools
+import threading
+from enum import IntEnum
+from typing import Optional
+from utils.config import OUTBOUND_HIGH_WATER
+from .framing import MessageType
+
+
+class Priority(IntEnum):
+    '''Send priority classes, lower values are sent first'''
+    HIGH = 0  # Requests and new blocks
+    NORMAL = 1  # Transactions and relayed messages
+    BULK = 2  # Whole chains and attachment blobs
+
+
+MESSAGE_PRIORITIES = {
+    MessageType.REQUEST_CHAIN: Priority.HIGH,
+    MessageType.GET_CHUNK: Priority.HIGH,
+    MessageType.INV: Priority.HIGH,
+    MessageType.GETDATA: Priority.HIGH,
+    MessageType.NEW_BLOCK: Priority.HIGH,
+    MessageType.NEW_SHARD_BLOCK: Priority.HIGH,
+    MessageType.COMPACT_BLOCK: Priority.HIGH,
+    MessageType.GET_BLOCK_TXN: Priority.HIGH,
+    MessageType.BLOCK_TXN: Priority.HIGH,
+    MessageType.GET_HEADERS: Priority.HIGH,
+    MessageType.GET_BLOCKS: Priority.HIGH,
+    MessageType.GET_SHARD_BLOCKS: Priority.HIGH,
+    MessageType.BLOCKCHAIN: Priority.BULK,
+    MessageType.BLOCKS: Priority.BULK,
+    MessageType.SHARD_BLOCKS: Priority.BULK,
+    MessageType.CHAIN_BLOCK: Priority.BULK,
+    MessageType.CHAIN_END: Priority.BULK,
+    MessageType.CHUNK: Priority.BULK,
+}
+
+
+def priority_of(message_type: MessageType) -> Priority:
+    '''
+    Returns send priority of a message type
+
+    :param message_type: Frame type
+    :type message_type: MessageType
+    :return: Priority class
+    :rtype: Priority
+    '''
+    return MESSAGE_PRIORITIES.get(message_type, Priority.NORMAL)
+
+
+class OutboundQueue:
+    '''
+    Bounded priority queue of encoded frames of one connection
+
+    Frames of the same priority keep their order.
+
+    :ivar high_water: Maximum number of queued bytes
+    :type high_water: int
+    :ivar size: Number of queued bytes
+    :type size: int
+    :ivar closed: True after the connection was closed
+    :type closed: bool
+    '''
+
+    def __init__(self, high_water: int = OUTBOUND_HIGH_WATER):
+        '''
+        Queue initialization
+
+        :param high_water: Maximum number of queued bytes
+        :type high_water: int
+        '''
+        self.high_water = high_water
+        self.size = 0
+        self.closed = False
+        self.frames = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+
+    def put(self, frame: bytes, priority: Priority = Priority.NORMAL) -> bool:
+        '''
+        Queues frame for sending
+
+        A frame larger than the high-water mark is accepted only into an
+        empty queue, so big chains can still be sent to a healthy peer.
+
+        :param frame: Encoded frame
+        :type frame: bytes
+        :param priority: Priority class
+        :type priority: Priority
+        :return: False if the queue is closed or would overflow
+        :rtype: bool
+        '''
+        with self.condition:
+            if self.closed:
+                return False
+            if self.size and self.size + len(frame) > self.high_water:
+                return False
+            heapq.heappush(self.frames, (priority, next(self.counter), frame))
+            self.size += len(frame)
+            self.condition.notify()
+            return True
+
+    def pop(self) -> Optional[bytes]:
+        '''
+        Takes the most urgent frame without waiting
+
+        :return: Frame or None if queue is empty
+        :rtype: bytes or None
+        '''
+        with self.condition:
+            if not self.frames:
+                return None
+            _, _, frame = heapq.heappop(self.frames)
+            self.size -= len(frame)
+            self.condition.notify_all()
+            return frame
+
+    def get(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        '''
+        Takes the most urgent frame, waiting until one is queued
+
+        :param timeout: Seconds to wait, forever if None
+        :type timeout: float or None
+        :return: Frame or None if queue was closed or timeout passed
+        :rtype: bytes or None
+        '''
+        with self.condition:
+            self.condition.wait_for(lambda: self.frames or self.closed, timeout)
+            if self.closed:
+                return None
+            return self.pop()
+
+    def wait_for_room(self, limit: int, timeout: Optional[float] = None) -> bool:
+        '''
+        Waits until the writer has sent queued frames down to the limit
+
+        :param limit: Number of queued bytes to wait for
+        :type limit: int
+        :param timeout: Seconds to wait, forever if None
+        :type timeout: float or None
+        :return: False if queue was closed or timeout passed
+        :rtype: bool
+        '''
+        with self.condition:
+            self.condition.wait_for(lambda: self.size <= limit or self.closed, timeout)
+            return not self.closed and self.size <= limit
+
+    def close(self) -> None:
+        '''Drops queued frames and wakes up the writer'''
+        with self.condition:
+            self.closed = True
+            self.frames.clear()
+            self.size = 0
+            self.condition.notify_all()
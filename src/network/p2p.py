@@ -3,9 +3,11 @@
 import threading
 import utils.logger as logger
 from .sockets import P2PSocket
+from .framing import MessageType
 from blockchain.transaction import Transaction
 import json5 as json
 from network.discovery import discover_peers
+from crypto.diffie_hellman import key_exchange_algorithm
 import traceback
 from blockchain.blockchain import Blockchain
 
@@ -40,6 +42,14 @@ class P2PNetwork:
     :type DigitalSignature:
     :ivar node: Node server of peer
     :type node: P2PSocket
+    :ivar group_manager: Manager of group chats local peer is a member of
+    :type group_manager: GroupManager or None
+    :ivar shard_manager: Manager of subscribed shard sub-chains if sharding is enabled
+    :type shard_manager: ShardManager or None
+    :ivar attachment_store: Local store of attachment blobs
+    :type attachment_store: AttachmentStore or None
+    :ivar attachment_fetcher: Downloader of attachment blobs from peers
+    :type attachment_fetcher: AttachmentFetcher or None
     '''
     def __init__(
         self,
@@ -96,6 +106,10 @@ class P2PNetwork:
         self.signature_manager = signature_manager
         self.node = node(self.host, self.port, self.blockchain, self.sync_manager, self.signature_manager, max_connections)
         self.ui_app = None
+        self.group_manager = None
+        self.shard_manager = None
+        self.attachment_store = None
+        self.attachment_fetcher = None
 
 
     def start(self):
@@ -139,6 +153,19 @@ class P2PNetwork:
         log.debug(f"Broadcasting message: {message}")
         self.node.broadcast(message, conn)
 
+    def relay(self, message_type: MessageType, payload: bytes, conn):
+        '''
+        Forwarding received message to all peers unchanged
+
+        :param message_type: Message type
+        :type message_type: MessageType
+        :param payload: Received payload
+        :type payload: bytes
+        :param conn: Sender connection
+        :type conn: socket.connection
+        '''
+        self.node.relay(message_type, payload, conn)
+
     def broadcast_transaction(self, transaction: Transaction, conn):
         '''
         Broadcasting transaction
@@ -163,6 +190,8 @@ class P2PNetwork:
             self.username,
             self.public_key,
             self.broadcast_interval,
+            self.signature_manager.algorithm,
+            key_exchange_algorithm(bytes.fromhex(self.public_key)),
         )
         log.info(f"Discovered peers: {list(self.peers)}")
 
@@ -0,0 +1,175 @@
+'''
+This module contains the cache of recently seen gossip messages.
+
+Blocks and transactions are relayed by every peer, so in a mesh the same
+message keeps coming back. Ids of seen messages are kept for a while
+together with the peers known to have them, so duplicates are dropped
+before they are parsed and nothing is sent back to a peer that has it.
+'''
+
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Set
+from utils.config import SEEN_MESSAGE_TTL, SEEN_MESSAGE_CAPACITY
+from .framing import MessageType
+
+# Messages that are relayed peer to peer and can loop
+GOSSIP_TYPES = frozenset({
+    MessageType.MESSAGE,
+    MessageType.NEW_BLOCK,
+    MessageType.NEW_SHARD_BLOCK,
+    MessageType.NEW_TRANSACTION,
+    MessageType.COMPACT_BLOCK,
+})
+
+
+def message_id(message_type: MessageType, payload: bytes) -> bytes:
+    '''
+    Returns id of a gossip message, relays keep payload bytes unchanged so it is stable across hops
+
+    :param message_type: Message type
+    :type message_type: MessageType
+    :param payload: Message payload
+    :type payload: bytes
+    :return: Message id
+    :rtype: bytes
+    '''
+    return hashlib.sha256(bytes([message_type]) + payload).digest()
+
+
+class SeenCache:
+    '''
+    Time-bounded set of message ids with the peers that have each message
+
+    :ivar ttl: Seconds an id is remembered
+    :type ttl: float
+    :ivar capacity: Maximum number of remembered ids
+    :type capacity: int
+    :ivar suppressed: Number of dropped duplicates by message type name
+    :type suppressed: Counter
+    '''
+
+    def __init__(self, ttl: float = SEEN_MESSAGE_TTL, capacity: int = SEEN_MESSAGE_CAPACITY):
+        '''
+        Cache initialization
+
+        :param ttl: Seconds an id is remembered
+        :type ttl: float
+        :param capacity: Maximum number of remembered ids
+        :type capacity: int
+        '''
+        self.ttl = ttl
+        self.capacity = capacity
+        self.entries = OrderedDict()  # id -> [expiry time, peers that have the message, received]
+        self.suppressed = Counter()
+        self.lock = threading.Lock()
+
+    def expire(self, now: float) -> None:
+        '''
+        Forgets expired ids and makes room for a new one, must be called with the lock held
+
+        :param now: Current monotonic time
+        :type now: float
+        '''
+        while self.entries:
+            expires = next(iter(self.entries.values()))[0]
+            if expires > now and len(self.entries) < self.capacity:
+                return
+            self.entries.popitem(last=False)
+
+    def check(self, key: bytes, message_type: MessageType, conn=None) -> bool:
+        '''
+        Records that a peer has a message
+
+        :param key: Message id
+        :type key: bytes
+        :param message_type: Message type, used for statistics
+        :type message_type: MessageType
+        :param conn: Connection the message came from, None for local messages
+        :type conn: socket.connection or None
+        :return: True if the message was not received before
+        :rtype: bool
+        '''
+        now = time.monotonic()
+        with self.lock:
+            self.expire(now)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.entries[key] = [now + self.ttl, {conn} if conn is not None else set(), True]
+                return True
+            if conn is not None:
+                entry[1].add(conn)
+            if not entry[2]:  # Only announced so far
+                entry[2] = True
+                return True
+            self.suppressed[message_type.name] += 1
+            return False
+
+    def announce(self, key: bytes, conn) -> bool:
+        '''
+        Records that a peer announced it has a message
+
+        :param key: Message id
+        :type key: bytes
+        :param conn: Announcing connection
+        :type conn: socket.connection
+        :return: True if the message was not received yet
+        :rtype: bool
+        '''
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.expire(now)
+                entry = self.entries[key] = [now + self.ttl, set(), False]
+            entry[1].add(conn)
+            return not entry[2]
+
+    def holders(self, key: bytes) -> Set:
+        '''
+        Returns peers known to have a message
+
+        :param key: Message id
+        :type key: bytes
+        :return: Connections
+        :rtype: Set
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            return set(entry[1]) if entry else set()
+
+    def fan_out(self, key: bytes, conns: Iterable) -> List:
+        '''
+        Selects peers that do not have a message yet and records it as sent to them
+
+        :param key: Message id
+        :type key: bytes
+        :param conns: Candidate connections
+        :type conns: Iterable
+        :return: Connections the message has to be sent to
+        :rtype: List
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                now = time.monotonic()
+                self.expire(now)
+                entry = self.entries[key] = [now + self.ttl, set(), True]
+            entry[2] = True
+            targets = [conn for conn in conns if conn not in entry[1]]
+            entry[1].update(targets)
+            return targets
+
+    def stats(self) -> Dict[str, int]:
+        '''
+        Returns cache statistics
+
+        :return: Number of remembered ids and suppressed duplicates, total and by type
+        :rtype: Dict[str, int]
+        '''
+        with self.lock:
+            stats = {"size": len(self.entries), "suppressed": sum(self.suppressed.values())}
+            stats.update({f"suppressed_{name.lower()}": count for name, count in self.suppressed.items()})
+            return stats
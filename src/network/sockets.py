@@ -5,7 +5,10 @@ This module contains main socket logic and its main handlers
 import socket
 import threading
 from utils import logger
-import zlib
+from .framing import FrameReader, MessageType, Payload, encode_frame, split_message
+from .outbound import OutboundQueue, Priority, priority_of
+from .seen import GOSSIP_TYPES, SeenCache, message_id
+from .inventory import INVENTORY_TYPES, Inventory
 
 log = logger.Logger("sockets")
 
@@ -26,6 +29,12 @@ class P2PSocket:
     :type socket: Socket
     :ivar connections: Peers active connections
     :type connections: List[(conn, addr)]
+    :ivar queues: Outbound queue of every active connection
+    :type queues: Dict[socket.connection, OutboundQueue]
+    :ivar seen: Recently seen gossip messages and peers that have them
+    :type seen: SeenCache
+    :ivar inventory: Announcements and requests of gossip messages
+    :type inventory: Inventory
     :ivar sync_manager: Syncronization manager instance that handles every blockchain action
     :type sync_manager: SyncManager
     :ivar signature_manager: Signature manager that handles every action with signing messages and transactions
@@ -55,6 +64,9 @@ class P2PSocket:
         self.max_connections = max_connections
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.connections = []  # Active connection list
+        self.queues = {}  # Outbound queue of every connection
+        self.seen = SeenCache()
+        self.inventory = Inventory(self)
         self.blockchain = blockchain
         self.sync_manager = sync_manager
         self.signature_manager = signature_manager
@@ -80,13 +92,64 @@ class P2PSocket:
                     )
                     conn.close()
                     continue
-                self.connections.append((conn, addr))
+                self.add_connection(conn, addr)
                 log.info(f"Connection established with {addr}")
-                threading.Thread(target=self.handle_client, args=(conn, addr)).start()
             except socket.error as e:
                 log.error(f"Error accepting connection: {e}")
                 return
 
+    def add_connection(self, conn, addr):
+        '''
+        Registers connection and starts its reader and writer threads.
+
+        :param conn: New connection
+        :type conn: socket.connection
+        :param addr: Connection's address
+        :type addr: Tuple(str, int)
+        '''
+        queue = OutboundQueue()
+        self.queues[conn] = queue
+        self.connections.append((conn, addr))
+        threading.Thread(target=self.write_loop, args=(conn, addr, queue), daemon=True).start()
+        threading.Thread(target=self.handle_client, args=(conn, addr)).start()
+
+    def write_loop(self, conn, addr, queue: OutboundQueue):
+        '''
+        Writer of one connection, sends queued frames until the queue is closed.
+
+        :param conn: Connection to write to
+        :type conn: socket.connection
+        :param addr: Connection's address
+        :type addr: Tuple(str, int)
+        :param queue: Connection's outbound queue
+        :type queue: OutboundQueue
+        '''
+        while True:
+            frame = queue.get()
+            if frame is None:
+                return
+            try:
+                conn.sendall(frame)
+            except socket.error as e:
+                log.error(f"Error sending to {addr}: {e}")
+                self.disconnect(conn)
+                return
+
+    def disconnect(self, conn):
+        '''
+        Drops connection, its reader thread then removes it from connections.
+
+        :param conn: Connection to drop
+        :type conn: socket.connection
+        '''
+        queue = self.queues.pop(conn, None)
+        if queue:
+            queue.close()
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # Already closed
+
     def handle_client(self, conn, addr):
         '''
         Client handler.
@@ -96,48 +159,22 @@ class P2PSocket:
         :param addr: Connection's address that needs to be handled
         :type addr: Tuple(str, int)
         '''
+        reader = FrameReader(conn)
         try:
             while True:
                 try:
-                    chunks = []
-                    while True:
-                        chunk = conn.recv(4096)
-                        if not chunk:
-                            break  # Connection closed
-                        chunks.append(chunk)
-                        if len(chunk) < 4096:
-                            break # Last chunk
-                    if not chunks:
-                        break # Leaving handle cycle if no data
-
-                    data = b"".join(chunks)
-                    data = zlib.decompress(data)
-
-                    log.debug(f"Received from {addr}: {data[:100].decode()}")
-
-                    if data.startswith(b"NEW_BLOCK"):
-                        block_data = data[len(b"NEW_BLOCK") :]
-                        self.sync_manager.handle_new_block(block_data, conn)
+                    try:
+                        frame = reader.read_frame()
+                    except ValueError as e:
+                        log.warning(f"Malformed frame from {addr}: {e}")
+                        break # Stream position is lost, connection has to be dropped
+                    if frame is None:
+                        break # Leaving handle cycle if connection closed
+                    message_type, data = frame
 
-                    elif data.startswith(b"REQUEST_CHAIN"):
-                        log.info("Sending blockchain")
-                        self.sync_manager.broadcast_chain()
-                        log.debug(f"Sent blockchain to {addr}")
+                    log.debug(f"Received {message_type.name} from {addr}: {data[:100].decode(errors='replace')}")
 
-                    elif data.startswith(b"BLOCKCHAIN"):
-                        blockchain = data[len(b"BLOCKCHAIN") :]
-                        self.sync_manager.handle_blockchain(blockchain, conn)
-
-
-                    elif data.startswith(b"NEW_TRANSACTION"):
-                        transaction_data = data[len(b"NEW_TRANSACTION") :]
-                        self.sync_manager.handle_new_transaction(transaction_data, conn)
-
-                    elif data.startswith(b"NEW_MESSAGE"):
-                        pass
-
-                    else:  # Simple message
-                        self.broadcast(data, conn)
+                    self.dispatch(message_type, data, conn, addr)
 
                 except ConnectionResetError as e:
                     break # Leaving handler cycle
@@ -148,25 +185,238 @@ class P2PSocket:
         except Exception as e:
             log.error(f"Error with client {addr}: {e}")
         finally:
+            queue = self.queues.pop(conn, None)
+            if queue:
+                queue.close()
             self.connections.remove((conn, addr))
             log.info(f"Connection closed with {addr}")
             conn.close()
 
+    def dispatch(self, message_type: MessageType, data: bytes, conn, addr):
+        '''
+        Passes received message to its handler.
+
+        :param message_type: Received frame type
+        :type message_type: MessageType
+        :param data: Frame payload
+        :type data: bytes
+        :param conn: Sender connection
+        :type conn: socket.connection
+        :param addr: Sender address
+        :type addr: Tuple(str, int)
+        '''
+        if message_type in GOSSIP_TYPES:
+            key = message_id(message_type, data)
+            if not self.seen.check(key, message_type, conn):
+                log.debug(f"Suppressed duplicate {message_type.name} from {addr}")
+                return
+            self.inventory.received(key)
+
+        if message_type == MessageType.INV:
+            self.inventory.handle_inv(data, conn)
+
+        elif message_type == MessageType.GETDATA:
+            self.inventory.handle_getdata(data, conn)
+
+        elif message_type == MessageType.NEW_BLOCK:
+            self.sync_manager.handle_new_block(data, conn)
+
+        elif message_type == MessageType.COMPACT_BLOCK:
+            self.sync_manager.handle_compact_block(data, conn)
+
+        elif message_type == MessageType.GET_BLOCK_TXN:
+            self.sync_manager.handle_get_block_txn(data, conn)
+
+        elif message_type == MessageType.BLOCK_TXN:
+            self.sync_manager.handle_block_txn(data, conn)
+
+        elif message_type == MessageType.GET_HEADERS:
+            self.sync_manager.handle_get_headers(data, conn)
+
+        elif message_type == MessageType.HEADERS:
+            self.sync_manager.handle_headers(data, conn)
+
+        elif message_type == MessageType.GET_BLOCKS:
+            self.sync_manager.handle_get_blocks(data, conn)
+
+        elif message_type == MessageType.BLOCKS:
+            self.sync_manager.handle_blocks(data, conn)
+
+        elif message_type == MessageType.REQUEST_CHAIN:
+            log.info(f"Streaming blockchain to {addr}")
+            self.sync_manager.send_chain(data, conn)
+
+        elif message_type == MessageType.CHAIN_BLOCK:
+            self.sync_manager.handle_chain_block(data, conn)
+
+        elif message_type == MessageType.CHAIN_END:
+            self.sync_manager.handle_chain_end(data, conn)
+
+        elif message_type == MessageType.BLOCKCHAIN:
+            self.sync_manager.handle_blockchain(data, conn)
+
+        elif message_type == MessageType.NEW_SHARD_BLOCK:
+            self.sync_manager.handle_new_shard_block(data, conn)
+
+        elif message_type == MessageType.GET_SHARD_BLOCKS:
+            self.sync_manager.handle_get_shard_blocks(data, conn)
+
+        elif message_type == MessageType.SHARD_BLOCKS:
+            self.sync_manager.handle_shard_blocks(data, conn)
+
+        elif message_type == MessageType.NEW_TRANSACTION:
+            self.sync_manager.handle_new_transaction(data, conn)
+
+        elif message_type == MessageType.GET_CHUNK:
+            self.sync_manager.handle_get_chunk(data, conn)
+
+        elif message_type == MessageType.CHUNK:
+            self.sync_manager.handle_chunk(data, conn)
+
+        elif message_type == MessageType.NEW_MESSAGE:
+            pass
+
+        else:  # Simple message
+            self.relay(MessageType.MESSAGE, data, conn)
+
     def broadcast(self, message: bytes, sender_conn):
         """
         Broadcastin message to everyone, except sender.
 
+        The message is framed once and the same frame is queued for every
+        peer, so the call does not wait for slow peers.
+
         :param message: Message that needs to be broadcasted
         :type message: bytes
         :param sender_conn: Connection of sender
         :type sender_conn: socket.connection
         """
-        for conn, _ in self.connections:
-            if conn != sender_conn:
-                try:
-                    conn.sendall(zlib.compress(message))
-                except socket.error as e:
-                    log.error(f"Error broadcasting to a connection: {e}")
+        message_type, payload = split_message(message)
+        self.broadcast_frame(encode_frame(message_type, payload), message_type, sender_conn,
+                             self.gossip_id(message_type, payload))
+
+    def relay(self, message_type: MessageType, payload: bytes, sender_conn):
+        """
+        Forwards received payload to everyone, except sender.
+
+        A payload read from the network is sent in the frame it arrived in,
+        without serializing or compressing it again.
+
+        :param message_type: Message type
+        :type message_type: MessageType
+        :param payload: Payload to forward
+        :type payload: bytes or Payload
+        :param sender_conn: Connection of sender
+        :type sender_conn: socket.connection
+        """
+        if isinstance(payload, Payload) and payload.message_type == message_type:
+            frame = payload.frame()
+        else:
+            frame = encode_frame(message_type, payload)
+        self.broadcast_frame(frame, message_type, sender_conn, self.gossip_id(message_type, payload))
+
+    def broadcast_frame(self, frame: bytes, message_type: MessageType, sender_conn, key: bytes = None):
+        """
+        Queues encoded frame for everyone, except sender and peers that already have it.
+
+        Blocks and transactions are only announced, peers fetch them with GETDATA.
+
+        :param frame: Encoded frame, shared by all queues
+        :type frame: bytes
+        :param message_type: Message type, defines send priority
+        :type message_type: MessageType
+        :param sender_conn: Connection of sender
+        :type sender_conn: socket.connection
+        :param key: Gossip message id, None for messages that are not gossiped
+        :type key: bytes or None
+        """
+        priority = priority_of(message_type)
+        conns = [conn for conn, _ in list(self.connections) if conn != sender_conn]
+        if key is not None:
+            conns = self.seen.fan_out(key, conns)
+            if message_type in INVENTORY_TYPES:
+                self.inventory.add(key, message_type, frame, conns)
+                return
+        for conn in conns:
+            self.enqueue(conn, frame, priority)
+
+    @staticmethod
+    def gossip_id(message_type: MessageType, payload: bytes):
+        """
+        Returns message id of gossip messages.
+
+        :param message_type: Message type
+        :type message_type: MessageType
+        :param payload: Message payload
+        :type payload: bytes
+        :return: Message id or None if message type is not gossiped
+        :rtype: bytes or None
+        """
+        return message_id(message_type, payload) if message_type in GOSSIP_TYPES else None
+
+    def send(self, message: bytes, conn):
+        """
+        Sending message to a single peer.
+
+        :param message: Message that needs to be sent
+        :type message: bytes
+        :param conn: Receiver connection
+        :type conn: socket.connection
+        """
+        message_type, payload = split_message(message)
+        self.enqueue(conn, encode_frame(message_type, payload), priority_of(message_type))
+
+    def enqueue(self, conn, frame: bytes, priority: Priority):
+        """
+        Queues frame for connection's writer, peers that fall behind are disconnected.
+
+        :param conn: Receiver connection
+        :type conn: socket.connection
+        :param frame: Encoded frame
+        :type frame: bytes
+        :param priority: Send priority
+        :type priority: Priority
+        """
+        queue = self.outbound_queue(conn)
+        if queue is None:
+            return  # Connection is closing
+        if not queue.put(frame, priority) and not queue.closed:
+            log.warning(f"Outbound queue overflow ({queue.size} bytes), disconnecting slow peer")
+            self.disconnect(conn)
+
+    def outbound_queue(self, conn):
+        """
+        Returns outbound queue of a connection.
+
+        :param conn: Receiver connection
+        :type conn: socket.connection
+        :return: Queue or None if connection is closing
+        :rtype: OutboundQueue or None
+        """
+        return self.queues.get(conn)
+
+    def stream(self, messages, conn):
+        """
+        Sends messages produced one by one, the next message is produced only
+        after the writer has sent the queue down to half of its high-water mark,
+        so long transfers neither overflow the queue nor are held in memory.
+
+        :param messages: Messages that need to be sent
+        :type messages: Iterator[bytes]
+        :param conn: Receiver connection
+        :type conn: socket.connection
+        """
+        def run():
+            try:
+                for message in messages:
+                    queue = self.outbound_queue(conn)
+                    if queue is None or not queue.wait_for_room(queue.high_water // 2):
+                        return  # Connection was closed
+                    self.send(message, conn)
+            except Exception as e:
+                log.error(f"Error during streaming: {e}")
+
+        threading.Thread(target=run, name="stream", daemon=True).start()
 
     def connect_to_peer(self, peer_host: str, peer_port: int):
         '''
@@ -187,10 +437,7 @@ class P2PSocket:
                 )
                 conn.close()
                 return None
-            self.connections.append((conn, (peer_host, peer_port)))
-            threading.Thread(
-                target=self.handle_client, args=(conn, (peer_host, peer_port))
-            ).start()
+            self.add_connection(conn, (peer_host, peer_port))
             log.info(f"Connected to peer {peer_host}:{peer_port}")
             return conn
         except socket.error as e:
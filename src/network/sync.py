@@ -5,6 +5,28 @@ from utils.logger import Logger
 from blockchain.transaction import Transaction
 from blockchain.blockchain import Block
 from blockchain.consensus import ProofOfWork
+from .framing import MessageType
+from .compact import (
+    MAX_PARTIAL_BLOCKS,
+    PartialBlock,
+    decode_transactions,
+    encode_compact_block,
+    encode_transactions,
+    encode_transactions_request,
+)
+from .download import BlockDownloader
+from .transfer import ChainStream, stream_blocks
+from .headers import (
+    MAX_BLOCKS_PER_REQUEST,
+    MAX_HEADERS,
+    BranchDownload,
+    block_locator,
+    decode_headers,
+    encode_headers,
+    find_fork,
+    validate_headers,
+)
+from collections import OrderedDict
 import socket
 
 log = Logger("sync")
@@ -20,6 +42,12 @@ class SyncManager:
     :type blockchain: Blockchain
     :ivar sync_interval: Syncronization interval
     :type sync_interval: int
+    :ivar partial_blocks: Compact blocks waiting for missing transactions
+    :type partial_blocks: OrderedDict
+    :ivar downloader: Downloader of missing blocks from several peers
+    :type downloader: BlockDownloader
+    :ivar streams: Chains being streamed by peers
+    :type streams: Dict[socket.connection, ChainStream]
     """
 
     def __init__(self, p2p_network, blockchain, sync_interval: int = 5):
@@ -36,10 +64,13 @@ class SyncManager:
         self.p2p_network = p2p_network
         self.blockchain = blockchain  # Локальная копия блокчейна
         self.sync_interval = sync_interval
+        self.partial_blocks = OrderedDict()  # block hash -> (block, compact payload, sender)
+        self.downloader = BlockDownloader(self)
+        self.streams = {}  # Chains requested with REQUEST_CHAIN
 
     def request_chain(self, peer_host: str, peer_port: int) -> None:
         """
-        Requests blockchain copy from given peer
+        Requests blocks the given peer has after our chain, they are streamed one by one
 
         :param peer_host: peer's host
         :type peer_host: str
@@ -50,39 +81,30 @@ class SyncManager:
             conn = self.p2p_network.node.get_connection(peer_host)
             if not conn:
                 return
-            self.p2p_network.broadcast_message(
-                b"REQUEST_CHAIN", conn
-            )  # Ensure all data is sent
-            log.info(f"Requesting blockchain from {peer_host}:{peer_port}")
+            self.request_chain_stream(conn)
+            log.info(f"Requesting chain from {peer_host}:{peer_port}")
 
         except socket.error as e:
             log.error(f"Error requesting chain: {e}")
         except Exception as e:
             log.error(f"Error during chain request: {e}")
 
-    def merge_chain(self, received_chain: list) -> None:
+    def request_chain_stream(self, conn) -> None:
         """
-        Updates local blockchain if recieved chain is longer and valid
+        Sends locator of the local chain, the peer streams blocks after the last common block
 
-        :param received_chain: Recieved chain
-        :type received_chain: List[Block]
+        :param conn: Peer connection
+        :type conn: socket.connection
         """
-        if not received_chain:
-            log.info("Received empty chain")
-            return
-
-        if len(received_chain) > len(self.blockchain.chain):
-            if self.blockchain.validator.validate_blockchain(self.blockchain):
-                self.blockchain.chain = received_chain
-                log.info("Local blockchain updated.")
-            else:
-                log.warning("Received blockchain is not valid")
-        else:
-            log.debug("Received chain is not longer than the local chain.")
+        self.streams[conn] = ChainStream(self.blockchain)
+        locator = json.dumps({"locator": block_locator(self.blockchain.chain)}).encode()
+        self.p2p_network.node.send(b"REQUEST_CHAIN" + locator, conn)
 
     def broadcast_block(self, block: Block, conn) -> None:
         """
-        Broadcast new block every known peer.
+        Broadcast new block every known peer as a compact block.
+
+        Peers rebuild it from their pending transactions and request only the missing ones.
 
         :param block: New block to add to a chain
         :type block: Block
@@ -94,39 +116,213 @@ class SyncManager:
             return
         log.debug("Broadcasting new block...")
 
-        block_bytes = json.dumps(block.to_dict(), ensure_ascii=False).encode()
+        self.p2p_network.broadcast_message(b"COMPACT_BLOCK" + encode_compact_block(block), conn)
+
+    def send_chain(self, request_data: bytes, conn) -> None:
+        """
+        Streams blocks after the last block the requester has, whole chain if it sent no locator
+
+        :param request_data: Block locator of the requester, may be empty
+        :type request_data: bytes
+        :param conn: Requester connection
+        :type conn: socket.connection
+        """
+        try:
+            chain = self.blockchain.chain
+            if not chain:
+                log.debug("Cannot send empty chain")
+                return
+            fork = -1
+            if request_data:
+                fork = find_fork(chain, json.loads(request_data.decode())["locator"])
+                if fork is None:
+                    log.warning("Peer chain has no common block with ours")
+                    return
+            log.debug(f"Streaming chain after block {fork}...")
+            self.p2p_network.node.stream(stream_blocks(chain, fork + 1), conn)
+        except Exception as e:
+            log.error(f"Error during chain request handling: {e}")
+
+    def request_headers(self, conn) -> None:
+        """
+        Sends locator of the local chain, the peer answers with headers after the last common block
+
+        :param conn: Peer connection
+        :type conn: socket.connection
+        """
+        locator = json.dumps({"locator": block_locator(self.blockchain.chain)}).encode()
+        self.p2p_network.node.send(b"GET_HEADERS" + locator, conn)
+
+    def handle_get_headers(self, request_data: bytes, conn) -> None:
+        """
+        Sends headers of blocks after the last block the requester has
 
-        self.p2p_network.broadcast_message(b"NEW_BLOCK" + block_bytes, conn)
+        :param request_data: Block locator of the requester
+        :type request_data: bytes
+        :param conn: Requester connection
+        :type conn: socket.connection
+        """
+        try:
+            chain = self.blockchain.chain
+            fork = find_fork(chain, json.loads(request_data.decode())["locator"])
+            if fork is None:
+                log.warning("Peer chain has no common block with ours")
+                return
+            blocks = chain[fork + 1:fork + 1 + MAX_HEADERS]
+            if blocks:
+                self.p2p_network.node.send(b"HEADERS" + encode_headers(blocks), conn)
+        except Exception as e:
+            log.error(f"Error during headers request handling: {e}")
 
-    def broadcast_chain(self, conn) -> None:
+    def handle_headers(self, headers_data: bytes, conn) -> None:
         """
-        Broadcast chain to peer
+        Starts download of block bodies if the announced branch is longer than our chain
 
+        :param headers_data: Headers after the last common block
+        :type headers_data: bytes
         :param conn: Sender connection
         :type conn: socket.connection
         """
-        if not self.blockchain.chain:
-            log.debug("Cannot broadcast empty chain")
-            return
-        log.debug("Broadcasting chain...")
+        try:
+            headers = decode_headers(headers_data)
+            if not headers:
+                return
+            fork = self.blockchain.get_block(headers[0]["previous_hash"])
+            if fork is None:
+                log.warning("Received headers do not connect to our chain")
+                return
+            if not validate_headers(headers, fork):
+                log.warning("Received headers do not form a chain")
+                return
+            if self.downloader.add_peer(conn, headers):
+                return  # Peer helps with the download in progress
+            if fork.index + len(headers) < len(self.blockchain.chain):
+                log.debug("Received branch is not longer than the local chain.")
+                return
 
-        chain_bytes = json.dumps(
-            [block.to_dict() for block in self.blockchain.chain], ensure_ascii=False
-        ).encode()
-        self.p2p_network.broadcast_message(b"BLOCKCHAIN" + chain_bytes, conn)
+            # Blocks we already have are not downloaded again
+            chain = self.blockchain.chain
+            known = 0
+            while known < len(headers) and headers[known]["index"] < len(chain) \
+                    and chain[headers[known]["index"]].hash == headers[known]["hash"]:
+                known += 1
+            if known:
+                fork, headers = chain[headers[known - 1]["index"]], headers[known:]
+            if not headers or not self.downloader.start(fork, headers, fork is not chain[-1], conn):
+                return
+            if len(headers) > self.downloader.batch_size:
+                # Other peers that have the branch join the download with their headers
+                for other, _ in list(self.p2p_network.node.connections):
+                    if other is not conn:
+                        self.request_headers(other)
+        except Exception as e:
+            log.error(f"Error during headers handling: {e}")
+
+    def request_blocks(self, hashes: list, conn) -> None:
+        """
+        Requests block bodies from a peer
+
+        :param hashes: Block hashes
+        :type hashes: List[str]
+        :param conn: Peer connection
+        :type conn: socket.connection
+        """
+        self.p2p_network.node.send(b"GET_BLOCKS" + json.dumps(hashes).encode(), conn)
+
+    def handle_get_blocks(self, request_data: bytes, conn) -> None:
+        """
+        Sends requested blocks back to the requester
+
+        :param request_data: Block hashes
+        :type request_data: bytes
+        :param conn: Requester connection
+        :type conn: socket.connection
+        """
+        try:
+            hashes = json.loads(request_data.decode())[:MAX_BLOCKS_PER_REQUEST]
+            blocks = [self.blockchain.get_block(block_hash) for block_hash in hashes]
+            blocks_bytes = json.dumps(
+                [block.to_dict() for block in blocks if block is not None], ensure_ascii=False
+            ).encode()
+            self.p2p_network.node.send(b"BLOCKS" + blocks_bytes, conn)
+        except Exception as e:
+            log.error(f"Error during blocks request handling: {e}")
+
+    def handle_blocks(self, blocks_data: bytes, conn) -> None:
+        """
+        Passes downloaded blocks to the downloader
+
+        :param blocks_data: Requested blocks
+        :type blocks_data: bytes
+        :param conn: Sender connection
+        :type conn: socket.connection
+        """
+        try:
+            blocks = [Block.from_dict(block_data) for block_data in json.loads(blocks_data.decode())]
+            if self.downloader.received(blocks, conn):
+                # The peer may have more blocks than fit in one HEADERS message
+                self.request_headers(conn)
+        except Exception as e:
+            log.error(f"Error during blocks handling: {e}")
+
+    def apply_download(self, download: BranchDownload) -> bool:
+        """
+        Validates and applies blocks of the download that arrived in order
+
+        A branch that continues our tip is applied block by block, a branch
+        from an earlier block replaces our blocks once all of it is valid.
+
+        :param download: Current download
+        :type download: BranchDownload
+        :return: True if the download was completed
+        :rtype: bool
+        :raises ValueError: if a downloaded block is invalid
+        """
+        chain = self.blockchain.chain
+        for block in download.ready():
+            if download.branch is None:
+                if block.index < len(chain) and chain[block.index].hash == block.hash:
+                    continue  # Already received as a new block
+                previous = chain[-1]
+            else:
+                previous = download.branch[-1] if download.branch else download.fork
+            if not self.blockchain.validator.validate_block(block, previous):
+                raise ValueError(f"Downloaded block {block.index} is invalid")
+            if download.branch is None:
+                chain.append(block)
+                self.blockchain.remove_pending_transactions(block.transactions)
+            else:
+                download.branch.append(block)
+
+        if not download.done:
+            return False
+        if download.branch and download.fork.index + len(download.branch) >= len(chain):
+            del chain[download.fork.index + 1:]
+            chain.extend(download.branch)
+            for block in download.branch:
+                self.blockchain.remove_pending_transactions(block.transactions)
+            log.info(f"Switched to a longer branch after block {download.fork.index}")
+        log.info(f"Chain synchronized up to block {len(chain) - 1}")
+        return True
 
     def start_sync_loop(self) -> None:
         """
-        Automated syncronization cycle with known peers
+        Automated syncronization cycle with connected peers.
+
+        Every peer is asked for headers, so all peers that have the missing
+        blocks take part in the download.
         """
 
         log.debug("Starting synchronization loop...")
-        if len(self.p2p_network.peers):
-            for peer in self.p2p_network.peers:
-                try:
-                    self.request_chain(peer[0], peer[1])
-                except Exception as e:
-                    log.error(f"Error syncing with peer {peer}: {e}")
+        shard_manager = self.p2p_network.shard_manager
+        for conn, addr in list(self.p2p_network.node.connections):
+            try:
+                self.request_headers(conn)
+                if shard_manager:
+                    for shard_id in list(shard_manager.shards):
+                        self.request_shard_blocks(shard_id, conn)
+            except Exception as e:
+                log.error(f"Error syncing with peer {addr}: {e}")
 
     def handle_new_block(self, block_data: bytes, conn) -> None:
         """
@@ -138,43 +334,154 @@ class SyncManager:
         :type conn: socket.connection
         """
         try:
-            block_dict = json.loads(block_data.decode())
-            for transaction in block_dict["transactions"]:
-                if transaction["signature"]:
-                    transaction["signature"] = (
-                        bytes.fromhex(transaction["signature"])
-                        if transaction["signature"]
-                        else None
-                    )
-                if transaction["sender"]:
-                    transaction["sender"] = (
-                        bytes.fromhex(transaction["sender"])
-                        if transaction["sender"]
-                        else None
-                    )
-                transaction["recipient"] = bytes.fromhex(transaction["recipient"])
-                if transaction["sign_public_key"]:
-                    transaction["sign_public_key"] = bytes.fromhex(
-                        transaction["sign_public_key"]
-                    )
-            block_dict["transactions"] = [
-                Transaction(**transaction) for transaction in block_dict["transactions"]
-            ]
-            block = Block(**block_dict)
+            block = Block.from_dict(json.loads(block_data.decode()))
             if self.blockchain.contains_block(block):
                 return
+            self.accept_block(block, MessageType.NEW_BLOCK, block_data, conn)
+
+        except Exception as e:
+            log.error(f"Error during block handling: {e}")
+
+    def accept_block(self, block: Block, message_type: MessageType, block_data: bytes, conn) -> bool:
+        """
+        Appends received block to the chain and relays the message it came in.
+
+        :param block: Received block
+        :type block: Block
+        :param message_type: Type of the message the block came in
+        :type message_type: MessageType
+        :param block_data: Message payload to relay
+        :type block_data: bytes
+        :param conn: Sender connection
+        :type conn: socket.connection
+        :return: True if the block was added
+        :rtype: bool
+        """
+        if not self.blockchain.validator.validate_block(
+            block, self.blockchain.get_latest_block()
+        ):
+            log.warning("Invalid block received")
+            return False
+        self.blockchain.chain.append(block)
+        self.blockchain.remove_pending_transactions(block.transactions)
+        self.p2p_network.relay(message_type, block_data, conn)
+        log.info(f"Added new block with index {block.index}")
+        return True
+
+    def handle_compact_block(self, block_data: bytes, conn) -> None:
+        """
+        Rebuilds a compact block from pending transactions, missing ones are requested from the sender.
+
+        :param block_data: Block header and short transaction ids
+        :type block_data: bytes
+        :param conn: Sender connection
+        :type conn: socket.connection
+        """
+        try:
+            partial = PartialBlock.decode(block_data)
+            if partial.hash in self.partial_blocks or self.blockchain.get_block(partial.hash):
+                return
 
-            if self.blockchain.validator.validate_block(
-                block, self.blockchain.get_latest_block()
-            ):
-                self.blockchain.chain.append(block)
-                self.broadcast_block(block, conn)
-                log.info(f"Added new block with index {block.index}")
+            found = partial.fill_from_mempool(self.blockchain.pending_transactions)
+            missing = partial.missing()
+            log.debug(f"Compact block {partial.header['index']}: "
+                      f"{found} transactions from mempool, {len(missing)} missing")
+            if missing:
+                self.request_block_transactions(partial, block_data, conn, missing)
             else:
-                log.warning("Invalid block received")
+                self.complete_compact_block(partial, block_data, conn)
 
         except Exception as e:
-            log.error(f"Error during block handling: {e}")
+            log.error(f"Error during compact block handling: {e}")
+
+    def request_block_transactions(self, partial: PartialBlock, block_data: bytes, conn,
+                                   missing: list) -> None:
+        """
+        Keeps partial block until missing transactions arrive and requests them from the sender.
+
+        :param partial: Partially rebuilt block
+        :type partial: PartialBlock
+        :param block_data: Compact block payload to relay once the block is complete
+        :type block_data: bytes
+        :param conn: Sender connection
+        :type conn: socket.connection
+        :param missing: Positions of missing transactions
+        :type missing: List[int]
+        """
+        self.partial_blocks[partial.hash] = (partial, block_data, conn)
+        while len(self.partial_blocks) > MAX_PARTIAL_BLOCKS:
+            self.partial_blocks.popitem(last=False)
+        self.p2p_network.node.send(
+            b"GET_BLOCK_TXN" + encode_transactions_request(partial.hash, missing), conn
+        )
+
+    def complete_compact_block(self, partial: PartialBlock, block_data: bytes, conn) -> None:
+        """
+        Adds rebuilt block to the chain.
+
+        If the rebuilt block does not match its hash because of a short id
+        collision, all its transactions are requested from the sender once.
+
+        :param partial: Block with all transactions found
+        :type partial: PartialBlock
+        :param block_data: Compact block payload to relay
+        :type block_data: bytes
+        :param conn: Sender connection
+        :type conn: socket.connection
+        """
+        block = partial.to_block()
+        if block is None:
+            if partial.collided:
+                self.partial_blocks.pop(partial.hash, None)
+                log.warning("Transactions of compact block do not match its hash")
+                return
+            log.warning(f"Short id collision in compact block {partial.header['index']}")
+            partial.reset()
+            self.request_block_transactions(partial, block_data, conn, partial.missing())
+            return
+        self.partial_blocks.pop(partial.hash, None)
+        self.accept_block(block, MessageType.COMPACT_BLOCK, block_data, conn)
+
+    def handle_get_block_txn(self, request_data: bytes, conn) -> None:
+        """
+        Sends requested transactions of a block back to the requester.
+
+        :param request_data: Block hash and positions of transactions
+        :type request_data: bytes
+        :param conn: Requester connection
+        :type conn: socket.connection
+        """
+        try:
+            request = json.loads(request_data.decode())
+            block = self.blockchain.get_block(request["hash"])
+            if block is None:
+                return
+            transactions = [block.transactions[index] for index in request["indexes"]]
+            self.p2p_network.node.send(
+                b"BLOCK_TXN" + encode_transactions(block.hash, transactions), conn
+            )
+        except Exception as e:
+            log.error(f"Error during block transactions request handling: {e}")
+
+    def handle_block_txn(self, transactions_data: bytes, conn) -> None:
+        """
+        Completes a compact block with requested transactions.
+
+        :param transactions_data: Block hash and transactions
+        :type transactions_data: bytes
+        :param conn: Sender connection
+        :type conn: socket.connection
+        """
+        try:
+            block_hash, transactions = decode_transactions(transactions_data)
+            waiting = self.partial_blocks.get(block_hash)
+            if waiting is None:
+                return
+            partial, block_data, sender = waiting
+            partial.fill(partial.missing(), transactions)
+            self.complete_compact_block(partial, block_data, sender)
+        except Exception as e:
+            log.error(f"Error during block transactions handling: {e}")
 
     def handle_new_transaction(self, transaction_data: bytes, conn) -> None:
         """
@@ -186,78 +493,309 @@ class SyncManager:
         :type conn: socket.connection
         """
         try:
-            transaction_string = transaction_data.decode()
-            transaction_dict = json.loads(transaction_string)
-            if transaction_dict["sender"]:
-                transaction_dict["sender"] = (
-                    bytes.fromhex(transaction_dict["sender"])
-                    if transaction_dict["sender"]
-                    else None
-                )
-            transaction_dict["recipient"] = bytes.fromhex(transaction_dict["recipient"])
-            if transaction_dict["signature"]:
-                transaction_dict["signature"] = (
-                    bytes.fromhex(transaction_dict["signature"])
-                    if transaction_dict["signature"]
-                    else None
-                )
-            if transaction_dict["sign_public_key"]:
-                transaction_dict["sign_public_key"] = bytes.fromhex(
-                    transaction_dict["sign_public_key"]
-                )
-            transaction = Transaction(**transaction_dict)
-            if transaction in self.blockchain.pending_transactions:
+            transaction = Transaction.from_dict(json.loads(transaction_data.decode()))
+            chain = self.blockchain
+            shard_manager = self.p2p_network.shard_manager
+            shard_id = shard_manager.route(transaction) if shard_manager else None
+            if shard_id is not None:
+                subscribed = shard_manager.get_shard(shard_id) is not None
+                chain = shard_manager.accept_transaction(transaction)
+                if chain is None:
+                    # Not our shard: relay without storing, balances are not checked
+                    # but forged signatures are not passed on
+                    if not transaction.is_valid(
+                        transaction.sign_public_key, self.blockchain.validator.signature_algorithm
+                    ):
+                        log.warning("Invalid transaction received for another shard")
+                        return
+                    self.p2p_network.relay(MessageType.NEW_TRANSACTION, transaction_data, conn)
+                    return
+                if not subscribed:
+                    # Blocks mined before the subscription
+                    self.request_shard_blocks(shard_id, conn)
+
+            if chain.has_pending_transaction(transaction):
                 return
 
             log.debug(f"Received transaction {transaction.calculate_hash()}")
-            if self.blockchain.is_transaction_valid(transaction):
-                self.blockchain.pending_transactions.append(transaction)
-                dh_public_key = bytes.fromhex(self.p2p_network.public_key)
-                if transaction.recipient == dh_public_key:
-                    self.p2p_network.ui_app.handle_messages(self.p2p_network.public_key, transaction.sender)
-                self.p2p_network.broadcast_transaction(transaction, conn)
-                if len(self.blockchain.pending_transactions) >= 3:
-                    new_block, reward_transaction = self.blockchain.mine_pending_transactions(ProofOfWork, dh_public_key)
-                    if new_block is None or reward_transaction is None:
-                        return
-                    self.broadcast_block(new_block, None)
-                    self.p2p_network.broadcast_transaction(reward_transaction, None)
+            if chain.is_transaction_valid(transaction):
+                chain.add_pending_transaction(transaction)
+                self.notify_ui(transaction)
+                self.p2p_network.relay(MessageType.NEW_TRANSACTION, transaction_data, conn)
+                if len(chain.pending_transactions) >= 3:
+                    self.mine_pending(chain)
                 log.info(f"Added new transaction from network")
             else:
                 log.warning("Invalid transaction received")
         except Exception as e:
             log.error(f"Error during transaction handling: {e}")
 
-    def handle_blockchain(self, blockchain):
+    def notify_ui(self, transaction: Transaction) -> None:
+        """
+        Refreshes chats affected by a received transaction and joins groups
+        from invitations in it. Headless nodes only join groups.
+
+        :param transaction: Received transaction
+        :type transaction: Transaction
+        """
+        ui_app = self.p2p_network.ui_app
+        dh_public_key = bytes.fromhex(self.p2p_network.public_key)
+        if ui_app and any(
+            message.recipient == dh_public_key
+            for message in transaction.messages()
+        ):
+            ui_app.handle_messages(dh_public_key, transaction.sender)
+        group_manager = self.p2p_network.group_manager
+        if group_manager:
+            for group in group_manager.process_transaction(transaction):
+                log.info(f"Joined group {group.name}")
+            for message in transaction.messages():
+                if ui_app and group_manager.get_group(message.recipient):
+                    ui_app.handle_group_messages(message.recipient)
+
+    def mine_pending(self, chain=None) -> None:
+        """
+        Mines pending transactions of the main chain or of a shard sub-chain
+        and broadcasts the new block.
+
+        Before a main chain block is mined, changed shard heads are anchored into it.
+
+        :param chain: Chain to mine, main chain by default
+        :type chain: Blockchain or None
+        """
+        chain = chain or self.blockchain
+        dh_public_key = bytes.fromhex(self.p2p_network.public_key)
+        shard_manager = self.p2p_network.shard_manager
+
+        if chain is self.blockchain:
+            if shard_manager:
+                self.add_shard_anchor()
+            new_block, reward_transaction = chain.mine_pending_transactions(ProofOfWork, dh_public_key)
+            if new_block is None or reward_transaction is None:
+                return
+            self.broadcast_block(new_block, None)
+            self.p2p_network.broadcast_transaction(reward_transaction, None)
+        else:
+            new_block, _ = chain.mine_pending_transactions(
+                ProofOfWork, dh_public_key, reward=False
+            )
+            if new_block is None:
+                return
+            self.broadcast_shard_block(shard_manager.shard_id_of(chain), new_block, None)
+
+    def add_shard_anchor(self) -> None:
+        """Commits changed shard heads to the main chain with a signed anchor transaction."""
+        signature_manager = self.p2p_network.signature_manager
+        anchor = self.p2p_network.shard_manager.anchor_transaction(
+            bytes.fromhex(self.p2p_network.public_key),
+            signature_manager.get_public_key(),
+        )
+        if not anchor:
+            return
+        anchor.sign_transaction(signature_manager)
+        self.blockchain.add_transaction(anchor)
+        self.p2p_network.broadcast_transaction(anchor, None)
+        log.debug("Anchored shard heads into main chain")
+
+    def broadcast_shard_block(self, shard_id: int, block: Block, conn) -> None:
+        """
+        Broadcast new block of a shard sub-chain.
+
+        :param shard_id: Shard id
+        :type shard_id: int
+        :param block: New shard block
+        :type block: Block
+        :param conn: Sender connection
+        :type conn: socket.connection or None
+        """
+        log.debug(f"Broadcasting new block of shard {shard_id}...")
+        block_bytes = json.dumps(
+            {"shard": shard_id, "block": block.to_dict()}, ensure_ascii=False
+        ).encode()
+        self.p2p_network.broadcast_message(b"NEW_SHARD_BLOCK" + block_bytes, conn)
+
+    def handle_new_shard_block(self, block_data: bytes, conn) -> None:
+        """
+        Handles new shard block, recieved from other peer.
+
+        Blocks of subscribed shards are validated and stored, others are only relayed.
+
+        :param block_data: Shard id and block information
+        :type block_data: bytes
+        :param conn: Sender connection
+        :type conn: socket.connection
+        """
+        shard_manager = self.p2p_network.shard_manager
+        if not shard_manager:
+            return
+        try:
+            data = json.loads(block_data.decode())
+            shard_id = int(data["shard"])
+            if shard_manager.get_shard(shard_id) is None:
+                self.p2p_network.relay(MessageType.NEW_SHARD_BLOCK, block_data, conn)
+                return
+
+            block = Block.from_dict(data["block"])
+            if shard_manager.add_shard_block(shard_id, block):
+                self.p2p_network.relay(MessageType.NEW_SHARD_BLOCK, block_data, conn)
+                log.info(f"Added block {block.index} to shard {shard_id}")
+            elif block.index >= len(shard_manager.get_shard(shard_id)):
+                # Blocks between our head and this one are missing
+                self.request_shard_blocks(shard_id, conn)
+        except Exception as e:
+            log.error(f"Error during shard block handling: {e}")
+
+    def request_shard_blocks(self, shard_id: int, conn) -> None:
+        """
+        Requests shard blocks after the local head of a subscribed shard
+
+        :param shard_id: Shard id
+        :type shard_id: int
+        :param conn: Peer connection
+        :type conn: socket.connection
+        """
+        shard = self.p2p_network.shard_manager.get_shard(shard_id)
+        request = json.dumps({"shard": shard_id, "after": shard.get_latest_block().hash}).encode()
+        self.p2p_network.node.send(b"GET_SHARD_BLOCKS" + request, conn)
+
+    def handle_get_shard_blocks(self, request_data: bytes, conn) -> None:
+        """
+        Sends blocks of a subscribed shard after the last block the requester has
+
+        :param request_data: Shard id and hash of the requester's shard head
+        :type request_data: bytes
+        :param conn: Requester connection
+        :type conn: socket.connection
+        """
+        shard_manager = self.p2p_network.shard_manager
+        if not shard_manager:
+            return
+        try:
+            request = json.loads(request_data.decode())
+            shard_id = int(request["shard"])
+            blocks = shard_manager.blocks_after(shard_id, request["after"], MAX_BLOCKS_PER_REQUEST)
+            if not blocks:
+                return
+            blocks_bytes = json.dumps(
+                {"shard": shard_id, "blocks": [block.to_dict() for block in blocks]}, ensure_ascii=False
+            ).encode()
+            self.p2p_network.node.send(b"SHARD_BLOCKS" + blocks_bytes, conn)
+        except Exception as e:
+            log.error(f"Error during shard blocks request handling: {e}")
+
+    def handle_shard_blocks(self, blocks_data: bytes, conn) -> None:
+        """
+        Applies synced blocks of a subscribed shard and requests more if the peer has them
+
+        :param blocks_data: Shard id and requested blocks
+        :type blocks_data: bytes
+        :param conn: Sender connection
+        :type conn: socket.connection
+        """
+        shard_manager = self.p2p_network.shard_manager
+        if not shard_manager:
+            return
+        try:
+            data = json.loads(blocks_data.decode())
+            shard_id = int(data["shard"])
+            blocks = [Block.from_dict(block_data) for block_data in data["blocks"]]
+            added = shard_manager.add_shard_blocks(shard_id, blocks)
+            if added:
+                log.info(f"Synced {added} blocks of shard {shard_id}")
+            if added and len(blocks) == MAX_BLOCKS_PER_REQUEST:
+                self.request_shard_blocks(shard_id, conn)
+        except Exception as e:
+            log.error(f"Error during shard blocks handling: {e}")
+
+    def handle_get_chunk(self, request_data: bytes, conn) -> None:
+        """
+        Sends requested attachment blobs that are stored locally back to the requester.
+
+        :param request_data: JSON list of blob hashes
+        :type request_data: bytes
+        :param conn: Requester connection
+        :type conn: socket.connection
+        """
+        attachment_store = self.p2p_network.attachment_store
+        if not attachment_store:
+            return
+        try:
+            for hash_hex in json.loads(request_data.decode()):
+                blob = attachment_store.blobs.get(hash_hex)
+                if blob is not None:
+                    self.p2p_network.node.send(b"CHUNK" + hash_hex.encode() + blob, conn)
+        except Exception as e:
+            log.error(f"Error during chunk request handling: {e}")
+
+    def handle_chunk(self, chunk_data: bytes, conn) -> None:
+        """
+        Stores a requested attachment blob received from another peer.
+
+        :param chunk_data: Blob hash (64 hex characters) followed by blob content
+        :type chunk_data: bytes
+        :param conn: Sender connection
+        :type conn: socket.connection
+        """
+        fetcher = self.p2p_network.attachment_fetcher
+        if not fetcher:
+            return
+        try:
+            hash_hex = chunk_data[:64].decode()
+            if not fetcher.is_wanted(hash_hex):
+                return
+            fetcher.attachments.blobs.put(chunk_data[64:], hash_hex)
+            fetcher.chunk_received(hash_hex)
+        except Exception as e:
+            log.error(f"Error during chunk handling: {e}")
+
+    def handle_chain_block(self, block_data: bytes, conn) -> None:
+        """
+        Validates and applies next block of a chain streamed by a peer
+
+        Blocks of an aborted stream are dropped without being decoded.
+
+        :param block_data: Block information
+        :type block_data: bytes
+        :param conn: Sender connection
+        :type conn: socket.connection
         """
-        Handles new blockchain, recieved from another peer.
+        stream = self.streams.get(conn)
+        if stream is None or stream.aborted:
+            return
+        try:
+            stream.add(Block.from_dict(json.loads(block_data.decode())))
+        except Exception as e:
+            stream.aborted = True
+            log.warning(f"{e}, chain transfer aborted")
+
+    def handle_chain_end(self, end_data: bytes, conn) -> None:
+        """
+        Finishes chain streamed by a peer
+
+        :param end_data: Empty payload
+        :type end_data: bytes
+        :param conn: Sender connection
+        :type conn: socket.connection
+        """
+        stream = self.streams.pop(conn, None)
+        if stream is not None and not stream.aborted:
+            stream.finish()
+
+    def handle_blockchain(self, blockchain, conn):
+        """
+        Handles whole blockchain sent in one message by another peer.
+
+        Blocks are validated and applied one at a time like a streamed chain.
 
         :param blockchain: New blockchain
-        :type blockchain: Blockchain
+        :type blockchain: bytes
+        :param conn: Sender connection
+        :type conn: socket.connection
         """
-        blockchain = json.loads(blockchain.decode())
-        chain = []
-
-        for block_data in blockchain:
-            transactions = []
-            for transaction_data in block_data["transactions"]:
-                if transaction_data["signature"]:
-                    transaction_data["signature"] = bytes.fromhex(
-                        transaction_data["signature"]
-                    )
-                if transaction_data["sender"]:
-                    transaction_data["sender"] = bytes.fromhex(
-                        transaction_data["sender"]
-                    )
-                if transaction_data["recipient"]:
-                    transaction_data["recipient"] = bytes.fromhex(
-                        transaction_data["recipient"]
-                    )
-                if transaction_data["sign_public_key"]:
-                    transaction_data["sign_public_key"] = bytes.fromhex(
-                        transaction_data["sign_public_key"]
-                    )
-                transactions.append(Transaction(**transaction_data))
-            block_data["transacti, connons"] = transactions
-            chain.append(Block(**block_data))
-        self.merge_chain(chain)
+        stream = ChainStream(self.blockchain)
+        try:
+            for block_data in json.loads(blockchain.decode()):
+                stream.add(Block.from_dict(block_data))
+            stream.finish()
+        except Exception as e:
+            log.warning(f"{e}, received blockchain rejected")
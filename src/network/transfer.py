@@ -0,0 +1,113 @@
+'''
+This module contains streaming chain transfer.
+
+A chain is sent as a sequence of CHAIN_BLOCK frames closed by CHAIN_END.
+The receiver decodes, validates and applies every block as it arrives,
+so memory used during sync does not grow with the chain and the first
+invalid block ends the transfer.
+'''
+
+from typing import Iterator, List, Optional
+import json5 as json
+from utils.logger import Logger
+from blockchain.blockchain import Block
+
+log = Logger("transfer")
+
+
+def stream_blocks(chain: List[Block], start: int) -> Iterator[bytes]:
+    '''
+    Produces messages of a streamed chain, each block is serialized only when its turn comes
+
+    :param chain: Local chain
+    :type chain: List[Block]
+    :param start: Index of the first block to send
+    :type start: int
+    :return: CHAIN_BLOCK messages followed by CHAIN_END
+    :rtype: Iterator[bytes]
+    '''
+    index = start
+    while index < len(chain):  # The chain may grow or be replaced while it is sent
+        yield b"CHAIN_BLOCK" + json.dumps(chain[index].to_dict(), ensure_ascii=False).encode()
+        index += 1
+    yield b"CHAIN_END"
+
+
+class ChainStream:
+    '''
+    Chain received block by block from one peer
+
+    Blocks that continue the local tip are applied at once. Blocks of a
+    branch from an earlier block are kept only until the branch becomes
+    longer than the local blocks after the fork, then the branch replaces
+    them and the rest is applied at once too.
+
+    :ivar blockchain: Local blockchain
+    :type blockchain: Blockchain
+    :ivar fork: Last block the stream continues, None before the first block
+    :type fork: Block or None
+    :ivar branch: Validated blocks after the fork not applied yet
+    :type branch: List[Block]
+    :ivar applied: Number of validated blocks
+    :type applied: int
+    :ivar aborted: True after an invalid block, the rest of the stream is ignored
+    :type aborted: bool
+    '''
+
+    def __init__(self, blockchain):
+        '''
+        Stream initialization
+
+        :param blockchain: Local blockchain
+        :type blockchain: Blockchain
+        '''
+        self.blockchain = blockchain
+        self.fork: Optional[Block] = None
+        self.branch: List[Block] = []
+        self.applied = 0
+        self.aborted = False
+
+    def add(self, block: Block) -> None:
+        '''
+        Validates received block and applies it if the stream is ahead of the local chain
+
+        :param block: Next block of the stream
+        :type block: Block
+        :raises ValueError: if the block is invalid or does not connect to our chain
+        '''
+        chain = self.blockchain.chain
+        if not self.branch and block.index < len(chain) and chain[block.index].hash == block.hash:
+            self.fork = chain[block.index]  # Common block, nothing to apply
+            return
+        if self.fork is None:
+            self.fork = self.blockchain.get_block(block.previous_hash)
+            if self.fork is None:
+                raise ValueError("Streamed chain does not connect to our chain")
+
+        previous = self.branch[-1] if self.branch else self.fork
+        if not self.blockchain.validator.validate_block(block, previous):
+            raise ValueError(f"Streamed block {block.index} is invalid")
+        self.applied += 1
+
+        if not self.branch and self.fork is chain[-1]:
+            chain.append(block)
+            self.blockchain.remove_pending_transactions(block.transactions)
+            self.fork = block
+            return
+
+        self.branch.append(block)
+        if self.fork.index + len(self.branch) >= len(chain):
+            del chain[self.fork.index + 1:]
+            chain.extend(self.branch)
+            for applied in self.branch:
+                self.blockchain.remove_pending_transactions(applied.transactions)
+            log.info(f"Switched to a longer branch after block {self.fork.index}")
+            self.fork, self.branch = chain[-1], []
+
+    def finish(self) -> None:
+        '''Drops a branch that never became longer than the local chain'''
+        if self.branch:
+            log.debug("Received chain is not longer than the local chain.")
+            self.branch = []
+        log.info(f"Chain transfer finished, {self.applied} blocks validated, "
+                 f"local chain has {len(self.blockchain.chain)} blocks")
@@ -5,7 +5,13 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtWidgets import QApplication, QMainWindow, QListWidgetItem, QInputDialog
 from PyQt5.QtCore import QMutex, Qt
 from .new_design import Ui_BlockChain
-from crypto.encryption import SymmetricEncryption
+from crypto.encryption import SymmetricEncryption, message_associated_data
+from crypto.groups import GROUP_INVITE_PREFIX
+from crypto.attachments import AttachmentStore
+from crypto.decryption import DecryptionService
+from utils.config import ENCRYPTION_ALGORITHM, DISPLAY_BATCH_SIZE, HISTORY_PAGE_SIZE
+
+HISTORY_LINK = "history:older"  # Link of the notice that loads older messages
 
 
 class MessengerApp(QMainWindow, Ui_BlockChain):
@@ -15,7 +21,8 @@ class MessengerApp(QMainWindow, Ui_BlockChain):
 
     update_message_area_signal = QtCore.pyqtSignal(str)
 
-    def __init__(self, username: str, cbu, smsg, rmvcn, p2p_network, dh_key_manager, blockchain):
+    def __init__(self, username: str, cbu, smsg, rmvcn, p2p_network, dh_key_manager, blockchain,
+                 group_manager=None, cgrp=None, sattach=None, decryption_service=None):
         """
         Initializes the messenger application, sets up the UI, loads chat names,
         styles, and message templates, and connects signals to their respective slots
@@ -41,11 +48,18 @@ class MessengerApp(QMainWindow, Ui_BlockChain):
         self.rmvcn = rmvcn
         self.dh_key_manager = dh_key_manager
         self.blockchain = blockchain
+        self.group_manager = group_manager
+        self.cgrp = cgrp
+        self.sattach = sattach
+        self.decryption_service = decryption_service or DecryptionService()
         self.message_area_mutex = QMutex()
+        self.history_limit = HISTORY_PAGE_SIZE  # Newest messages shown in the selected chat
         self.chat_names = [peer[2] for peer in self.p2p_network.peers]
         self.load_chats()
 
         self.chatList.itemClicked.connect(self.select_chat)
+        self.message_area.setOpenLinks(False)
+        self.message_area.anchorClicked.connect(self.load_older_messages)
 
         self.sendMessage_button.clicked.connect(self.send_message)
         self.messagePrint_area.returnPressed.connect(self.send_message)
@@ -58,6 +72,8 @@ class MessengerApp(QMainWindow, Ui_BlockChain):
         self.changeNicknameAction.triggered.connect(self.change_nickname)
         self.chat_Search.textChanged.connect(self.search_chats)
         self.showPeersAction.triggered.connect(self.show_peers_dialog)
+        self.createGroupAction.triggered.connect(self.create_group)
+        self.sendFileAction.triggered.connect(self.send_file)
 
         #self.work_exemp = work_exemp
 
@@ -77,6 +93,55 @@ class MessengerApp(QMainWindow, Ui_BlockChain):
             # messages = self.rcvmsg()
             self.load_chats()
 
+    def create_group(self):
+        """
+        Creates a group chat by prompting the user for its name and members
+
+        Members are entered as a comma separated list of usernames
+        """
+        if not self.cgrp:
+            return
+        name, ok = QtWidgets.QInputDialog.getText(
+            self.centralwidget, "Create Group", "Enter group name:"
+        )
+        if not ok or not name.strip():
+            return
+        members, ok = QtWidgets.QInputDialog.getText(
+            self.centralwidget, "Create Group", "Enter member usernames (comma separated):"
+        )
+        if ok and members.strip():
+            usernames = [member.strip() for member in members.split(",") if member.strip()]
+            if self.cgrp(name.strip(), usernames):
+                self.chat_names.append(name.strip())
+                self.load_chats()
+
+    def send_file(self):
+        """
+        Sends a file chosen by the user to the selected chat as an attachment
+        """
+        username = self.currentChatLabel.text()
+        if not self.sattach or username in ('', 'Select chat', None):
+            print('No chat selected!')
+            return
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self.centralwidget, "Send file")
+        if path:
+            self.sattach(username, path, self)
+
+    def render_text(self, text, download=False):
+        """
+        Returns text of a message bubble, describing attachments
+
+        :param text: Decrypted message
+        :param download: Whether to fetch a received attachment in background
+        """
+        reference = AttachmentStore.from_message(text)
+        if reference is None:
+            return text
+        fetcher = self.p2p_network.attachment_fetcher
+        if download and fetcher:
+            fetcher.download(reference)
+        return f"[file] {reference['name']} ({reference['size']} bytes)"
+
     def delete_chat(self):
         """
         Deletes the selected chat from the chat list
@@ -141,15 +206,45 @@ class MessengerApp(QMainWindow, Ui_BlockChain):
         chat_name = item.text()
         self.currentChatLabel.setText(chat_name)
         self.message_area.clear()
-        peer_nickname = chat_name
+        self.history_limit = HISTORY_PAGE_SIZE
+        self.show_chat()
 
+    def show_chat(self):
+        """
+        Renders history of the selected chat
+        """
+        chat_name = self.currentChatLabel.text()
         peer_key = None
         for peer in self.p2p_network.peers:
-            if peer[2] == peer_nickname:
+            if peer[2] == chat_name:
                 peer_key = peer[3]
                 break
         if peer_key:
             self.handle_messages(self.dh_key_manager.get_public_key(), peer_key)
+        elif self.group_manager:
+            group = self.group_manager.find_group(chat_name)
+            if group:
+                self.handle_group_messages(group.group_id)
+
+    def load_older_messages(self, url):
+        """
+        Shows one more page of older messages of the selected chat
+
+        :param url: Clicked link of the history notice
+        """
+        if url.toString() == HISTORY_LINK:
+            self.history_limit += HISTORY_PAGE_SIZE
+            self.show_chat()
+
+    def history_notice(self, hidden):
+        """
+        Returns notice shown above a history that does not start from the first message
+
+        :param hidden: Number of older messages that are not shown
+        """
+        if not hidden:
+            return ""
+        return self.templates["History Notice"].format(count=hidden, link=HISTORY_LINK)
 
     def send_message(self):
         """
@@ -189,22 +284,7 @@ class MessengerApp(QMainWindow, Ui_BlockChain):
             self.message_area.setHtml(new_html)
 
     def get_messages(self, my_key, peer_key):
-        messages = []
-        for block in self.blockchain.chain:
-            for transaction in block.transactions:
-                if (
-                    transaction.sender == my_key and transaction.recipient == peer_key
-                ) or (
-                    transaction.sender == peer_key and transaction.recipient == my_key
-                ):
-                    messages.append(transaction)
-        for transaction in self.blockchain.pending_transactions:
-            if (
-                transaction.sender == my_key and transaction.recipient == peer_key
-            ) or (transaction.sender == peer_key and transaction.recipient == my_key):
-                messages.append(transaction)
-
-        return messages
+        return self.blockchain.get_conversation(my_key, peer_key)
 
 
     @QtCore.pyqtSlot(str)
@@ -222,25 +302,92 @@ class MessengerApp(QMainWindow, Ui_BlockChain):
         self.message_area.clear()
         current_html = self.message_area.toHtml()
         messages = self.get_messages(my_key, peer_key)
-        for message in messages:
+        jobs = []
+        for message in messages[-self.history_limit:]:
+            peer = message.recipient if my_key == message.sender else message.sender
+            encryptor = SymmetricEncryption.from_suite(
+                self.dh_key_manager.get_shared_key(peer), ENCRYPTION_ALGORITHM
+            )
+            jobs.append((
+                encryptor.decrypt,
+                bytes.fromhex(message.content),
+                message_associated_data(message.sender, message.recipient),
+            ))
+
+        first, texts = self.decryption_service.decrypt_page(jobs, self.history_limit)
+        hidden = len(messages) - len(jobs) + first
+        current_html += self.history_notice(hidden)
+        messages = messages[hidden:]
+        for count, (message, text) in enumerate(zip(messages, texts), 1):
+            if text and text.startswith(GROUP_INVITE_PREFIX):
+                continue
             time_mes = datetime.fromtimestamp(float(message.timestamp)).strftime("%H:%M")
             if my_key == message.sender:
-                shared_key = self.dh_key_manager.generate_shared_key(message.recipient)
-                encryptor = SymmetricEncryption(shared_key, algorithm="AES", mode="CBC")
                 bubble = self.templates["Sender Bubble"].format(
-                    time=time_mes, username=self.username,
-                    text=encryptor.decrypt(bytes.fromhex(message.content))
+                    time=time_mes, username=self.username, text=self.render_text(text)
                 )
             else:
-                shared_key = self.dh_key_manager.generate_shared_key(message.sender)
-                encryptor = SymmetricEncryption(shared_key, algorithm="AES", mode="CBC")
                 reciever = [peer for peer in self.p2p_network.peers if peer[3] == message.sender]
                 bubble = self.templates["Receiver Bubble"].format(
-                    time=time_mes, username=reciever[0][2],
-                    text=encryptor.decrypt(bytes.fromhex(message.content))
+                    time=time_mes, username=reciever[0][2], text=self.render_text(text, download=True)
                 )
             current_html += bubble
+            if count % DISPLAY_BATCH_SIZE == 0:
+                self.show_messages(current_html)
+
+        self.show_messages(current_html)
+
+    def handle_group_messages(self, group_id):
+        """
+        Renders history of a group chat if it is the selected chat
+
+        :param group_id: Id of the group
+        """
+        group = self.group_manager.get_group(group_id) if self.group_manager else None
+        if not group or group.name != self.currentChatLabel.text():
+            return
 
+        my_key = self.dh_key_manager.get_public_key()
+        nicknames = {peer[3]: peer[2] for peer in self.p2p_network.peers}
+        current_html = ""
+        messages = self.blockchain.get_group_history(group_id)
+        jobs = [
+            (
+                self.group_manager.decrypt,
+                group_id,
+                bytes.fromhex(message.content),
+                message_associated_data(message.sender, group_id),
+            )
+            for message in messages[-self.history_limit:]
+        ]
+        first, texts = self.decryption_service.decrypt_page(jobs, self.history_limit)
+        hidden = len(messages) - len(jobs) + first
+        current_html += self.history_notice(hidden)
+        messages = messages[hidden:]
+        for count, (message, text) in enumerate(zip(messages, texts), 1):
+            time_mes = datetime.fromtimestamp(float(message.timestamp)).strftime("%H:%M")
+            if message.sender == my_key:
+                bubble = self.templates["Sender Bubble"].format(
+                    time=time_mes, username=self.username, text=self.render_text(text)
+                )
+            else:
+                bubble = self.templates["Receiver Bubble"].format(
+                    time=time_mes,
+                    username=nicknames.get(message.sender, "Unknown"),
+                    text=self.render_text(text, download=True),
+                )
+            current_html += bubble
+            if count % DISPLAY_BATCH_SIZE == 0:
+                self.show_messages(current_html)
+
+        self.show_messages(current_html)
+
+    def show_messages(self, current_html):
+        """
+        Passes rendered messages to the UI thread
+
+        :param current_html: Rendered message bubbles
+        """
         self.message_area_mutex.lock()
         try:
             QtCore.QMetaObject.invokeMethod(self, "update_message_area", Qt.QueuedConnection, QtCore.Q_ARG(str, current_html))
@@ -103,6 +103,8 @@ class Ui_BlockChain(object):
         self.deleteChatAction = QtWidgets.QAction("Delete chat", self.centralwidget)
         self.changeNicknameAction = QtWidgets.QAction("Change username", self.centralwidget)
         self.showPeersAction = QtWidgets.QAction("Show Peers", self.centralwidget)
+        self.createGroupAction = QtWidgets.QAction("Create group", self.centralwidget)
+        self.sendFileAction = QtWidgets.QAction("Send file", self.centralwidget)
 
 
         self.optionsMenu.addAction(self.addChatAction)
@@ -110,6 +112,8 @@ class Ui_BlockChain(object):
         self.optionsMenu.addAction(self.deleteChatAction)
         self.optionsMenu.addAction(self.changeNicknameAction)
         self.optionsMenu.addAction(self.showPeersAction)
+        self.optionsMenu.addAction(self.createGroupAction)
+        self.optionsMenu.addAction(self.sendFileAction)
 
 
         self.options_Button.setMenu(self.optionsMenu)
@@ -15,8 +15,34 @@ BLOCK_DIFFICULTY = 4  # Сложность PoW (количество ведущ
 
 # Параметры криптографии
 KEY_SIZE = 2048  # Размер ключа для алгоритма DH
-ENCRYPTION_ALGORITHM = "AES-256-CBC"  # Алгоритм шифрования
-SIGNATURE_ALGORITHM = "ECDSA"  # Алгоритм подписей
+KEY_EXCHANGE_ALGORITHM = os.getenv("KEY_EXCHANGE_ALGORITHM") or "DH"  # "DH" или "X25519"
+ENCRYPTION_ALGORITHM = os.getenv("ENCRYPTION_ALGORITHM") or "AES-256-CBC"  # "AES-256-CBC", "AES-256-GCM" или "ChaCha20-Poly1305"
+SIGNATURE_ALGORITHM = os.getenv("SIGNATURE_ALGORITHM") or "RSA"  # "RSA" или "Ed25519", одинаковый для всей сети
+COMPRESS_MESSAGES = True  # Сжатие сообщений (zlib) перед шифрованием
+SHARED_KEY_CACHE_SIZE = 256  # Количество общих ключей в кэше DH
+KEY_REGISTRY_SIZE = 1024  # Количество разобранных открытых ключей в кэше
+DECRYPTION_WORKERS = min(4, os.cpu_count() or 1)  # Потоки параллельной расшифровки истории
+DECRYPTION_DEADLINE = 2.0  # Максимальное время расшифровки истории чата в секундах
+DISPLAY_BATCH_SIZE = 50  # Количество сообщений, после которого история обновляется в окне
+HISTORY_PAGE_SIZE = 200  # Количество последних сообщений, расшифровываемых при открытии чата
+
+# Сетевой протокол (кадры с заголовком: тип, флаги, длина)
+MAX_FRAME_SIZE = 64 * 1024 * 1024  # Максимальный размер кадра в байтах
+FRAME_COMPRESSION_THRESHOLD = 256  # Кадры меньшего размера не сжимаются
+NETWORK_ENGINE = os.getenv("NETWORK_ENGINE") or "asyncio"  # "asyncio" (один цикл событий) или "threads" (поток на соединение)
+NETWORK_WORKERS = min(4, os.cpu_count() or 1)  # Потоки обработки сообщений (проверка, майнинг, расшифровка)
+OUTBOUND_HIGH_WATER = 16 * 1024 * 1024  # Размер очереди отправки узлу, после которого он отключается
+SEEN_MESSAGE_TTL = 600.0  # Время хранения идентификатора полученного сообщения в секундах
+SEEN_MESSAGE_CAPACITY = 100000  # Максимальное количество запомненных сообщений
+INV_INTERVAL = 0.1  # Интервал отправки пачки объявлений (INV) каждому узлу в секундах
+GETDATA_TIMEOUT = 5.0  # Время ожидания запрошенного сообщения до запроса у другого узла
+INVENTORY_TTL = 120.0  # Время хранения объявленных сообщений для ответа на GETDATA
+INVENTORY_CAPACITY = 10000  # Максимальное количество хранимых объявленных сообщений
+BLOCK_DOWNLOAD_WINDOW = 1024  # На сколько блоков вперёд от последнего применённого можно запрашивать
+BLOCK_REQUESTS_PER_PEER = 4  # Количество одновременных запросов блоков (GET_BLOCKS) к одному узлу
+BLOCK_REQUEST_TIMEOUT = 10.0  # Время ожидания блоков до запроса у другого узла в секундах
+CONNECT_TIMEOUT = 10.0  # Время ожидания подключения к узлу в секундах
+HEADLESS = os.getenv("HEADLESS") == "1"  # Запуск узла без графического интерфейса
 
 # Логирование
 LOG_DIR = os.path.join(os.getcwd(), "logs")
@@ -26,10 +52,43 @@ LOG_LEVEL = os.getenv("LOG_LEVEL") or "INFO"
 # Время между синхронизациями
 SYNC_INTERVAL = 10  # Интервал в секундах
 
+# Хранилище данных узла
+DATA_DIR = os.path.join(os.getcwd(), "data")
+
+# Хранилище ключей (зашифровано ключом из пароля)
+KEYSTORE_PATH = os.path.join(DATA_DIR, "identity.keystore")
+KEYSTORE_SCRYPT_N = 2 ** 14  # Параметр сложности scrypt
+
+# Журнал мемпула (write-ahead log неподтверждённых транзакций)
+MEMPOOL_JOURNAL_PATH = os.path.join(DATA_DIR, "mempool.journal")
+MEMPOOL_FSYNC_BATCH = 16  # Количество записей между вызовами fsync
+MEMPOOL_FSYNC_INTERVAL = 1.0  # Максимальная задержка fsync в секундах
+MEMPOOL_COMPACT_THRESHOLD = 256  # Количество записей, после которого журнал сжимается
+
+# Пакетная отправка сообщений (одна подпись на пачку)
+MESSAGE_BATCH_WINDOW = 0.05  # Время накопления пачки в секундах
+MESSAGE_BATCH_SIZE = 32  # Максимальное количество сообщений в пачке
+
+# Шардирование переписок по подцепочкам
+SHARDING_ENABLED = os.getenv("SHARDING_ENABLED") == "1"  # Включается переменной окружения
+SHARD_COUNT = 16  # Количество шардов в сети
+SHARD_JOURNAL_DIR = os.path.join(DATA_DIR, "shards")  # Журналы мемпулов подписанных шардов
+
+# Вложения (контентно-адресуемое хранилище зашифрованных блоков)
+ATTACHMENT_DIR = os.path.join(DATA_DIR, "blobs")
+DOWNLOAD_DIR = os.path.join(DATA_DIR, "downloads")
+ATTACHMENT_CHUNK_SIZE = 16 * 1024  # Размер блока файла в байтах
+ATTACHMENT_FETCH_WINDOW = 8  # Количество одновременно запрашиваемых блоков
+ATTACHMENT_RETRY_INTERVAL = 2.0  # Время до повторного запроса блока в секундах
+ATTACHMENT_FETCH_TIMEOUT = 60.0  # Максимальное время загрузки вложения в секундах
+
 # Функция для проверки и создания директорий
 if not os.path.exists(LOG_DIR):
     os.makedirs(LOG_DIR)
 
+if not os.path.exists(DATA_DIR):
+    os.makedirs(DATA_DIR)
+
 if __name__ == "__main__":
     print("Configuration loaded successfully:")
     print(f"Host: {HOST}")
@@ -41,3 +100,4 @@ if __name__ == "__main__":
     print(f"Log Directory: {LOG_DIR}")
     print(f"Log Level: {LOG_LEVEL}")
     print(f"Sync Interval: {SYNC_INTERVAL}s")
+    print(f"Mempool Journal: {MEMPOOL_JOURNAL_PATH}")
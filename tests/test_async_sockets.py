@@ -0,0 +1,91 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(pdir)
+
+from src.network.async_sockets import AsyncP2PSocket
+
+
+class FakeSyncManager:
+	def __init__(self):
+		self.received = []
+		self.threads = set()
+		self.event = threading.Event()
+
+	def handle_new_transaction(self, data, conn):
+		self.threads.add(threading.current_thread().name)
+		self.received.append(data)
+		self.event.set()
+
+	def handle_blockchain(self, data, conn):
+		raise ValueError("broken handler")
+
+
+def wait_for(condition, timeout=5):
+	deadline = time.monotonic() + timeout
+	while not condition() and time.monotonic() < deadline:
+		time.sleep(0.01)
+	return condition()
+
+
+class TestAsyncP2PSocket(unittest.TestCase):
+	def setUp(self):
+		self.sync = FakeSyncManager()
+		self.server = AsyncP2PSocket("127.0.0.1", 0, None, self.sync, None)
+		threading.Thread(target=self.server.start_server, daemon=True).start()
+		self.assertTrue(wait_for(lambda: self.server.server is not None))
+		self.port = self.server.socket.getsockname()[1]
+		self.clients = []
+
+	def tearDown(self):
+		for client in self.clients:
+			client.stop()
+		self.server.stop()
+
+	def connect(self):
+		client = AsyncP2PSocket("127.0.0.1", 0, None, FakeSyncManager(), None)
+		self.clients.append(client)
+		conn = client.connect_to_peer("127.0.0.1", self.port)
+		self.assertIsNotNone(conn)
+		self.assertTrue(wait_for(lambda: len(self.server.connections) == len(self.clients)))
+		return client, conn
+
+	def test_handler_runs_on_worker(self):
+		client, conn = self.connect()
+		payload = os.urandom(1024 * 1024)
+		client.send(b"NEW_TRANSACTION" + payload, conn)
+		self.assertTrue(self.sync.event.wait(5))
+		self.assertEqual(self.sync.received, [payload])
+		self.assertTrue(all(name.startswith("node") and name != "node-loop" for name in self.sync.threads))
+
+	def test_handler_error_keeps_connection(self):
+		client, conn = self.connect()
+		client.send(b"BLOCKCHAIN[]", conn)
+		client.send(b"NEW_TRANSACTION{}", conn)
+		self.assertTrue(self.sync.event.wait(5))
+		self.assertEqual(len(self.server.connections), 1)
+
+	def test_simple_message_relayed(self):
+		sender, sender_conn = self.connect()
+		receiver, receiver_conn = self.connect()
+		received = []
+		receiver.dispatch = lambda message_type, data, conn, addr: received.append(data)
+		sender.send(b"hello", sender_conn)
+		self.assertTrue(wait_for(lambda: received == [b"hello"]))
+
+	def test_max_connections(self):
+		self.server.max_connections = 1
+		self.connect()
+		extra = AsyncP2PSocket("127.0.0.1", 0, None, FakeSyncManager(), None)
+		self.clients.append(extra)
+		extra.connect_to_peer("127.0.0.1", self.port)
+		self.assertTrue(wait_for(lambda: not extra.connections))
+		self.assertEqual(len(self.server.connections), 1)
+
+
+if __name__ == "__main__":
+	unittest.main()
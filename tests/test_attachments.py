@@ -0,0 +1,100 @@
+import os
+import sys
+import tempfile
+import unittest
+
+pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(pdir)
+
+import json5 as json
+from src.crypto.attachments import AttachmentStore, BlobStore, blob_hash
+from src.network.attachments import AttachmentFetcher
+
+
+class FakeNetwork:
+	def __init__(self, source):
+		self.source = source
+		self.fetcher = None
+		self.requests = []
+
+	def broadcast_message(self, message, conn):
+		hashes = json.loads(message[len(b"GET_CHUNK"):].decode())
+		self.requests.append(hashes)
+		for hash_hex in hashes:
+			blob = self.source.blobs.get(hash_hex)
+			if blob is not None and self.fetcher.is_wanted(hash_hex):
+				self.fetcher.attachments.blobs.put(blob, hash_hex)
+				self.fetcher.chunk_received(hash_hex)
+
+
+class TestAttachmentStore(unittest.TestCase):
+	def setUp(self):
+		self.tmp = tempfile.TemporaryDirectory()
+		self.store = AttachmentStore(BlobStore(os.path.join(self.tmp.name, "alice")), chunk_size=16)
+		self.data = os.urandom(100)
+
+	def tearDown(self):
+		self.tmp.cleanup()
+
+	def test_roundtrip(self):
+		reference = self.store.add(self.data, "photo.jpg")
+
+		self.assertEqual(reference["size"], 100)
+		self.assertEqual(self.store.missing(reference), [])
+		self.assertEqual(self.store.read(reference), self.data)
+
+	def test_chunks_deduplicated(self):
+		first = self.store.manifest(self.store.add(self.data, "a.bin"))
+		second = self.store.manifest(self.store.add(self.data[:32] + b"x" * 10, "b.bin"))
+
+		self.assertEqual(first["chunks"][:2], second["chunks"][:2])
+
+	def test_message_reference(self):
+		reference = self.store.add(self.data, "photo.jpg")
+
+		self.assertEqual(AttachmentStore.from_message(AttachmentStore.to_message(reference)), reference)
+		self.assertIsNone(AttachmentStore.from_message("Just a message"))
+
+	def test_blob_hash_checked(self):
+		with self.assertRaises(ValueError):
+			self.store.blobs.put(b"data", blob_hash(b"other"))
+		with self.assertRaises(ValueError):
+			self.store.blobs.get("../../etc/passwd")
+
+	def test_fetch_resumes(self):
+		reference = self.store.add(self.data, "photo.jpg")
+		bob = AttachmentStore(BlobStore(os.path.join(self.tmp.name, "bob")), chunk_size=16)
+		manifest = self.store.manifest(reference)
+		bob.blobs.put(self.store.blobs.get(reference["manifest"]))
+		bob.blobs.put(self.store.blobs.get(manifest["chunks"][0][0]))
+
+		network = FakeNetwork(self.store)
+		network.fetcher = AttachmentFetcher(network, bob, window=4)
+
+		self.assertEqual(network.fetcher.fetch(reference, timeout=5), self.data)
+		requested = [hash_hex for hashes in network.requests for hash_hex in hashes]
+		self.assertEqual(sorted(requested), sorted(h for h, _ in manifest["chunks"][1:]))
+		self.assertTrue(all(len(hashes) <= 4 for hashes in network.requests))
+
+	def test_download_keeps_files_with_same_name(self):
+		first = self.store.add(self.data, "photo.jpg")
+		second = self.store.add(self.data[::-1], "photo.jpg")
+		bob = AttachmentStore(BlobStore(os.path.join(self.tmp.name, "bob")), chunk_size=16)
+		network = FakeNetwork(self.store)
+		network.fetcher = AttachmentFetcher(network, bob)
+		directory = os.path.join(self.tmp.name, "downloads")
+
+		for reference in (first, second, first):
+			thread = network.fetcher.download(reference, directory)
+			if thread:
+				thread.join(5)
+
+		self.assertEqual(sorted(os.listdir(directory)), ["photo (1).jpg", "photo.jpg"])
+		with open(os.path.join(directory, "photo.jpg"), "rb") as file:
+			self.assertEqual(file.read(), self.data)
+		with open(os.path.join(directory, "photo (1).jpg"), "rb") as file:
+			self.assertEqual(file.read(), self.data[::-1])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -6,7 +6,7 @@ import sys
 parent_dir = os.path.dirname(os.path.realpath(__file__)) + "/.."
 sys.path.append(parent_dir)
 from src.blockchain.blockchain import Blockchain, Block
-from src.blockchain.transaction import Transaction
+from src.blockchain.transaction import Transaction, BatchTransaction
 from src.blockchain.consensus import ProofOfWork
 from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives import serialization
@@ -118,5 +118,63 @@ class TestBlockchain(unittest.TestCase):
          self.blockchain.mine_pending_transactions(ProofOfWork, "Miner1")
          self.assertEqual(len(self.blockchain), 2)
 
+class TestConversationIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.blockchain = Blockchain(difficulty=1)
+
+    def test_get_conversation(self):
+        """ Test that conversation contains mined, pending and batched messages."""
+        self.blockchain.pending_transactions = [
+            Transaction(b"Alice", b"Bob", 0, "mined", timestamp=1.0),
+            Transaction(b"Alice", b"Charlie", 0, "other", timestamp=2.0),
+        ]
+        self.blockchain.chain.append(Block(1, self.blockchain.chain[0].hash, 1.0,
+                                           self.blockchain.pending_transactions))
+        self.blockchain.pending_transactions = [
+            BatchTransaction.create(b"Bob", [(b"Alice", "reply"), (b"Charlie", "x")], None)
+        ]
+
+        messages = self.blockchain.get_conversation(b"Bob", b"Alice")
+        self.assertEqual([message.content for message in messages], ["mined", "reply"])
+
+    def test_replaced_chain_reindexed(self):
+        """ Test that index is rebuilt when chain is replaced."""
+        self.blockchain.chain.append(Block(1, self.blockchain.chain[0].hash, 1.0,
+                                           [Transaction(b"Alice", b"Bob", 0, "old")]))
+        self.assertEqual(len(self.blockchain.get_conversation(b"Alice", b"Bob")), 1)
+
+        self.blockchain.chain = [self.blockchain.chain[0],
+                                 Block(1, self.blockchain.chain[0].hash, 2.0,
+                                       [Transaction(b"Alice", b"Bob", 0, "new")])]
+        messages = self.blockchain.get_conversation(b"Alice", b"Bob")
+        self.assertEqual([message.content for message in messages], ["new"])
+
+    def test_malformed_batch_skipped(self):
+        """ Test that a batch with a non-hex recipient does not break other conversations."""
+        malformed = BatchTransaction(b"Mallory", content='[{"recipient": "zz", "content": "aa11"}]')
+        self.blockchain.chain.append(Block(1, self.blockchain.chain[0].hash, 1.0, [
+            malformed, Transaction(b"Alice", b"Bob", 0, "hello"),
+        ]))
+
+        self.assertEqual(len(self.blockchain.get_conversation(b"Alice", b"Bob")), 1)
+        self.assertEqual(self.blockchain.index.height, 2)
+
+
+class TestPendingTransactions(unittest.TestCase):
+
+    def test_has_pending_transaction(self):
+        """ Test that a received copy of a pending transaction is recognized."""
+        blockchain = Blockchain(difficulty=1)
+        transaction = Transaction(b"Alice", b"Bob", 0, "hello", timestamp=1.0)
+        blockchain.add_pending_transaction(transaction)
+        copy = Transaction.from_dict(transaction.to_dict())
+        self.assertIsNot(copy, transaction)
+        self.assertTrue(blockchain.has_pending_transaction(copy))
+        self.assertFalse(blockchain.has_pending_transaction(
+            Transaction(b"Alice", b"Bob", 0, "hello", timestamp=2.0)
+        ))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,121 @@
+import os
+import sys
+import unittest
+
+pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(pdir)
+
+from src.blockchain.blockchain import Blockchain
+from src.blockchain.consensus import ProofOfWork
+from src.blockchain.transaction import Transaction
+from src.network.compact import SHORT_ID_SIZE, PartialBlock, encode_compact_block
+from src.network.framing import MessageType, split_message
+from src.network.sync import SyncManager
+
+
+class FakeNode:
+	def __init__(self):
+		self.sent = []
+
+	def send(self, message, conn):
+		self.sent.append((split_message(message), conn))
+
+
+class FakeNetwork:
+	def __init__(self):
+		self.node = FakeNode()
+		self.relayed = []
+		self.shard_manager = None
+
+	def relay(self, message_type, payload, conn):
+		self.relayed.append((message_type, payload, conn))
+
+
+def transactions(count):
+	return [Transaction(b"Alice", b"Bob", 0, f"message {i}", timestamp=float(i + 1)) for i in range(count)]
+
+
+def mine(chain, pending):
+	for transaction in pending:
+		chain.add_pending_transaction(transaction)
+	block, _ = chain.mine_pending_transactions(ProofOfWork, b"Miner")
+	return block
+
+
+class TestPartialBlock(unittest.TestCase):
+	def setUp(self):
+		self.transactions = transactions(4)
+		self.block = mine(Blockchain(difficulty=1), self.transactions)
+		self.payload = encode_compact_block(self.block)
+
+	def test_payload_is_small(self):
+		partial = PartialBlock.decode(self.payload)
+		self.assertEqual(len(partial.ids), 4)
+		self.assertTrue(all(len(key) == SHORT_ID_SIZE for key in partial.ids))
+		self.assertEqual(partial.hash, self.block.hash)
+
+	def test_rebuild_from_mempool(self):
+		partial = PartialBlock.decode(self.payload)
+		self.assertEqual(partial.fill_from_mempool(transactions(6)), 4)
+		self.assertEqual(partial.missing(), [])
+		self.assertEqual(partial.to_block().hash, self.block.hash)
+
+	def test_missing_transactions(self):
+		partial = PartialBlock.decode(self.payload)
+		mempool = transactions(4)
+		self.assertEqual(partial.fill_from_mempool([mempool[0], mempool[3]]), 2)
+		self.assertEqual(partial.missing(), [1, 2])
+		with self.assertRaises(ValueError):
+			partial.fill([1, 2], [mempool[2], mempool[1]])
+		partial.fill([1, 2], [mempool[1], mempool[2]])
+		self.assertEqual(partial.to_block().hash, self.block.hash)
+
+	def test_mismatch_detected(self):
+		partial = PartialBlock.decode(self.payload)
+		partial.fill_from_mempool(transactions(4))
+		partial.transactions[0] = Transaction(b"Alice", b"Bob", 0, "other", timestamp=1.0)
+		self.assertIsNone(partial.to_block())
+
+
+class TestCompactRelay(unittest.TestCase):
+	def setUp(self):
+		self.miner = SyncManager(FakeNetwork(), Blockchain(difficulty=1))
+		self.receiver = SyncManager(FakeNetwork(), Blockchain(difficulty=1))
+
+	def test_request_only_missing(self):
+		pending = transactions(3)
+		for transaction in (pending[0], pending[2]):
+			self.receiver.blockchain.add_pending_transaction(transaction)
+		block = mine(self.miner.blockchain, pending)
+		payload = encode_compact_block(block)
+
+		self.receiver.handle_compact_block(payload, "miner")
+		[((message_type, request), conn)] = self.receiver.p2p_network.node.sent
+		self.assertEqual((message_type, conn), (MessageType.GET_BLOCK_TXN, "miner"))
+		self.assertEqual(len(self.receiver.blockchain.chain), 1)
+
+		self.miner.handle_get_block_txn(request, "receiver")
+		[((message_type, response), conn)] = self.miner.p2p_network.node.sent
+		self.assertEqual((message_type, conn), (MessageType.BLOCK_TXN, "receiver"))
+		self.assertIn(b"message 1", response)
+		self.assertNotIn(b"message 0", response)
+
+		self.receiver.handle_block_txn(response, "miner")
+		self.assertEqual(self.receiver.blockchain.get_latest_block().hash, block.hash)
+		self.assertEqual(self.receiver.blockchain.pending_transactions, [])
+		self.assertEqual(self.receiver.p2p_network.relayed, [(MessageType.COMPACT_BLOCK, payload, "miner")])
+		self.assertEqual(self.receiver.partial_blocks, {})
+
+	def test_complete_from_mempool(self):
+		pending = transactions(3)
+		for transaction in pending:
+			self.receiver.blockchain.add_pending_transaction(transaction)
+		block = mine(self.miner.blockchain, pending)
+
+		self.receiver.handle_compact_block(encode_compact_block(block), "miner")
+		self.assertEqual(self.receiver.p2p_network.node.sent, [])
+		self.assertEqual(self.receiver.blockchain.get_latest_block().hash, block.hash)
+
+
+if __name__ == "__main__":
+	unittest.main()
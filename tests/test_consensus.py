@@ -7,7 +7,8 @@ parent_dir = os.path.dirname(os.path.realpath(__file__)) + "/.."
 sys.path.append(parent_dir)
 from src.blockchain.consensus import ProofOfWork, Validator
 from src.blockchain.blockchain import Block, Blockchain
-from src.blockchain.transaction import Transaction
+from src.blockchain.transaction import Transaction, BatchTransaction
+from src.crypto.signatures import DigitalSignature
 from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.serialization import (
@@ -113,6 +114,39 @@ class TestValidator(unittest.TestCase):
          self.assertFalse(is_valid)
 
 
+class TestSignatureAlgorithm(unittest.TestCase):
+
+    def test_block_with_other_algorithm_rejected(self):
+        """ Test that a block with a transaction signed with another algorithm than the network's is rejected."""
+        signer = DigitalSignature(algorithm="Ed25519")
+        transaction = Transaction(b"Alice", b"Bob", 0, "aa11", signer.get_public_key(), timestamp=1.0)
+        transaction.sign_transaction(signer)
+        blockchain = Blockchain(difficulty=1)
+        blockchain.validator.signature_algorithm = "Ed25519"
+        blockchain.add_pending_transaction(transaction)
+        block, _ = blockchain.mine_pending_transactions(ProofOfWork, b"Miner", reward=False)
+
+        validator = Validator()
+        validator.signature_algorithm = "RSA"
+        self.assertFalse(validator.validate_block(block, blockchain.chain[0]))
+        validator.signature_algorithm = "Ed25519"
+        self.assertTrue(validator.validate_block(block, blockchain.chain[0]))
+
+    def test_block_with_batch_transaction(self):
+        """ Test that a block carrying a batch envelope is validated."""
+        signer = DigitalSignature()
+        batch = BatchTransaction.create(b"Alice", [(b"Bob", "aa11"), (b"Charlie", "bb22")], signer.get_public_key())
+        batch.sign_transaction(signer)
+        blockchain = Blockchain(difficulty=1)
+        blockchain.add_transaction(batch)
+        block, _ = blockchain.mine_pending_transactions(ProofOfWork, b"Miner", reward=False)
+
+        self.assertIsNotNone(block)
+        self.assertTrue(Validator().validate_block(block, blockchain.chain[0]))
+        self.assertTrue(batch.is_valid(batch.sign_public_key, "RSA"))
+        self.assertFalse(batch.is_valid(batch.sign_public_key, "Ed25519"))
+
+
 
 if __name__ == '__main__':
     unittest.main()
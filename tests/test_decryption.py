@@ -0,0 +1,69 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(pdir)
+
+from src.crypto.decryption import DecryptionService
+from src.crypto.encryption import SymmetricEncryption
+
+
+class TestDecryptionService(unittest.TestCase):
+	def setUp(self):
+		self.service = DecryptionService(workers=4, deadline=5)
+		self.exe = SymmetricEncryption.from_suite(os.urandom(32), "AES-256-GCM")
+
+	def tearDown(self):
+		self.service.shutdown()
+
+	def test_results_in_order(self):
+		texts = [f"message {i}" for i in range(100)]
+		jobs = [(self.exe.decrypt, ciphertext, None) for ciphertext in self.exe.encrypt_many(texts)]
+
+		self.assertEqual(list(self.service.decrypt(jobs)), texts)
+
+	def test_failed_job_is_none(self):
+		def fail(ciphertext):
+			raise ValueError("broken")
+
+		jobs = [(self.exe.decrypt, self.exe.encrypt("ok"), None), (fail, b"")]
+		self.assertEqual(list(self.service.decrypt(jobs)), ["ok", None])
+
+	def test_deadline(self):
+		release = threading.Event()
+
+		def slow(text):
+			release.wait(1)
+			return text
+
+		start = time.monotonic()
+		results = list(self.service.decrypt([(slow, str(i)) for i in range(20)], deadline=0.1))
+		release.set()
+
+		self.assertEqual(results, [])
+		self.assertLess(time.monotonic() - start, 0.5)
+
+	def test_page_is_newest(self):
+		jobs = [(str, i) for i in range(10)]
+		self.assertEqual(self.service.decrypt_page(jobs, 4), (6, ["6", "7", "8", "9"]))
+		self.assertEqual(self.service.decrypt_page(jobs, 20), (0, [str(i) for i in range(10)]))
+
+	def test_page_deadline_drops_oldest(self):
+		release = threading.Event()
+
+		def slow(text):
+			release.wait(1)
+			return text
+
+		jobs = [(slow, str(i)) if i < 5 else (str, i) for i in range(10)]
+		first, texts = self.service.decrypt_page(jobs, 10, deadline=0.2)
+		release.set()
+
+		self.assertEqual((first, texts), (5, ["5", "6", "7", "8", "9"]))
+
+
+if __name__ == '__main__':
+	unittest.main()
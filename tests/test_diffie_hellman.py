@@ -1,11 +1,14 @@
 import os
 import sys
+import threading
 import unittest
+from unittest import mock
 
 pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
 sys.path.append(pdir)
 
 import src.crypto.diffie_hellman as dh
+from src.utils.config import DEFAULT_DH_PARAMETERS
 
 
 class TestDiffieHellman(unittest.TestCase):
@@ -25,6 +28,81 @@ class TestDiffieHellman(unittest.TestCase):
 			self.assertEqual(type(self.dhc.generate_shared_key("123")), bytes)
 
 
+class TestSharedKeyCache(unittest.TestCase):
+	def setUp(self):
+		self.alice = dh.DiffieHellmanKeyExchange(DEFAULT_DH_PARAMETERS, cache_size=2)
+		self.peers = [dh.DiffieHellmanKeyExchange(DEFAULT_DH_PARAMETERS).get_public_key() for _ in range(3)]
+
+	def test_cached_key_matches_derived(self):
+		shared_key = self.alice.get_shared_key(self.peers[0])
+
+		self.assertEqual(shared_key, self.alice.generate_shared_key(self.peers[0]))
+		with mock.patch.object(self.alice, "generate_shared_key") as derive:
+			self.assertEqual(self.alice.get_shared_key(self.peers[0]), shared_key)
+			derive.assert_not_called()
+
+	def test_lru_eviction(self):
+		for peer in self.peers:
+			self.alice.get_shared_key(peer)
+
+		self.assertEqual(len(self.alice.shared_keys), 2)
+		self.assertNotIn(dh.DiffieHellmanKeyExchange.fingerprint(self.peers[0]), self.alice.shared_keys)
+
+	def test_single_flight(self):
+		derive = self.alice.generate_shared_key
+		calls = []
+
+		def slow_derive(peer):
+			calls.append(peer)
+			threading.Event().wait(0.1)
+			return derive(peer)
+
+		with mock.patch.object(self.alice, "generate_shared_key", side_effect=slow_derive):
+			results = []
+			threads = [
+				threading.Thread(target=lambda: results.append(self.alice.get_shared_key(self.peers[0])))
+				for _ in range(5)
+			]
+			for thread in threads:
+				thread.start()
+			for thread in threads:
+				thread.join()
+
+		self.assertEqual(len(calls), 1)
+		self.assertEqual(len(set(results)), 1)
+
+	def test_invalid_key_not_cached(self):
+		self.assertIsNone(self.alice.get_shared_key(b"123"))
+		self.assertEqual(len(self.alice.shared_keys), 0)
+
+class TestX25519(unittest.TestCase):
+	def setUp(self):
+		self.alice = dh.X25519KeyExchange()
+		self.bob = dh.X25519KeyExchange()
+
+	def test_raw_public_key(self):
+		self.assertEqual(len(self.alice.get_public_key()), 32)
+
+	def test_shared_key_matches(self):
+		alice_key = self.alice.get_shared_key(self.bob.get_public_key())
+
+		self.assertEqual(len(alice_key), 32)
+		self.assertEqual(alice_key, self.bob.get_shared_key(self.alice.get_public_key()))
+
+	def test_incorrect_key(self):
+		self.assertIsNone(self.alice.generate_shared_key(b"123"))
+		self.assertIsNone(self.alice.generate_shared_key(None))
+
+	def test_factory(self):
+		self.assertIsInstance(dh.create_key_exchange("X25519"), dh.X25519KeyExchange)
+		self.assertIs(type(dh.create_key_exchange("DH")), dh.DiffieHellmanKeyExchange)
+		with self.assertRaises(ValueError):
+			dh.create_key_exchange("RSA")
+
+	def test_key_exchange_algorithm(self):
+		self.assertEqual(dh.key_exchange_algorithm(self.alice.get_public_key()), "X25519")
+		self.assertEqual(dh.key_exchange_algorithm(dh.create_key_exchange("DH").get_public_key()), "DH")
+
 
 if __name__ == '__main__':
 	unittest.main()
@@ -0,0 +1,125 @@
+import os
+import sys
+import unittest
+
+pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(pdir)
+
+from src.blockchain.blockchain import Blockchain
+from src.network.framing import MessageType, split_message
+from src.network.headers import BranchDownload, header_of
+from src.network.sync import SyncManager
+from tests.test_sync import HANDLERS, connect, grow, hashes
+
+
+class Wire:
+	'''Messages in transit between sync managers, delivered when pumped'''
+	def __init__(self):
+		self.messages = []
+		self.muted = set()  # Peers that never answer block requests
+
+	def pump(self):
+		while self.messages:
+			conn, message_type, payload = self.messages.pop(0)
+			if conn not in self.muted or message_type != MessageType.GET_BLOCKS:
+				getattr(conn.manager, HANDLERS[message_type])(payload, conn.back)
+
+
+class QueueNode:
+	def __init__(self, wire):
+		self.wire = wire
+		self.connections = []
+		self.sent = []
+
+	def send(self, message, conn):
+		message_type, payload = split_message(message)
+		self.sent.append((message_type, payload))
+		self.wire.messages.append((conn, message_type, payload))
+
+
+class FakeNetwork:
+	def __init__(self, wire):
+		self.node = QueueNode(wire)
+		self.shard_manager = None
+
+
+class TestBranchDownload(unittest.TestCase):
+	def test_blocks_handed_out_in_order(self):
+		chain = Blockchain(difficulty=1)
+		grow(chain, 3, "block")
+		blocks = chain.chain[1:]
+		download = BranchDownload(chain.chain[0], [header_of(block) for block in blocks])
+		self.assertTrue(download.add(blocks[2]))
+		self.assertTrue(download.add(blocks[1]))
+		self.assertEqual(list(download.ready()), [])
+		self.assertTrue(download.add(blocks[0]))
+		self.assertEqual(list(download.ready()), blocks)
+		self.assertTrue(download.done)
+		self.assertFalse(download.add(blocks[0]))
+
+
+class TestParallelDownload(unittest.TestCase):
+	def setUp(self):
+		self.wire = Wire()
+		source = Blockchain(difficulty=1)
+		grow(source, 100, "block")
+		self.remotes = []
+		for _ in range(2):
+			chain = Blockchain(difficulty=1)
+			chain.chain = list(source.chain)
+			self.remotes.append(SyncManager(FakeNetwork(self.wire), chain))
+		self.local = SyncManager(FakeNetwork(self.wire), Blockchain(difficulty=1))
+		self.local.downloader.batch_size = 10
+		self.local.downloader.requests_per_peer = 2
+		self.local.downloader.window = 40
+		self.local.downloader.timeout = 60
+		self.links = [connect(self.local, remote)[0] for remote in self.remotes]
+		self.local.p2p_network.node.connections = [(link, f"remote {i}") for i, link in enumerate(self.links)]
+
+	def synced(self):
+		return hashes(self.local.blockchain) == hashes(self.remotes[0].blockchain)
+
+	def served(self, remote):
+		return [payload for message_type, payload in remote.p2p_network.node.sent if message_type == MessageType.BLOCKS]
+
+	def test_blocks_from_all_peers(self):
+		self.local.start_sync_loop()
+		self.wire.pump()
+
+		self.assertTrue(self.synced())
+		self.assertTrue(all(self.served(remote) for remote in self.remotes))
+		requests = [payload for message_type, payload in self.local.p2p_network.node.sent
+					if message_type == MessageType.GET_BLOCKS]
+		self.assertEqual(len(requests), 10)
+		self.assertIsNone(self.local.downloader.download)
+
+	def test_slow_peer_replaced(self):
+		now = [0.0]
+		self.local.downloader.clock = lambda: now[0]
+		self.wire.muted.add(self.links[1])
+		self.local.start_sync_loop()
+		for _ in range(50):
+			self.wire.pump()
+			if self.synced():
+				break
+			# Let every request of the muted peer miss its deadline
+			now[0] += self.local.downloader.timeout
+			self.local.downloader.check()
+
+		self.assertTrue(self.synced())
+		self.assertEqual(self.served(self.remotes[1]), [])
+
+	def test_disconnected_peer_replaced(self):
+		self.wire.muted.add(self.links[1])
+		self.local.start_sync_loop()
+		self.wire.pump()
+		self.assertFalse(self.synced())
+
+		self.local.p2p_network.node.connections.pop()
+		self.local.downloader.check()
+		self.wire.pump()
+		self.assertTrue(self.synced())
+
+
+if __name__ == "__main__":
+	unittest.main()
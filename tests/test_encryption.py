@@ -27,6 +27,86 @@ class TestEncryption(unittest.TestCase):
 			self.assertEqual(self.exe.decrypt(b'123'), "321")
 
 
+class TestCompression(unittest.TestCase):
+	exe = enc.SymmetricEncryption(os.urandom(32), compress=True,
+								  threshold=enc.CompressionThreshold())
+
+	def test_compressed_roundtrip(self):
+		text = "Long repetitive message. " * 40
+		ciphertext = self.exe.encrypt(text)
+
+		self.assertLess(len(ciphertext), len(text))
+		self.assertEqual(self.exe.decrypt(ciphertext), text)
+
+	def test_small_message_not_compressed(self):
+		self.assertEqual(self.exe.pack(b"hi"), bytes([enc.FLAG_RAW]) + b"hi")
+		self.assertEqual(self.exe.decrypt(self.exe.encrypt("hi")), "hi")
+
+	def test_legacy_ciphertext_detected(self):
+		legacy = enc.SymmetricEncryption(self.exe.key)
+
+		self.assertEqual(self.exe.decrypt(legacy.encrypt("Test String.")), "Test String.")
+		self.assertEqual(legacy.decrypt(self.exe.encrypt("Test String." * 20)), "Test String." * 20)
+
+	def test_truncated_or_padded_stream_rejected(self):
+		compressed = self.exe.pack(b"Long repetitive message. " * 40)
+		self.assertEqual(compressed[0], enc.FLAG_ZLIB)
+
+		with self.assertRaises(ValueError):
+			self.exe.unpack(compressed[:-4])
+		with self.assertRaises(ValueError):
+			self.exe.unpack(compressed + b"padding")
+
+	def test_threshold_per_instance(self):
+		other = enc.SymmetricEncryption(self.exe.key, compress=True)
+		self.assertIsNot(other.threshold, enc.SymmetricEncryption(self.exe.key, compress=True).threshold)
+
+	def test_threshold_adapts(self):
+		threshold = enc.CompressionThreshold()
+		threshold.record(100, 120)
+		self.assertEqual(threshold.value, enc.MIN_COMPRESSION_THRESHOLD * 2)
+		threshold.record(100, 50)
+		self.assertEqual(threshold.value, enc.MIN_COMPRESSION_THRESHOLD)
+
+
+class TestAEAD(unittest.TestCase):
+	key = os.urandom(32)
+	ad = enc.message_associated_data(b"alice", b"bob")
+
+	def test_roundtrip(self):
+		for suite in ("AES-256-GCM", "ChaCha20-Poly1305"):
+			exe = enc.SymmetricEncryption.from_suite(self.key, suite, compress=True)
+			ciphertext = exe.encrypt("Test String.", self.ad)
+
+			self.assertEqual(len(ciphertext), enc.AEAD_NONCE_SIZE + 1 + len("Test String.") + 16)
+			self.assertEqual(exe.decrypt(ciphertext, self.ad), "Test String.")
+
+	def test_associated_data_authenticated(self):
+		exe = enc.SymmetricEncryption.from_suite(self.key, "AES-256-GCM")
+		ciphertext = exe.encrypt("Test String.", self.ad)
+
+		self.assertIsNone(exe.decrypt(ciphertext, enc.message_associated_data(b"bob", b"alice")))
+		self.assertIsNone(exe.decrypt(ciphertext[:-1] + bytes([ciphertext[-1] ^ 1]), self.ad))
+
+	def test_aead_object_cached_per_key(self):
+		first = enc.SymmetricEncryption.from_suite(self.key, "AES-256-GCM")
+		second = enc.SymmetricEncryption.from_suite(self.key, "AES-256-GCM")
+
+		self.assertIs(first.aead, second.aead)
+
+	def test_many(self):
+		exe = enc.SymmetricEncryption.from_suite(self.key, "ChaCha20-Poly1305")
+		texts = ["one", "two", "three"]
+		ads = [enc.message_associated_data(b"alice", bytes([i])) for i in range(3)]
+		ciphertexts = exe.encrypt_many(texts, ads)
+
+		self.assertEqual(exe.decrypt_many(ciphertexts, ads), texts)
+		self.assertEqual(exe.decrypt_many(ciphertexts), [None] * 3)
+
+	def test_unknown_suite(self):
+		with self.assertRaises(ValueError):
+			enc.SymmetricEncryption.from_suite(self.key, "DES")
+
 
 if __name__ == '__main__':
 	unittest.main()
\ No newline at end of file
@@ -0,0 +1,101 @@
+import os
+import socket
+import sys
+import threading
+import unittest
+import zlib
+
+pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(pdir)
+
+import src.network.framing as framing
+from src.network.framing import FrameReader, MessageType, decode_payload, encode_frame, encode_message, split_message
+
+
+class TestFraming(unittest.TestCase):
+	def setUp(self):
+		self.sender, self.receiver = socket.socketpair()
+		self.reader = FrameReader(self.receiver)
+
+	def tearDown(self):
+		self.sender.close()
+		self.receiver.close()
+
+	def send(self, data):
+		thread = threading.Thread(target=self.sender.sendall, args=(data,))
+		thread.start()
+		return thread
+
+	def test_split_message(self):
+		self.assertEqual(split_message(b"GET_CHUNK[]"), (MessageType.GET_CHUNK, b"[]"))
+		self.assertEqual(split_message(b"CHUNKabc"), (MessageType.CHUNK, b"abc"))
+		self.assertEqual(split_message(b"NEW_SHARD_BLOCK{}"), (MessageType.NEW_SHARD_BLOCK, b"{}"))
+		self.assertEqual(split_message(b"hello"), (MessageType.MESSAGE, b"hello"))
+
+	def test_back_to_back_frames(self):
+		thread = self.send(encode_message(b"NEW_TRANSACTION{}") + encode_message(b"REQUEST_CHAIN"))
+		self.assertEqual(self.reader.read_frame(), (MessageType.NEW_TRANSACTION, b"{}"))
+		self.assertEqual(self.reader.read_frame(), (MessageType.REQUEST_CHAIN, b""))
+		thread.join()
+
+	def test_large_frame(self):
+		payload = os.urandom(3 * 1024 * 1024)
+		thread = self.send(encode_frame(MessageType.BLOCKCHAIN, payload))
+		self.assertEqual(self.reader.read_frame(), (MessageType.BLOCKCHAIN, payload))
+		thread.join()
+		self.assertEqual(len(self.reader.buffer), framing.READ_BUFFER_SIZE)
+
+	def test_compressed_frame(self):
+		payload = b"block" * 10000
+		frame = encode_frame(MessageType.BLOCKCHAIN, payload)
+		self.assertLess(len(frame), len(payload))
+		self.assertTrue(frame[1] & framing.FLAG_COMPRESSED)
+		thread = self.send(frame)
+		self.assertEqual(self.reader.read_frame(), (MessageType.BLOCKCHAIN, payload))
+		thread.join()
+
+	def test_payload_keeps_frame(self):
+		for payload in (b"block" * 10000, b"short"):
+			frame = encode_frame(MessageType.NEW_BLOCK, payload)
+			thread = self.send(frame)
+			_, received = self.reader.read_frame()
+			thread.join()
+			self.assertEqual(received, payload)
+			self.assertEqual(received.frame(), frame)
+
+	def test_unknown_type_skipped(self):
+		unknown = framing.HEADER.pack(200, 0, 3) + b"abc"
+		thread = self.send(unknown + encode_message(b"hello"))
+		self.assertEqual(self.reader.read_frame(), (MessageType.MESSAGE, b"hello"))
+		thread.join()
+
+	def test_oversized_frame(self):
+		reader = FrameReader(self.receiver, max_size=16)
+		thread = self.send(framing.HEADER.pack(MessageType.MESSAGE, 0, 17))
+		with self.assertRaises(ValueError):
+			reader.read_frame()
+		thread.join()
+
+	def test_decompression_limit(self):
+		reader = FrameReader(self.receiver, max_size=1024)
+		thread = self.send(encode_frame(MessageType.MESSAGE, b"\0" * 10000)[:1024 + framing.HEADER.size])
+		with self.assertRaises(ValueError):
+			reader.read_frame()
+		thread.join()
+
+	def test_truncated_compressed_payload(self):
+		compressed = zlib.compress(b"hello" * 100)
+		for payload in (compressed[:-4], compressed + b"\0"):
+			with self.assertRaises(ValueError):
+				decode_payload(MessageType.MESSAGE, framing.FLAG_COMPRESSED, payload)
+		decoded = decode_payload(MessageType.MESSAGE, framing.FLAG_COMPRESSED, compressed)
+		self.assertEqual(decoded, b"hello" * 100)
+
+	def test_closed_connection(self):
+		self.sender.sendall(encode_message(b"hello")[:3])
+		self.sender.close()
+		self.assertIsNone(self.reader.read_frame())
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import unittest
+
+pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(pdir)
+
+from src.crypto.groups import GroupManager
+from src.crypto.diffie_hellman import DiffieHellmanKeyExchange
+from src.blockchain.blockchain import Blockchain, Block
+from src.blockchain.transaction import BatchTransaction
+from src.utils.config import DEFAULT_DH_PARAMETERS
+
+
+class TestGroupManager(unittest.TestCase):
+	def setUp(self):
+		self.alice = GroupManager(DiffieHellmanKeyExchange(DEFAULT_DH_PARAMETERS))
+		self.bob = GroupManager(DiffieHellmanKeyExchange(DEFAULT_DH_PARAMETERS))
+		self.alice_key = self.alice.dh_key_manager.get_public_key()
+		self.bob_key = self.bob.dh_key_manager.get_public_key()
+		self.group = self.alice.create_group("Team", [self.alice_key, self.bob_key])
+
+	def test_invitation_joins_group(self):
+		payloads = self.alice.invitation_payloads(self.group)
+		self.assertEqual([member for member, _ in payloads], [self.bob_key])
+
+		envelope = BatchTransaction.create(self.alice_key, payloads, None)
+		joined = self.bob.process_transaction(envelope)
+
+		self.assertEqual(len(joined), 1)
+		self.assertEqual(joined[0].group_id, self.group.group_id)
+		self.assertEqual(joined[0].key, self.group.key)
+
+	def test_group_encryption(self):
+		self.bob.process_transaction(
+			BatchTransaction.create(self.alice_key, self.alice.invitation_payloads(self.group), None)
+		)
+		ciphertext = self.alice.encrypt(self.group.group_id, "Hello team")
+
+		self.assertEqual(self.bob.decrypt(self.group.group_id, ciphertext), "Hello team")
+
+	def test_is_group_id(self):
+		self.assertTrue(GroupManager.is_group_id(self.group.group_id))
+		self.assertFalse(GroupManager.is_group_id(self.alice_key))
+		self.assertFalse(GroupManager.is_group_id(None))
+
+	def test_replay_after_restart(self):
+		chain = Blockchain(difficulty=1)
+		envelope = BatchTransaction.create(self.alice_key, self.alice.invitation_payloads(self.group), None)
+		chain.chain.append(Block(1, chain.chain[0].hash, 1.0, [envelope]))
+
+		# Same identities, no groups in memory
+		for dh_key_manager in (self.alice.dh_key_manager, self.bob.dh_key_manager):
+			restarted = GroupManager(dh_key_manager)
+			restored = restarted.replay(chain)
+			self.assertEqual([group.group_id for group in restored], [self.group.group_id])
+			self.assertEqual(restarted.get_group(self.group.group_id).key, self.group.key)
+			self.assertEqual(restarted.replay(chain), [])
+
+	def test_not_invitation(self):
+		self.assertIsNone(self.bob.accept_invitation("Just a message"))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,130 @@
+import contextlib
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+
+pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(pdir)
+
+from src.network.framing import MessageType
+from src.network.inventory import ID_SIZE, split_ids
+from src.network.sockets import P2PSocket
+
+
+class FakeSyncManager:
+	def __init__(self, node):
+		self.node = node
+		self.handled = []
+		self.event = threading.Event()
+
+	def handle_new_transaction(self, data, conn):
+		self.handled.append(data)
+		self.node.relay(MessageType.NEW_TRANSACTION, data, conn)
+		self.event.set()
+
+
+class CountingSocket:
+	'''Socket wrapper counting sent frames by type'''
+	def __init__(self, sock):
+		self.sock = sock
+		self.sent = []
+
+	def sendall(self, data):
+		self.sent.append(MessageType(data[0]))
+		self.sock.sendall(data)
+
+	def __getattr__(self, name):
+		return getattr(self.sock, name)
+
+
+def wait_for(condition, timeout=5):
+	deadline = time.monotonic() + timeout
+	while not condition() and time.monotonic() < deadline:
+		time.sleep(0.01)
+	return condition()
+
+
+class TestInventory(unittest.TestCase):
+	def setUp(self):
+		self.nodes = []
+		self.links = []
+		self.threads = []
+
+	def tearDown(self):
+		# Handler threads close their sockets themselves, so they may already be gone
+		for link in self.links:
+			for sock in link:
+				with contextlib.suppress(OSError):
+					sock.sock.shutdown(socket.SHUT_RDWR)
+		for thread in self.threads:
+			thread.join(5)
+		for link in self.links:
+			for sock in link:
+				sock.sock.close()
+		for node in self.nodes:
+			node.socket.close()
+
+	def node(self):
+		node = P2PSocket("127.0.0.1", 0, None, None, None)
+		node.sync_manager = FakeSyncManager(node)
+		node.inventory.interval = 0.01
+		self.nodes.append(node)
+		return node
+
+	def link(self, first, second):
+		a, b = socket.socketpair()
+		a, b = CountingSocket(a), CountingSocket(b)
+		running = set(threading.enumerate())
+		first.add_connection(a, ("second", 1))
+		second.add_connection(b, ("first", 1))
+		self.threads += [thread for thread in threading.enumerate() if thread not in running]
+		self.links.append((a, b))
+		return a, b
+
+	def test_split_ids(self):
+		self.assertEqual(split_ids(b"a" * ID_SIZE + b"b" * ID_SIZE), [b"a" * ID_SIZE, b"b" * ID_SIZE])
+		with self.assertRaises(ValueError):
+			split_ids(b"short")
+
+	def test_announce_and_fetch(self):
+		first, second = self.node(), self.node()
+		a, b = self.link(first, second)
+		payload = b"{" + os.urandom(4096).hex().encode() + b"}"
+		first.broadcast(b"NEW_TRANSACTION" + payload, None)
+
+		self.assertTrue(second.sync_manager.event.wait(5))
+		self.assertEqual(second.sync_manager.handled, [payload])
+		self.assertEqual(a.sent, [MessageType.INV, MessageType.NEW_TRANSACTION])
+		self.assertEqual(b.sent, [MessageType.GETDATA])  # Nothing is announced back
+		self.assertEqual(first.sync_manager.handled, [])
+
+	def test_triangle_sends_payload_once_per_node(self):
+		first, second, third = self.node(), self.node(), self.node()
+		links = [self.link(first, second), self.link(second, third), self.link(third, first)]
+		first.broadcast(b"NEW_TRANSACTION{}", None)
+
+		self.assertTrue(wait_for(lambda: second.sync_manager.handled and third.sync_manager.handled))
+		time.sleep(0.1)
+		payloads = sum(sock.sent.count(MessageType.NEW_TRANSACTION) for link in links for sock in link)
+		self.assertEqual(payloads, 2)
+		self.assertEqual(first.sync_manager.handled, [])
+
+	def test_request_retried_from_other_peer(self):
+		first, second, third = self.node(), self.node(), self.node()
+		third.inventory.request_timeout = 0.05
+		a, _ = self.link(first, third)
+		c, _ = self.link(second, third)
+		# The first peer announces but no longer has the message
+		first.broadcast(b"NEW_TRANSACTION{}", None)
+		first.inventory.items.clear()
+		self.assertTrue(wait_for(lambda: third.seen.holders(next(iter(first.seen.entries)))))
+		second.broadcast(b"NEW_TRANSACTION{}", None)
+		self.assertTrue(third.sync_manager.event.wait(5))
+		self.assertEqual(third.sync_manager.handled, [b"{}"])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import unittest
+
+pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(pdir)
+
+from src.crypto.key_registry import PublicKeyRegistry
+from src.crypto.signatures import DigitalSignature
+
+
+class TestPublicKeyRegistry(unittest.TestCase):
+	def setUp(self):
+		self.registry = PublicKeyRegistry(capacity=2)
+		self.keys = [DigitalSignature(algorithm="Ed25519").get_public_key() for _ in range(3)]
+
+	def test_parsed_once(self):
+		first = self.registry.get(self.keys[0], "ed25519")
+
+		self.assertIs(self.registry.get(self.keys[0], "ed25519"), first)
+		self.assertEqual(self.registry.stats()["hits"], 1)
+		self.assertEqual(self.registry.stats()["misses"], 1)
+		self.assertEqual(self.registry.stats()["hit_rate"], 0.5)
+
+	def test_format_is_part_of_key(self):
+		self.registry.get(self.keys[0], "ed25519")
+		self.registry.get(self.keys[0], "x25519")
+
+		self.assertEqual(self.registry.stats()["misses"], 2)
+
+	def test_lru_eviction(self):
+		for key in self.keys:
+			self.registry.get(key, "ed25519")
+		self.registry.get(self.keys[0], "ed25519")
+
+		self.assertEqual(self.registry.stats()["size"], 2)
+		self.assertEqual(self.registry.stats()["misses"], 4)
+
+	def test_invalid_key_not_cached(self):
+		with self.assertRaises(ValueError):
+			self.registry.get(b"not a key", "pem")
+		self.assertEqual(self.registry.stats()["size"], 0)
+
+	def test_verify_uses_registry(self):
+		from src.crypto import key_registry
+
+		signer = DigitalSignature()
+		signature = signer.sign(b"Test String.")
+		signer.verify(signer.get_public_key(), "Test String.", signature)
+		stats = key_registry.registry.stats()
+		signer.verify(signer.get_public_key(), "Test String.", signature)
+
+		self.assertEqual(key_registry.registry.stats()["misses"], stats["misses"])
+		self.assertGreater(key_registry.registry.stats()["hits"], stats["hits"])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import tempfile
+import unittest
+
+pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(pdir)
+
+from src.crypto.keystore import Keystore
+from src.crypto.diffie_hellman import DiffieHellmanKeyExchange, X25519KeyExchange
+from src.crypto.signatures import DigitalSignature
+from src.utils.config import DEFAULT_DH_PARAMETERS
+
+
+class TestKeystore(unittest.TestCase):
+	def setUp(self):
+		self.tmp = tempfile.TemporaryDirectory()
+		self.keystore = Keystore(os.path.join(self.tmp.name, "identity.keystore"), scrypt_n=2 ** 10)
+
+	def tearDown(self):
+		self.tmp.cleanup()
+
+	def assert_same_identity(self, loaded, key_exchange, signer):
+		loaded_exchange, loaded_signer = loaded
+		self.assertIs(type(loaded_exchange), type(key_exchange))
+		self.assertEqual(loaded_exchange.get_public_key(), key_exchange.get_public_key())
+		self.assertEqual(loaded_signer.algorithm, signer.algorithm)
+		self.assertEqual(loaded_signer.get_public_key(), signer.get_public_key())
+
+	def test_dh_rsa_roundtrip(self):
+		key_exchange = DiffieHellmanKeyExchange(DEFAULT_DH_PARAMETERS)
+		signer = DigitalSignature()
+		self.keystore.save("secret", key_exchange, signer)
+
+		loaded = self.keystore.load("secret")
+		self.assert_same_identity(loaded, key_exchange, signer)
+		peer = DiffieHellmanKeyExchange(DEFAULT_DH_PARAMETERS)
+		self.assertEqual(
+			loaded[0].generate_shared_key(peer.get_public_key()),
+			peer.generate_shared_key(key_exchange.get_public_key()),
+		)
+
+	def test_x25519_ed25519_roundtrip(self):
+		key_exchange = X25519KeyExchange()
+		signer = DigitalSignature(algorithm="Ed25519")
+		self.keystore.save("secret", key_exchange, signer)
+
+		loaded = self.keystore.load("secret")
+		self.assert_same_identity(loaded, key_exchange, signer)
+		self.assertTrue(signer.verify(loaded[1].get_public_key(), "msg", loaded[1].sign(b"msg")))
+
+	def test_wrong_passphrase(self):
+		self.keystore.save("secret", X25519KeyExchange(), DigitalSignature(algorithm="Ed25519"))
+
+		with self.assertRaises(ValueError):
+			self.keystore.load("wrong")
+
+	def test_spare_key_pair(self):
+		self.assertIsNone(self.keystore.take_spare())
+		self.keystore.pregenerate("X25519", "Ed25519")
+		key_exchange, signer = self.keystore.take_spare()
+
+		self.assertIsInstance(key_exchange, X25519KeyExchange)
+		self.assertEqual(signer.algorithm, "Ed25519")
+
+
+if __name__ == '__main__':
+	unittest.main()
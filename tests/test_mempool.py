@@ -0,0 +1,84 @@
+import unittest
+import os
+import sys
+import tempfile
+parent_dir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(parent_dir)
+from src.blockchain.mempool import MempoolJournal
+from src.blockchain.transaction import Transaction
+
+
+class TestMempoolJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "mempool.journal")
+        self.journal = MempoolJournal(self.path, fsync_batch=2, compact_threshold=4)
+        self.transactions = [
+            Transaction(b"Alice", b"Bob", 0, f"Message {i}", timestamp=float(i))
+            for i in range(3)
+        ]
+
+    def tearDown(self):
+        self.journal.close()
+        self.directory.cleanup()
+
+    def test_replay_restores_pending(self):
+        """ Test that added and not removed transactions are restored."""
+        for transaction in self.transactions:
+            self.journal.record_add(transaction)
+        self.journal.record_remove([self.transactions[1]])
+        self.journal.close()
+
+        restored = MempoolJournal(self.path).replay()
+        self.assertEqual(
+            [transaction.content for transaction in restored],
+            ["Message 0", "Message 2"]
+        )
+        self.assertEqual(restored[0].sender, b"Alice")
+
+    def test_replay_ignores_torn_record(self):
+        """ Test that a partially written last record is skipped."""
+        self.journal.record_add(self.transactions[0])
+        self.journal.close()
+        with open(self.path, "a", encoding="utf-8") as journal:
+            journal.write('{"op": "ADD", "transac')
+
+        restored = MempoolJournal(self.path).replay()
+        self.assertEqual(len(restored), 1)
+
+    def test_replay_skips_record_without_op(self):
+        """ Test that records without operation or its fields are skipped."""
+        self.journal.record_add(self.transactions[0])
+        self.journal.close()
+        with open(self.path, "a", encoding="utf-8") as journal:
+            journal.write('{"id": "abc"}\n')
+            journal.write('{"op": "ADD"}\n{"op": "REMOVE"}\n{"op": "ADD", "transaction": {"sender": 5}}\n')
+
+        restored = MempoolJournal(self.path).replay()
+        self.assertEqual(len(restored), 1)
+
+    def test_idle_records_synced(self):
+        """ Test that records below the batch size are fsynced after the interval."""
+        journal = MempoolJournal(self.path, fsync_batch=10, fsync_interval=0.2)
+        journal.record_add(self.transactions[0])
+        timer = journal.timer
+        self.assertEqual(journal.unsynced, 1)
+        timer.join(5)
+        self.assertEqual(journal.unsynced, 0)
+        self.assertIsNone(journal.timer)
+        journal.close()
+
+    def test_compaction(self):
+        """ Test that journal is compacted to live records only."""
+        for transaction in self.transactions:
+            self.journal.record_add(transaction)
+        self.journal.record_remove(self.transactions[:2])
+
+        with open(self.path, encoding="utf-8") as journal:
+            self.assertEqual(len(journal.readlines()), 1)
+        self.assertEqual(self.journal.replay()[0].content, "Message 2")
+
+
+if __name__ == '__main__':
+    unittest.main()
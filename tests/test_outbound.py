@@ -0,0 +1,134 @@
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+
+pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(pdir)
+
+from src.network.outbound import OutboundQueue, Priority
+from src.network.sockets import P2PSocket
+from src.network.framing import HEADER, FrameReader, MessageType, decode_payload, encode_frame
+
+
+class TestOutboundQueue(unittest.TestCase):
+	def test_priority_order(self):
+		queue = OutboundQueue()
+		queue.put(b"bulk", Priority.BULK)
+		queue.put(b"normal1")
+		queue.put(b"high", Priority.HIGH)
+		queue.put(b"normal2")
+		self.assertEqual([queue.pop() for _ in range(4)], [b"high", b"normal1", b"normal2", b"bulk"])
+		self.assertIsNone(queue.pop())
+		self.assertEqual(queue.size, 0)
+
+	def test_high_water(self):
+		queue = OutboundQueue(high_water=10)
+		self.assertTrue(queue.put(b"x" * 100))  # Oversized frame fits into an empty queue
+		self.assertFalse(queue.put(b"x"))
+		queue.pop()
+		self.assertTrue(queue.put(b"x" * 6))
+		self.assertFalse(queue.put(b"x" * 6))
+		self.assertEqual(queue.size, 6)
+
+	def test_close_wakes_writer(self):
+		queue = OutboundQueue()
+		result = []
+		thread = threading.Thread(target=lambda: result.append(queue.get()))
+		thread.start()
+		queue.close()
+		thread.join(1)
+		self.assertEqual(result, [None])
+		self.assertFalse(queue.put(b"x"))
+
+	def test_wait_for_room(self):
+		queue = OutboundQueue()
+		queue.put(b"x" * 100)
+		queue.put(b"x" * 100)
+		self.assertFalse(queue.wait_for_room(100, timeout=0.05))
+		threading.Timer(0.05, queue.pop).start()
+		self.assertTrue(queue.wait_for_room(100, timeout=1))
+		queue.close()
+		self.assertFalse(queue.wait_for_room(100))
+
+
+class TestFanOut(unittest.TestCase):
+	def setUp(self):
+		self.node = P2PSocket("127.0.0.1", 0, None, None, None)
+		for conn in ("sender", "a", "b"):
+			self.node.connections.append((conn, (conn, 1)))
+			self.node.queues[conn] = OutboundQueue()
+
+	def tearDown(self):
+		self.node.socket.close()
+
+	def test_broadcast_shares_frame(self):
+		self.node.broadcast(b"hello" * 1000, "sender")
+		frame = self.node.queues["a"].pop()
+		self.assertIs(self.node.queues["b"].pop(), frame)
+		self.assertIsNone(self.node.queues["sender"].pop())
+
+	def test_relay_reuses_received_frame(self):
+		frame = encode_frame(MessageType.MESSAGE, b"hello" * 1000)
+		header = HEADER.unpack(frame[:HEADER.size])
+		payload = decode_payload(MessageType.MESSAGE, header[1], frame[HEADER.size:])
+		self.node.relay(MessageType.MESSAGE, payload, "sender")
+		shared = self.node.queues["a"].pop()
+		self.assertEqual(shared, frame)
+		self.assertIs(self.node.queues["b"].pop(), shared)
+
+
+class TestSocketBackpressure(unittest.TestCase):
+	def setUp(self):
+		self.node = P2PSocket("127.0.0.1", 0, None, None, None)
+
+	def tearDown(self):
+		self.node.socket.close()
+
+	def test_slow_peer_disconnected(self):
+		fast, fast_peer = socket.socketpair()
+		slow, slow_peer = socket.socketpair()
+		slow.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+		self.node.add_connection(fast, ("fast", 1))
+		self.node.add_connection(slow, ("slow", 2))
+		self.node.queues[slow].high_water = 64 * 1024
+
+		messages = [b"x" + os.urandom(8 * 1024) for _ in range(200)]
+		start = time.monotonic()
+		for message in messages:
+			self.node.broadcast(message, None)
+		self.assertLess(time.monotonic() - start, 2)
+
+		reader = FrameReader(fast_peer)
+		for message in messages:
+			self.assertEqual(reader.read_frame(), (MessageType.MESSAGE, message))
+		deadline = time.monotonic() + 5
+		while len(self.node.connections) > 1 and time.monotonic() < deadline:
+			time.sleep(0.01)
+		self.assertEqual([addr for _, addr in self.node.connections], [("fast", 1)])
+
+		fast_peer.close()
+		slow_peer.close()
+
+	def test_stream_keeps_slow_peer(self):
+		slow, slow_peer = socket.socketpair()
+		slow.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+		self.node.add_connection(slow, ("slow", 1))
+		self.node.queues[slow].high_water = 64 * 1024
+
+		messages = [b"CHAIN_BLOCK" + os.urandom(8 * 1024) for _ in range(200)]
+		self.node.stream(iter(messages), slow)
+
+		reader = FrameReader(slow_peer)
+		for message in messages:
+			self.assertEqual(reader.read_frame(), (MessageType.CHAIN_BLOCK, message[len(b"CHAIN_BLOCK"):]))
+		self.assertEqual([addr for _, addr in self.node.connections], [("slow", 1)])
+
+		self.node.disconnect(slow)
+		slow_peer.close()
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import unittest
+
+pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(pdir)
+
+from src.network.framing import MessageType
+from src.network.outbound import OutboundQueue
+from src.network.seen import SeenCache, message_id
+from src.network.sockets import P2PSocket
+
+
+class FakeSyncManager:
+	def __init__(self, node):
+		self.node = node
+		self.handled = []
+
+	def handle_new_transaction(self, data, conn):
+		self.handled.append(data)
+		self.node.relay(MessageType.NEW_TRANSACTION, data, conn)
+
+
+class TestSeenCache(unittest.TestCase):
+	def setUp(self):
+		self.cache = SeenCache(ttl=60, capacity=3)
+		self.key = message_id(MessageType.NEW_BLOCK, b"block")
+
+	def test_duplicates_counted(self):
+		self.assertTrue(self.cache.check(self.key, MessageType.NEW_BLOCK, "a"))
+		self.assertFalse(self.cache.check(self.key, MessageType.NEW_BLOCK, "b"))
+		self.assertEqual(self.cache.stats(), {"size": 1, "suppressed": 1, "suppressed_new_block": 1})
+
+	def test_fan_out_skips_peers_that_have_message(self):
+		self.cache.check(self.key, MessageType.NEW_BLOCK, "a")
+		self.assertEqual(self.cache.fan_out(self.key, ["a", "b", "c"]), ["b", "c"])
+		self.assertEqual(self.cache.fan_out(self.key, ["a", "b", "c", "d"]), ["d"])
+
+	def test_expiry(self):
+		cache = SeenCache(ttl=0.05)
+		cache.check(self.key, MessageType.NEW_BLOCK)
+		time.sleep(0.1)
+		self.assertTrue(cache.check(self.key, MessageType.NEW_BLOCK))
+
+	def test_capacity(self):
+		keys = [message_id(MessageType.MESSAGE, bytes([i])) for i in range(5)]
+		for key in keys:
+			self.cache.check(key, MessageType.MESSAGE)
+		self.assertEqual(len(self.cache.entries), 3)
+		self.assertTrue(self.cache.check(keys[0], MessageType.MESSAGE))
+
+
+class TestGossipSuppression(unittest.TestCase):
+	def setUp(self):
+		self.node = P2PSocket("127.0.0.1", 0, None, None, None)
+		self.node.sync_manager = FakeSyncManager(self.node)
+		self.node.inventory.interval = 60  # Keep announcements pending
+		for conn in ("a", "b", "c"):
+			self.node.connections.append((conn, (conn, 1)))
+			self.node.queues[conn] = OutboundQueue()
+
+	def tearDown(self):
+		self.node.socket.close()
+
+	def test_echo_suppressed(self):
+		self.node.dispatch(MessageType.NEW_TRANSACTION, b"{}", "a", ("a", 1))
+		self.node.dispatch(MessageType.NEW_TRANSACTION, b"{}", "b", ("b", 1))
+		self.assertEqual(self.node.sync_manager.handled, [b"{}"])
+		self.assertEqual(self.node.seen.stats()["suppressed_new_transaction"], 1)
+		# Announced once to every peer except the sender
+		key = message_id(MessageType.NEW_TRANSACTION, b"{}")
+		self.assertEqual(dict(self.node.inventory.pending), {"b": [key], "c": [key]})
+
+	def test_own_broadcast_not_handled_again(self):
+		self.node.broadcast(b"NEW_TRANSACTION{}", None)
+		self.node.dispatch(MessageType.NEW_TRANSACTION, b"{}", "a", ("a", 1))
+		self.assertEqual(self.node.sync_manager.handled, [])
+		self.node.broadcast(b"NEW_TRANSACTION{}", None)
+		key = message_id(MessageType.NEW_TRANSACTION, b"{}")
+		self.assertEqual(dict(self.node.inventory.pending), {"a": [key], "b": [key], "c": [key]})
+
+
+if __name__ == "__main__":
+	unittest.main()
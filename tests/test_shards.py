@@ -0,0 +1,148 @@
+import unittest
+import os
+import sys
+import tempfile
+parent_dir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(parent_dir)
+from src.blockchain.blockchain import Blockchain, Block
+from src.blockchain.consensus import ProofOfWork
+from src.blockchain.index import conversation_id
+from src.blockchain.shards import ShardManager, shard_for, anchor_commitments, SHARD_ANCHOR_RECIPIENT
+from src.blockchain.transaction import Transaction, BatchTransaction
+from src.crypto.signatures import DigitalSignature
+
+
+class TestShardManager(unittest.TestCase):
+
+    def setUp(self):
+        self.main_chain = Blockchain(difficulty=1)
+        self.shards = ShardManager(b"Alice", self.main_chain, shard_count=4)
+
+    def test_route(self):
+        """ Test that messages are routed by conversation and transfers stay on main chain."""
+        message = Transaction(b"Alice", b"Bob", 0, "hi")
+        self.assertEqual(self.shards.route(message),
+                         shard_for(conversation_id(b"Alice", b"Bob"), 4))
+        self.assertEqual(self.shards.route(Transaction(b"Bob", b"Alice", 0, "re")),
+                         self.shards.route(message))
+        self.assertIsNone(self.shards.route(Transaction(b"Alice", b"Bob", 5, "")))
+        self.assertIsNone(self.shards.route(Transaction(None, b"Alice", 1, "Mining Reward")))
+
+    def test_subscribe_only_participating(self):
+        """ Test that only shards with own traffic are stored."""
+        foreign = Transaction(b"Bob", b"Charlie", 0, "hi")
+        self.assertIsNone(self.shards.accept_transaction(foreign))
+        self.assertEqual(self.shards.shards, {})
+
+        own = Transaction(b"Bob", b"Alice", 0, "hi")
+        shard = self.shards.accept_transaction(own)
+        self.assertIs(shard, self.shards.get_shard(self.shards.route(own)))
+
+    def test_multi_shard_batch_stays_on_main_chain(self):
+        """ Test that batch spanning several shards is not routed."""
+        recipients = [bytes([i]) * 4 for i in range(16)]
+        batch = BatchTransaction.create(b"Alice", [(r, "00") for r in recipients], None)
+        self.assertIsNone(self.shards.route(batch))
+
+    def test_anchor(self):
+        """ Test that shard heads are committed to main chain."""
+        own = Transaction(b"Alice", b"Bob", 0, "hi")
+        shard_id = self.shards.route(own)
+        shard = self.shards.accept_transaction(own)
+        shard.add_pending_transaction(own)
+        block, reward = shard.mine_pending_transactions(ProofOfWork, b"Alice", reward=False)
+        self.assertIsNone(reward)
+        self.assertEqual(shard.pending_transactions, [])
+
+        anchor = self.shards.anchor_transaction(b"Alice", None)
+        self.assertEqual(anchor.recipient, SHARD_ANCHOR_RECIPIENT)
+        self.assertIsNone(self.shards.anchor_transaction(b"Alice", None))
+
+        self.main_chain.add_pending_transaction(anchor)
+        self.main_chain.mine_pending_transactions(ProofOfWork, b"Alice")
+        self.assertTrue(self.shards.is_anchored(shard_id, block.hash))
+        self.assertTrue(self.shards.is_anchored(shard_id, shard.chain[0].hash))
+
+    def test_malformed_anchors_ignored(self):
+        """ Test that anchors of unexpected shape do not break anchor lookups."""
+        self.assertEqual(anchor_commitments('{"0": [1, "aa"], "1": 5, "x": [1, "bb"]}'), {0: "aa"})
+        for content in ("[1,2]", '{"0": 5}', '{"x": [1, "aa"]}', '{"0": [1]}', "not json", None):
+            self.assertEqual(anchor_commitments(content), {})
+
+        self.main_chain.add_pending_transaction(Transaction(b"Mallory", SHARD_ANCHOR_RECIPIENT, 0, "[1,2]"))
+        self.main_chain.add_pending_transaction(Transaction(b"Mallory", SHARD_ANCHOR_RECIPIENT, 0, '{"0": 5}'))
+        self.main_chain.mine_pending_transactions(ProofOfWork, b"Alice")
+        self.assertEqual(self.shards.anchored_heads(), {})
+        self.assertFalse(self.shards.is_anchored(0, "aa"))
+
+    def test_history_merges_shard(self):
+        """ Test that conversation history includes shard messages."""
+        own = Transaction(b"Alice", b"Bob", 0, "hi", timestamp=1.0)
+        self.shards.accept_transaction(own).add_pending_transaction(own)
+        self.assertEqual(self.shards.get_conversation(b"Bob", b"Alice"), [own])
+
+
+class TestShardSync(unittest.TestCase):
+
+    def setUp(self):
+        self.main_chain = Blockchain(difficulty=1)
+        self.alice = ShardManager(b"Alice", self.main_chain, shard_count=4)
+        self.bob = ShardManager(b"Bob", Blockchain(difficulty=1), shard_count=4)
+        self.message = Transaction(b"Alice", b"Bob", 0, "hi", timestamp=1.0)
+        self.shard_id = self.alice.route(self.message)
+        self.shard = self.alice.subscribe(self.shard_id)
+
+    def mine(self, shard, content, timestamp):
+        shard.add_pending_transaction(Transaction(b"Alice", b"Bob", 0, content, timestamp=timestamp))
+        block, _ = shard.mine_pending_transactions(ProofOfWork, b"Alice", reward=False)
+        return block
+
+    def test_late_subscriber_catches_up(self):
+        """ Test that a node subscribing after shard genesis syncs earlier blocks."""
+        for i in range(3):
+            self.mine(self.shard, f"hi {i}", float(i + 1))
+        late = self.bob.subscribe(self.shard_id)
+        self.assertFalse(self.bob.add_shard_block(self.shard_id, self.shard.chain[3]))
+
+        blocks = self.alice.blocks_after(self.shard_id, late.get_latest_block().hash, 2)
+        self.assertEqual(self.bob.add_shard_blocks(self.shard_id, blocks), 2)
+        blocks = self.alice.blocks_after(self.shard_id, late.get_latest_block().hash, 2)
+        self.assertEqual(self.bob.add_shard_blocks(self.shard_id, blocks), 1)
+        self.assertEqual([block.hash for block in late.chain], [block.hash for block in self.shard.chain])
+        self.assertEqual(self.bob.add_shard_blocks(self.shard_id, blocks), 0)
+
+    def test_anchored_blocks_not_replaced(self):
+        """ Test that a longer branch cannot drop shard blocks anchored in the main chain."""
+        anchored = self.mine(self.shard, "anchored", 1.0)
+        branch = Blockchain(difficulty=1)
+        self.mine(branch, "other", 1.0)
+        self.mine(branch, "longer", 2.0)
+
+        self.main_chain.add_pending_transaction(self.alice.anchor_transaction(b"Alice", None))
+        self.main_chain.mine_pending_transactions(ProofOfWork, b"Alice")
+        self.assertEqual(self.alice.add_shard_blocks(self.shard_id, branch.chain[1:]), 0)
+        self.assertEqual(self.shard.get_latest_block().hash, anchored.hash)
+
+        self.main_chain.chain = self.main_chain.chain[:1]
+        self.assertEqual(self.alice.add_shard_blocks(self.shard_id, branch.chain[1:]), 2)
+        self.assertEqual(self.shard.get_latest_block().hash, branch.get_latest_block().hash)
+
+    def test_pending_restored_from_journal(self):
+        """ Test that shard subscriptions and pending messages survive a restart."""
+        signer = DigitalSignature()
+        self.message.sign_public_key = signer.get_public_key()
+        self.message.sign_transaction(signer)
+        with tempfile.TemporaryDirectory() as journal_dir:
+            shards = ShardManager(b"Alice", self.main_chain, shard_count=4, journal_dir=journal_dir)
+            shards.accept_transaction(self.message).add_pending_transaction(self.message)
+            shards.close()
+
+            restarted = ShardManager(b"Alice", self.main_chain, shard_count=4, journal_dir=journal_dir)
+            self.assertEqual(restarted.restore(), [self.shard_id])
+            pending = restarted.get_shard(self.shard_id).pending_transactions
+            self.assertEqual([transaction.content for transaction in pending], ["hi"])
+            restarted.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
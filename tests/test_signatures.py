@@ -35,5 +35,31 @@ class TestDiffieHellman(unittest.TestCase):
 		self.assertEqual(self.ds.verify(public_key, test_string, signature), False)
 
 
+class TestEd25519(unittest.TestCase):
+	ds = sgn.DigitalSignature(algorithm="Ed25519")
+
+	def test_key_and_signature_size(self):
+		self.assertEqual(len(self.ds.get_public_key()), 32)
+		self.assertEqual(len(self.ds.sign(b'Test String.')), 64)
+
+	def test_verify(self):
+		public_key = self.ds.get_public_key()
+		signature = self.ds.sign(b"Test String.")
+
+		self.assertTrue(self.ds.verify(public_key, "Test String.", signature))
+		self.assertFalse(self.ds.verify(public_key, "Teest String.", signature))
+
+	def test_rsa_key_rejected(self):
+		rsa_signer = sgn.DigitalSignature()
+		signature = rsa_signer.sign(b"Test String.")
+
+		self.assertTrue(rsa_signer.verify(rsa_signer.get_public_key(), "Test String.", signature))
+		self.assertFalse(self.ds.verify(rsa_signer.get_public_key(), "Test String.", signature))
+
+	def test_unknown_algorithm(self):
+		with self.assertRaises(ValueError):
+			sgn.DigitalSignature(algorithm="DSA")
+
+
 if __name__ == '__main__':
 	unittest.main()
@@ -0,0 +1,60 @@
+import io
+import os
+import sys
+import unittest
+
+pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(pdir)
+
+import src.crypto.stream as stream
+
+
+class TestStreamEncryption(unittest.TestCase):
+	def setUp(self):
+		self.exe = stream.StreamEncryption(os.urandom(32), chunk_size=16)
+		self.data = os.urandom(100)
+		self.encrypted = b"".join(self.exe.encrypt_stream(io.BytesIO(self.data)))
+
+	def test_roundtrip(self):
+		self.assertEqual(len(self.encrypted), stream.HEADER_SIZE + 100 + 7 * stream.TAG_SIZE)
+		self.assertEqual(b"".join(self.exe.decrypt_stream(io.BytesIO(self.encrypted))), self.data)
+
+	def test_iterable_source(self):
+		pieces = [self.data[i:i + 7] for i in range(0, 100, 7)]
+		encrypted = self.exe.encrypt_stream(pieces)
+
+		self.assertEqual(b"".join(self.exe.decrypt_stream(encrypted)), self.data)
+
+	def test_empty_stream(self):
+		encrypted = b"".join(self.exe.encrypt_stream(io.BytesIO()))
+
+		self.assertEqual(b"".join(self.exe.decrypt_stream(io.BytesIO(encrypted))), b"")
+
+	def test_truncated_stream(self):
+		truncated = self.encrypted[:stream.HEADER_SIZE + 2 * (16 + stream.TAG_SIZE)]
+
+		with self.assertRaises(ValueError):
+			b"".join(self.exe.decrypt_stream(io.BytesIO(truncated)))
+
+	def test_tampered_chunk(self):
+		tampered = bytearray(self.encrypted)
+		tampered[stream.HEADER_SIZE + 40] ^= 1
+
+		with self.assertRaises(ValueError):
+			b"".join(self.exe.decrypt_stream(io.BytesIO(bytes(tampered))))
+
+	def test_decrypt_range(self):
+		source = io.BytesIO(self.encrypted)
+
+		self.assertEqual(b"".join(self.exe.decrypt_range(source, 2, 3)), self.data[32:80])
+		self.assertEqual(b"".join(self.exe.decrypt_range(source, 6)), self.data[96:])
+		with self.assertRaises(ValueError):
+			list(self.exe.decrypt_range(source, 7))
+
+	def test_requires_aead(self):
+		with self.assertRaises(ValueError):
+			stream.StreamEncryption(os.urandom(32), mode="CBC")
+
+
+if __name__ == '__main__':
+	unittest.main()
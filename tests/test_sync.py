@@ -0,0 +1,174 @@
+import json
+import os
+import sys
+import unittest
+
+pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(pdir)
+
+from src.blockchain.blockchain import Blockchain
+from src.blockchain.shards import ShardManager
+from src.blockchain.consensus import ProofOfWork
+from src.blockchain.transaction import Transaction
+from src.network.framing import MessageType, split_message
+from src.network.headers import LOCATOR_DENSE, block_locator, decode_headers, find_fork
+from src.network.sync import SyncManager
+from src.crypto.signatures import DigitalSignature
+
+HANDLERS = {
+	MessageType.GET_HEADERS: "handle_get_headers",
+	MessageType.HEADERS: "handle_headers",
+	MessageType.GET_BLOCKS: "handle_get_blocks",
+	MessageType.BLOCKS: "handle_blocks",
+	MessageType.GET_SHARD_BLOCKS: "handle_get_shard_blocks",
+	MessageType.SHARD_BLOCKS: "handle_shard_blocks",
+}
+
+
+class Peer:
+	'''Connection end that delivers messages straight to a sync manager'''
+	def __init__(self, manager):
+		self.manager = manager
+		self.back = None
+
+
+class LoopbackNode:
+	def __init__(self):
+		self.sent = []
+		self.connections = []
+
+	def send(self, message, conn):
+		message_type, payload = split_message(message)
+		self.sent.append((message_type, payload))
+		getattr(conn.manager, HANDLERS[message_type])(payload, conn.back)
+
+
+class FakeNetwork:
+	def __init__(self):
+		self.node = LoopbackNode()
+		self.shard_manager = None
+		self.relayed = []
+
+	def relay(self, message_type, payload, conn):
+		self.relayed.append((message_type, payload))
+
+
+def grow(chain, count, tag):
+	for i in range(count):
+		chain.add_pending_transaction(Transaction(b"Alice", b"Bob", 0, f"{tag} {i}", timestamp=float(i + 1)))
+		chain.mine_pending_transactions(ProofOfWork, b"Miner", reward=False)
+
+
+def hashes(chain):
+	return [block.hash for block in chain.chain]
+
+
+def manager(chain):
+	return SyncManager(FakeNetwork(), chain)
+
+
+def connect(first, second):
+	to_second, to_first = Peer(second), Peer(first)
+	to_second.back, to_first.back = to_first, to_second
+	return to_second, to_first
+
+
+class TestLocator(unittest.TestCase):
+	def test_locator_is_sparse(self):
+		chain = Blockchain(difficulty=1)
+		grow(chain, 40, "block")
+		locator = block_locator(chain.chain)
+		self.assertEqual(locator[:LOCATOR_DENSE], hashes(chain)[::-1][:LOCATOR_DENSE])
+		self.assertEqual(locator[-1], chain.chain[0].hash)
+		self.assertLess(len(locator), 20)
+
+	def test_find_fork(self):
+		chain = Blockchain(difficulty=1)
+		grow(chain, 20, "block")
+		locator = block_locator(chain.chain[:15])
+		self.assertEqual(find_fork(chain.chain, locator), 14)
+		self.assertIsNone(find_fork(chain.chain, ["unknown"]))
+
+
+class TestHeadersSync(unittest.TestCase):
+	def setUp(self):
+		self.remote = manager(Blockchain(difficulty=1))
+		grow(self.remote.blockchain, 30, "block")
+		self.local = manager(Blockchain(difficulty=1))
+
+	def sync(self):
+		to_remote, _ = connect(self.local, self.remote)
+		self.local.request_headers(to_remote)
+
+	def test_catch_up_fetches_only_gap(self):
+		self.local.blockchain.chain = list(self.remote.blockchain.chain[:26])
+		self.sync()
+
+		self.assertEqual(hashes(self.local.blockchain), hashes(self.remote.blockchain))
+		headers = [payload for message_type, payload in self.remote.p2p_network.node.sent
+				   if message_type == MessageType.HEADERS]
+		self.assertEqual(len(decode_headers(headers[0])), 5)
+		sent = [message_type for message_type, _ in self.local.p2p_network.node.sent]
+		self.assertEqual(sent, [MessageType.GET_HEADERS, MessageType.GET_BLOCKS, MessageType.GET_HEADERS])
+		self.assertIsNone(self.local.downloader.download)
+
+	def test_up_to_date(self):
+		self.local.blockchain.chain = list(self.remote.blockchain.chain)
+		self.sync()
+		self.assertEqual(self.remote.p2p_network.node.sent, [])
+
+	def test_longer_branch_replaces_fork(self):
+		self.local.blockchain.chain = list(self.remote.blockchain.chain[:11])
+		grow(self.local.blockchain, 5, "fork")
+		self.sync()
+		self.assertEqual(hashes(self.local.blockchain), hashes(self.remote.blockchain))
+
+	def test_shorter_branch_ignored(self):
+		self.local.blockchain.chain = list(self.remote.blockchain.chain[:11])
+		grow(self.local.blockchain, 25, "fork")
+		local_hashes = hashes(self.local.blockchain)
+		self.sync()
+		self.assertEqual(hashes(self.local.blockchain), local_hashes)
+
+	def test_invalid_block_aborts(self):
+		self.local.blockchain.chain = list(self.remote.blockchain.chain[:20])
+		tampered = self.remote.blockchain.chain[25]
+		tampered.transactions = [Transaction(b"Alice", b"Mallory", 0, "forged", timestamp=1.0)]
+		self.sync()
+		self.assertEqual(hashes(self.local.blockchain), hashes(self.remote.blockchain)[:25])
+		self.assertIsNone(self.local.downloader.download)
+
+
+class TestShardSync(unittest.TestCase):
+	def test_late_subscriber_pages_through_shard(self):
+		remote, local = manager(Blockchain(difficulty=1)), manager(Blockchain(difficulty=1))
+		remote.p2p_network.shard_manager = ShardManager(b"Alice", remote.blockchain, shard_count=1)
+		local.p2p_network.shard_manager = ShardManager(b"Bob", local.blockchain, shard_count=1)
+		shard = remote.p2p_network.shard_manager.subscribe(0)
+		grow(shard, 20, "message")
+		late = local.p2p_network.shard_manager.subscribe(0)
+
+		local.request_shard_blocks(0, connect(local, remote)[0])
+
+		self.assertEqual(hashes(late), hashes(shard))
+		requests = [message_type for message_type, _ in local.p2p_network.node.sent]
+		self.assertEqual(requests, [MessageType.GET_SHARD_BLOCKS] * 2)
+
+	def test_forged_transaction_of_other_shard_not_relayed(self):
+		node = manager(Blockchain(difficulty=1))
+		node.p2p_network.shard_manager = ShardManager(b"Carol", node.blockchain, shard_count=1)
+		signer = DigitalSignature()
+		transaction = Transaction(b"Alice", b"Bob", 0, "aa11", signer.get_public_key(), timestamp=1.0)
+		forged = Transaction.from_dict(transaction.to_dict())
+		forged.signature = b"forged"
+		transaction.sign_transaction(signer)
+
+		node.handle_new_transaction(json.dumps(forged.to_dict()).encode(), None)
+		self.assertEqual(node.p2p_network.relayed, [])
+		node.handle_new_transaction(json.dumps(transaction.to_dict()).encode(), None)
+		self.assertEqual(len(node.p2p_network.relayed), 1)
+		self.assertEqual(node.p2p_network.shard_manager.shards, {})
+
+
+if __name__ == "__main__":
+	unittest.main()
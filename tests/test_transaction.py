@@ -10,7 +10,8 @@ import os
 import sys
 parent_dir = os.path.dirname(os.path.realpath(__file__)) + "/.."
 sys.path.append(parent_dir)
-from src.blockchain.transaction import Transaction
+from src.blockchain.transaction import Transaction, BatchTransaction, BATCH_RECIPIENT
+from src.crypto.signatures import DigitalSignature
 
 
 class TestTransaction(unittest.TestCase):
@@ -83,5 +84,90 @@ class TestTransaction(unittest.TestCase):
         is_valid = invalid_transaction.is_valid(self.public_key)
         self.assertFalse(is_valid)
 
+class TestBatchTransaction(unittest.TestCase):
+
+    def setUp(self):
+        self.signer = DigitalSignature()
+        self.batch = BatchTransaction.create(
+            b"Alice",
+            [(b"Bob", "aa11"), (b"Charlie", "bb22")],
+            self.signer.get_public_key()
+        )
+
+    def test_sign_and_verify(self):
+        """ Test that one signature covers every payload."""
+        self.batch.sign_transaction(self.signer)
+        self.assertTrue(self.batch.is_valid(self.signer.get_public_key()))
+
+        tampered = BatchTransaction.from_dict(self.batch.to_dict())
+        tampered.content = tampered.content.replace("bb22", "bb23")
+        self.assertFalse(tampered.is_valid(self.signer.get_public_key()))
+
+    def test_from_dict_dispatch(self):
+        """ Test that serialized envelope is restored as batch."""
+        self.batch.sign_transaction(self.signer)
+        restored = Transaction.from_dict(self.batch.to_dict())
+        self.assertIsInstance(restored, BatchTransaction)
+        self.assertEqual(restored.recipient, BATCH_RECIPIENT)
+        self.assertEqual(restored.calculate_hash(), self.batch.calculate_hash())
+
+    def test_messages(self):
+        """ Test that envelope is unpacked into per-recipient messages."""
+        messages = self.batch.messages()
+        self.assertEqual([message.recipient for message in messages], [b"Bob", b"Charlie"])
+        self.assertEqual(messages[1].content, "bb22")
+        self.assertEqual(messages[0].sender, b"Alice")
+
+    def test_empty_batch_invalid(self):
+        """ Test that envelope without payloads is rejected."""
+        empty = BatchTransaction.create(b"Alice", [], self.signer.get_public_key())
+        empty.sign_transaction(self.signer)
+        self.assertFalse(empty.is_valid(self.signer.get_public_key()))
+
+    def test_malformed_payload_invalid(self):
+        """ Test that envelope with non-hex or missing payload fields is rejected."""
+        for content in ('[{"recipient": "zz", "content": "aa11"}]',
+                        '[{"recipient": "426f62", "content": "not hex"}]',
+                        '[{"recipient": "426f62"}]'):
+            batch = BatchTransaction(b"Alice", content=content, sign_public_key=self.signer.get_public_key())
+            batch.sign_transaction(self.signer)
+            self.assertFalse(batch.is_valid(self.signer.get_public_key()))
+
+
+class TestEd25519Transaction(unittest.TestCase):
+
+    def setUp(self):
+        self.signer = DigitalSignature(algorithm="Ed25519")
+        self.transaction = Transaction(
+            b"Alice", b"Bob", 0, "aa11", self.signer.get_public_key(), timestamp=1.0
+        )
+
+    def test_sign_and_verify(self):
+        """ Test that Ed25519 signature is detected and verified by key format."""
+        self.transaction.sign_transaction(self.signer)
+        self.assertEqual(len(self.transaction.sign_public_key), 32)
+        self.assertEqual(len(self.transaction.signature), 64)
+        self.assertTrue(self.transaction.is_valid(self.signer.get_public_key(), "Ed25519"))
+
+    def test_serialized_roundtrip(self):
+        """ Test that restored transaction keeps a valid signature."""
+        self.transaction.sign_transaction(self.signer)
+        restored = Transaction.from_dict(self.transaction.to_dict())
+        self.assertTrue(restored.is_valid(restored.sign_public_key, "Ed25519"))
+
+        restored.content = "aa12"
+        self.assertFalse(restored.is_valid(restored.sign_public_key, "Ed25519"))
+
+    def test_wrong_key(self):
+        """ Test that signature made with another key is rejected."""
+        self.transaction.sign_transaction(DigitalSignature(algorithm="Ed25519"))
+        self.assertFalse(self.transaction.is_valid(self.signer.get_public_key(), "Ed25519"))
+
+    def test_other_algorithm_rejected(self):
+        """ Test that a valid Ed25519 signature is rejected on an RSA network."""
+        self.transaction.sign_transaction(self.signer)
+        self.assertFalse(self.transaction.is_valid(self.signer.get_public_key(), "RSA"))
+
+
 if __name__ == '__main__':
     unittest.main()
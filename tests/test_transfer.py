@@ -0,0 +1,99 @@
+import os
+import sys
+import unittest
+
+pdir = os.path.dirname(os.path.realpath(__file__)) + "/.."
+sys.path.append(pdir)
+
+from src.blockchain.blockchain import Blockchain
+from src.blockchain.transaction import Transaction
+from src.network.framing import MessageType, split_message
+from src.network.sync import SyncManager
+from src.network.transfer import ChainStream
+from tests.test_sync import connect, grow, hashes
+
+HANDLERS = {
+	MessageType.REQUEST_CHAIN: "send_chain",
+	MessageType.CHAIN_BLOCK: "handle_chain_block",
+	MessageType.CHAIN_END: "handle_chain_end",
+}
+
+
+class StreamingNode:
+	'''Delivers streamed messages one by one, each is handled before the next is produced'''
+	def __init__(self):
+		self.sent = []
+
+	def send(self, message, conn):
+		message_type, payload = split_message(message)
+		self.sent.append(message_type)
+		getattr(conn.manager, HANDLERS[message_type])(payload, conn.back)
+
+	def stream(self, messages, conn):
+		for message in messages:
+			self.send(message, conn)
+
+
+class FakeNetwork:
+	def __init__(self):
+		self.node = StreamingNode()
+		self.shard_manager = None
+
+
+class TestChainStream(unittest.TestCase):
+	def setUp(self):
+		self.remote = SyncManager(FakeNetwork(), Blockchain(difficulty=1))
+		grow(self.remote.blockchain, 30, "block")
+		self.local = SyncManager(FakeNetwork(), Blockchain(difficulty=1))
+
+	def sync(self):
+		to_remote, _ = connect(self.local, self.remote)
+		self.local.request_chain_stream(to_remote)
+
+	def streamed(self):
+		return self.remote.p2p_network.node.sent.count(MessageType.CHAIN_BLOCK)
+
+	def test_catch_up_streams_only_gap(self):
+		self.local.blockchain.chain = list(self.remote.blockchain.chain[:21])
+		self.sync()
+		self.assertEqual(hashes(self.local.blockchain), hashes(self.remote.blockchain))
+		self.assertEqual(self.streamed(), 10)
+		self.assertEqual(self.remote.p2p_network.node.sent[-1], MessageType.CHAIN_END)
+		self.assertEqual(self.local.streams, {})
+
+	def test_whole_chain_without_locator(self):
+		to_remote, to_local = connect(self.local, self.remote)
+		self.local.streams[to_remote] = ChainStream(self.local.blockchain)
+		self.remote.send_chain(b"", to_local)
+		self.assertEqual(hashes(self.local.blockchain), hashes(self.remote.blockchain))
+		self.assertEqual(self.streamed(), 31)
+
+	def test_invalid_block_aborts(self):
+		self.local.blockchain.chain = list(self.remote.blockchain.chain[:5])
+		tampered = self.remote.blockchain.chain[12]
+		tampered.transactions = [Transaction(b"Alice", b"Mallory", 0, "forged", timestamp=1.0)]
+		self.sync()
+		self.assertEqual(hashes(self.local.blockchain), hashes(self.remote.blockchain)[:12])
+		self.assertEqual(self.local.streams, {})
+
+	def test_longer_branch_replaces_fork(self):
+		self.local.blockchain.chain = list(self.remote.blockchain.chain[:11])
+		grow(self.local.blockchain, 5, "fork")
+		self.sync()
+		self.assertEqual(hashes(self.local.blockchain), hashes(self.remote.blockchain))
+
+	def test_shorter_branch_ignored(self):
+		self.local.blockchain.chain = list(self.remote.blockchain.chain[:11])
+		grow(self.local.blockchain, 25, "fork")
+		local_hashes = hashes(self.local.blockchain)
+		self.sync()
+		self.assertEqual(hashes(self.local.blockchain), local_hashes)
+
+	def test_unrequested_stream_ignored(self):
+		_, to_local = connect(self.local, self.remote)
+		self.remote.send_chain(b"", to_local)
+		self.assertEqual(len(self.local.blockchain.chain), 1)
+
+
+if __name__ == "__main__":
+	unittest.main()